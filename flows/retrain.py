@@ -0,0 +1,270 @@
+# flows/retrain.py
+"""
+Nightly ingestion flow (prefect.yaml deployment "nightly" -> nightly_retrain).
+
+Refreshes everything the agents search over:
+- documents (docs_glob)  -> ingest_token_chunks: chunk, embed, upsert
+- CSVs (csv_glob)        -> ingest_table: COPY into registered Postgres tables
+- images (images_glob)   -> CLIP embeddings in the tenant's image collection
+
+Every file is its own task:
+- at most `concurrency` tasks do work at a time
+- a failing file is retried `retries` times with exponential backoff
+  (FLOW_RETRY_DELAY, doubled per attempt) without rerunning the others, and
+  a file that still fails is reported instead of failing the whole run
+- unchanged files are skipped via the content-hash cache in flows/tasks.py
+- the run ends with a throughput summary (files, units, cached, failed, per-second rates)
+
+With Prefect installed, nightly_retrain is a Prefect flow and each file is a
+Prefect task run (retries handled by Prefect). Without Prefect, or with
+--local, the same flow runs on a plain thread pool; no Prefect server needed:
+
+    python -m flows.retrain --local --docs "sample_docs/*.md" --csv "sample_data/*.csv"
+"""
+import argparse
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+from flows.tasks import IMAGE_EXTENSIONS, ContentCache, backfill_image, ingest_csv, ingest_document
+
+try:
+    from prefect import flow, task
+    from prefect.cache_policies import NO_CACHE
+    from prefect.context import FlowRunContext
+    from prefect.task_runners import ThreadPoolTaskRunner
+    PREFECT_AVAILABLE = True
+except Exception:
+    PREFECT_AVAILABLE = False
+
+FLOW_CONCURRENCY = int(os.getenv("FLOW_CONCURRENCY", "4"))
+FLOW_MAX_WORKERS = int(os.getenv("FLOW_MAX_WORKERS", "32"))  # Prefect task-runner threads (>= concurrency)
+FLOW_RETRIES = int(os.getenv("FLOW_RETRIES", "2"))
+FLOW_RETRY_DELAY = float(os.getenv("FLOW_RETRY_DELAY", "5"))
+
+UNITS = {"documents": "chunks", "tables": "rows", "images": "images"}
+
+
+@dataclass
+class ItemResult:
+    kind: str
+    item: str
+    ok: bool
+    cached: bool = False
+    units: int = 0
+    attempts: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+class _Work:
+    """Wraps a per-file function: bounds concurrency and counts attempts/time per file."""
+
+    def __init__(self, fn: Callable[[str], dict], concurrency: int):
+        self.fn = fn
+        self.gate = threading.Semaphore(max(1, concurrency))
+        self.attempts = {}
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, item: str) -> dict:
+        with self._lock:
+            self.attempts[item] = self.attempts.get(item, 0) + 1
+        with self.gate:
+            t0 = time.perf_counter()
+            try:
+                return self.fn(item)
+            finally:
+                with self._lock:
+                    self.seconds[item] = self.seconds.get(item, 0.0) + time.perf_counter() - t0
+
+    def result(self, kind: str, item: str, out: Optional[dict], error: Optional[BaseException]) -> ItemResult:
+        return ItemResult(
+            kind=kind, item=item, ok=error is None,
+            cached=bool(out and out.get("cached")), units=(out or {}).get("units", 0),
+            attempts=self.attempts.get(item, 0), seconds=round(self.seconds.get(item, 0.0), 3),
+            error=None if error is None else f"{type(error).__name__}: {error}"
+        )
+
+
+def _backoff(retries: int, delay: float) -> List[float]:
+    return [delay * 2 ** i for i in range(retries)]
+
+
+def _run_local(kind: str, work: _Work, items: List[str], retries: int, delay: float) -> List[ItemResult]:
+    def attempt_all(item):
+        error = None
+        for wait in _backoff(retries, delay) + [None]:
+            try:
+                return work.result(kind, item, work(item), None)
+            except Exception as e:
+                error = e
+                print(f"[{kind}] {item} failed (attempt {work.attempts.get(item)}): {e}")
+                if wait is not None:
+                    time.sleep(wait)
+        return work.result(kind, item, None, error)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(items), FLOW_MAX_WORKERS))) as pool:
+        return list(pool.map(attempt_all, items))
+
+
+def _run_prefect(kind: str, work: _Work, items: List[str], retries: int, delay: float) -> List[ItemResult]:
+    def process(item: str) -> dict:
+        return work(item)
+
+    # skipping unchanged files is done by ContentCache, which also works without Prefect
+    t = task(process, name=kind, retries=retries, retry_delay_seconds=_backoff(retries, delay) or 0,
+             task_run_name=f"{kind}:{{item}}", cache_policy=NO_CACHE)
+    futures = [(item, t.submit(item)) for item in items]
+    results = []
+    for item, fut in futures:
+        fut.wait()
+        if fut.state.is_completed():
+            results.append(work.result(kind, item, fut.result(), None))
+        else:
+            results.append(work.result(kind, item, None, fut.result(raise_on_failure=False)))
+    return results
+
+
+def _fan_out(kind: str, fn: Callable[[str], dict], items: List[str], concurrency: int, retries: int,
+             delay: float) -> List[ItemResult]:
+    if not items:
+        return []
+    work = _Work(fn, concurrency)
+    in_prefect = PREFECT_AVAILABLE and FlowRunContext.get() is not None
+    run = _run_prefect if in_prefect else _run_local
+    return run(kind, work, items, retries, delay)
+
+
+def summarize(results: List[ItemResult], wall_seconds: float) -> dict:
+    summary = {"wall_seconds": round(wall_seconds, 2), "kinds": {}, "failed": []}
+    for kind in UNITS:
+        rows = [r for r in results if r.kind == kind]
+        if not rows:
+            continue
+        done = [r for r in rows if r.ok and not r.cached]
+        busy = sum(r.seconds for r in done)
+        units = sum(r.units for r in done)
+        summary["kinds"][kind] = {
+            "files": len(rows),
+            "processed": len(done),
+            "cached": sum(1 for r in rows if r.ok and r.cached),
+            "failed": sum(1 for r in rows if not r.ok),
+            "retried": sum(1 for r in rows if r.attempts > 1),
+            UNITS[kind]: units,
+            "files_per_sec": round(len(done) / wall_seconds, 2) if wall_seconds else None,
+            f"{UNITS[kind]}_per_sec": round(units / wall_seconds, 1) if wall_seconds else None,
+            "busy_seconds": round(busy, 2),
+        }
+    summary["failed"] = [asdict(r) for r in results if not r.ok]
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"\nnightly_retrain finished in {summary['wall_seconds']}s")
+    print(f"{'kind':<10} {'files':>6} {'done':>6} {'cached':>7} {'failed':>7} {'retried':>8} {'units':>9} {'units/s':>9}")
+    for kind, s in summary["kinds"].items():
+        unit = UNITS[kind]
+        print(f"{kind:<10} {s['files']:>6} {s['processed']:>6} {s['cached']:>7} {s['failed']:>7} "
+              f"{s['retried']:>8} {s[unit]:>9} {s[f'{unit}_per_sec'] or 0:>9}")
+    for r in summary["failed"]:
+        print(f"FAILED {r['kind']} {r['item']} after {r['attempts']} attempts: {r['error']}")
+
+
+def _images(pattern: Optional[str]) -> List[str]:
+    if not pattern:
+        return []
+    return [p for p in sorted(glob.glob(pattern)) if p.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def nightly_retrain(docs_glob: str = "sample_docs/*.md", csv_glob: Optional[str] = "sample_data/*.csv",
+                    images_glob: Optional[str] = None, table_keys: Optional[dict] = None,
+                    tenant: str = "default", backend: Optional[str] = None, use_postgres: bool = True,
+                    concurrency: int = FLOW_CONCURRENCY, retries: int = FLOW_RETRIES,
+                    retry_delay: float = FLOW_RETRY_DELAY, force: bool = False) -> dict:
+    """Ingest documents, tables and images with per-file fan-out. Returns the throughput summary.
+
+    table_keys: {"table_name": ["key", ...]} columns to index per CSV table (table name = file stem).
+    """
+    t0 = time.perf_counter()
+    cache = ContentCache()
+    docs = sorted(glob.glob(docs_glob)) if docs_glob else []
+    csvs = sorted(glob.glob(csv_glob)) if csv_glob and use_postgres else []
+    images = _images(images_glob)
+    table_keys = table_keys or {}
+    print(f"nightly_retrain: {len(docs)} documents, {len(csvs)} CSVs, {len(images)} images "
+          f"(concurrency={concurrency}, retries={retries})")
+
+    if docs:
+        # create the collection and payload indexes once, before the fan-out
+        from services.ingestion.ingest_token_chunks import prepare_store
+        from services.vectorstore.base import get_vector_store
+        from flows.tasks import shared_embed_model
+        model = shared_embed_model()
+        prepare_store(get_vector_store(backend), model.get_sentence_embedding_dimension())
+
+    results = []
+    results += _fan_out(
+        "documents",
+        lambda p: ingest_document(p, cache, backend=backend, use_postgres=use_postgres, force=force),
+        docs, concurrency, retries, retry_delay)
+    results += _fan_out(
+        "tables",
+        lambda p: ingest_csv(p, cache, keys=table_keys.get(os.path.splitext(os.path.basename(p))[0]), force=force),
+        csvs, concurrency, retries, retry_delay)
+    results += _fan_out(
+        "images",
+        lambda p: backfill_image(p, cache, tenant=tenant, backend=backend, force=force),
+        images, concurrency, retries, retry_delay)
+
+    summary = summarize(results, time.perf_counter() - t0)
+    print_summary(summary)
+    return summary
+
+
+if PREFECT_AVAILABLE:
+    nightly_retrain = flow(
+        name="nightly-retrain",
+        task_runner=ThreadPoolTaskRunner(max_workers=FLOW_MAX_WORKERS),
+        log_prints=True
+    )(nightly_retrain)
+
+
+def _parse_keys(specs: List[str]) -> dict:
+    """["features=ID,Label"] -> {"features": ["ID", "Label"]}"""
+    out = {}
+    for spec in specs or []:
+        table, cols = spec.split("=", 1)
+        out[table] = [c.strip() for c in cols.split(",") if c.strip()]
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the nightly ingestion flow")
+    parser.add_argument("--docs", default="sample_docs/*.md")
+    parser.add_argument("--csv", default="sample_data/*.csv")
+    parser.add_argument("--images", default=None)
+    parser.add_argument("--table-keys", nargs="*", default=[], help="table=col1,col2 columns to index")
+    parser.add_argument("--tenant", default="default")
+    parser.add_argument("--backend", choices=["qdrant", "local"], default=None)
+    parser.add_argument("--no-postgres", action="store_true", help="skip Postgres (document metadata and CSVs)")
+    parser.add_argument("--concurrency", type=int, default=FLOW_CONCURRENCY)
+    parser.add_argument("--retries", type=int, default=FLOW_RETRIES)
+    parser.add_argument("--retry-delay", type=float, default=FLOW_RETRY_DELAY)
+    parser.add_argument("--force", action="store_true", help="ignore the content-hash cache")
+    parser.add_argument("--local", action="store_true", help="plain thread pool, even if Prefect is installed")
+    args = parser.parse_args()
+
+    params = dict(
+        docs_glob=args.docs, csv_glob=args.csv, images_glob=args.images,
+        table_keys=_parse_keys(args.table_keys), tenant=args.tenant, backend=args.backend,
+        use_postgres=not args.no_postgres, concurrency=args.concurrency, retries=args.retries,
+        retry_delay=args.retry_delay, force=args.force,
+    )
+    run = nightly_retrain.fn if (args.local and PREFECT_AVAILABLE) else nightly_retrain
+    summary = run(**params)
+    raise SystemExit(1 if summary["failed"] else 0)
@@ -0,0 +1,148 @@
+# flows/tasks.py
+"""
+Per-item units of work for the nightly flow (flows/retrain.py).
+
+Each function handles exactly one document, CSV or image so the flow can fan
+them out and retry them individually. They are idempotent: documents and
+images get stable point IDs (re-running overwrites), and a CSV load replaces
+its table's rows in one transaction instead of appending to them.
+
+ContentCache records the content hash of everything that was processed
+successfully, keyed on the file plus the settings that shape the output
+(embedding model and backend, chunking, collection, table name, output sinks...), so unchanged inputs
+are skipped on the next run. Pass force=True to reprocess anyway.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+FLOW_CACHE_DIR = os.getenv("FLOW_CACHE_DIR", os.path.join(os.getcwd(), "data", "flow_cache"))
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+
+def file_digest(path: str, *settings) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class ContentCache:
+    """JSON manifest {key: {"digest", "units", "at"}}, rewritten atomically on each record."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(FLOW_CACHE_DIR, "manifest.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._entries = {}
+
+    def get(self, key: str, digest: str):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry["digest"] == digest:
+            return entry
+        return None
+
+    def record(self, key: str, digest: str, units: int):
+        with self._lock:
+            self._entries[key] = {"digest": digest, "units": units, "at": time.time()}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+
+
+_embed_model = None
+_embed_lock = threading.Lock()
+_collections_ready = set()
+
+
+def shared_embed_model():
+    """One embedding model per process, shared by all document tasks."""
+    global _embed_model
+    with _embed_lock:
+        if _embed_model is None:
+            from services.ingestion.ingest_token_chunks import load_embed_model
+            _embed_model = load_embed_model()
+        return _embed_model
+
+
+def ingest_document(path: str, cache: ContentCache, backend: str = None, use_postgres: bool = True,
+                    force: bool = False) -> dict:
+    """Chunk, embed and upsert one document. Returns {"cached", "units"} (units = chunks)."""
+    from services.ingestion import ingest_token_chunks as itc
+    from services.vectorstore.base import VECTOR_BACKEND, get_vector_store
+
+    key = f"doc:{os.path.abspath(path)}"
+    model = shared_embed_model()
+    # a --no-postgres run must not make a later run skip the documents/chunks tables
+    sinks = ["vectors", "postgres"] if use_postgres else ["vectors"]
+    digest = file_digest(path, itc.EMBED_MODEL, model.embed_backend, itc.CHUNK_TOKENS, itc.CHUNK_OVERLAP,
+                         itc.COLLECTION_NAME, backend or VECTOR_BACKEND, itc.INGEST_TENANT, itc.INGEST_TAGS,
+                         sinks)
+    hit = None if force else cache.get(key, digest)
+    if hit is not None:
+        return {"cached": True, "units": hit["units"]}
+
+    conn = itc.connect_postgres() if use_postgres else None
+    try:
+        chunks = itc.ingest_file(path, model, get_vector_store(backend), conn)
+    finally:
+        if conn is not None:
+            conn.close()
+    cache.record(key, digest, chunks)
+    return {"cached": False, "units": chunks}
+
+
+def ingest_csv(path: str, cache: ContentCache, table: str = None, keys=None, force: bool = False) -> dict:
+    """Stream one CSV into its Postgres table. Returns {"cached", "units"} (units = rows)."""
+    from services.ingestion.ingest_table import ingest_csv_to_table
+
+    table = table or os.path.splitext(os.path.basename(path))[0]
+    key = f"csv:{os.path.abspath(path)}"
+    digest = file_digest(path, table, sorted(keys or []))
+    hit = None if force else cache.get(key, digest)
+    if hit is not None:
+        return {"cached": True, "units": hit["units"]}
+
+    res = ingest_csv_to_table(path, table, key_columns=keys, replace=True)
+    cache.record(key, digest, res["rows"])
+    return {"cached": False, "units": res["rows"]}
+
+
+def backfill_image(path: str, cache: ContentCache, tenant: str = "default", backend: str = None,
+                   force: bool = False) -> dict:
+    """CLIP-embed one image into the tenant's image collection (same one /embed_image uses)."""
+    from services.vision.clip_embed import embed_image
+    from services.vectorstore.base import VECTOR_BACKEND, get_vector_store
+
+    coll = f"user_{tenant}"
+    key = f"image:{os.path.abspath(path)}"
+    digest = file_digest(path, coll, backend or VECTOR_BACKEND)
+    hit = None if force else cache.get(key, digest)
+    if hit is not None:
+        return {"cached": True, "units": hit["units"]}
+
+    vec = embed_image(path)
+    store = get_vector_store(backend)
+    with _embed_lock:
+        # create the collection once, not from every parallel task
+        if (backend, coll) not in _collections_ready:
+            store.ensure_collection(coll, len(vec))
+            _collections_ready.add((backend, coll))
+    store.upsert(coll, [{
+        "id": str(uuid.uuid5(uuid.NAMESPACE_URL, os.path.abspath(path))),
+        "vector": vec,
+        "payload": {"path": os.path.abspath(path), "source": os.path.basename(path)}
+    }])
+    cache.record(key, digest, 1)
+    return {"cached": False, "units": 1}
@@ -17,7 +17,8 @@ resource "aws_ecs_task_definition" "ingestion" {
 
       command = [
         "python",
-        "services/ingestion/ingest_token_chunks.py"
+        "-m",
+        "services.ingestion.ingest_token_chunks"
       ]
 
       environment = [
@@ -139,6 +139,14 @@ resource "aws_security_group" "ecs_task_sg" {
   self        = true
   }
 
+  ingress {
+  description = "Allow ECS tasks to use Qdrant gRPC"
+  from_port   = 6334
+  to_port     = 6334
+  protocol    = "tcp"
+  self        = true
+  }
+
   egress {
     from_port   = 0
     to_port     = 0
@@ -250,8 +258,9 @@ resource "aws_lb_target_group" "tg" {
   vpc_id      = aws_vpc.agentdesk_vpc.id
   target_type = "ip" # for awsvpc Fargate tasks we use IP target type
 
+  # /ready only returns 200 once models are loaded and warm
   health_check {
-    path                = "/ping"
+    path                = "/ready"
     protocol            = "HTTP"
     matcher             = "200-399"
     healthy_threshold   = 2
@@ -288,6 +297,17 @@ resource "aws_ecs_task_definition" "task" {
   execution_role_arn       = aws_iam_role.ecs_task_execution_role.arn
   task_role_arn = aws_iam_role.ecs_task_role.arn
 
+  volume {
+    name = "ticket-spool"
+    efs_volume_configuration {
+      file_system_id     = aws_efs_file_system.ticket_spool.id
+      transit_encryption = "ENABLED"
+      authorization_config {
+        access_point_id = aws_efs_access_point.ticket_spool.id
+      }
+    }
+  }
+
   container_definitions = jsonencode([
     ###############################
     # 1) Main FastAPI container
@@ -315,8 +335,23 @@ resource "aws_ecs_task_definition" "task" {
 
         # Local Qdrant + Redis
         { name = "QDRANT_URL", value = "http://qdrant.agentdesk.local:6333" },
+        { name = "QDRANT_PREFER_GRPC", value = "1" },
         { name = "REDIS_HOST", value = "127.0.0.1" },
-        { name = "REDIS_PORT", value = "6379" }
+        { name = "REDIS_PORT", value = "6379" },
+
+        # the ALB lives in the VPC: trust its X-Forwarded-For so rate limits see client addresses
+        { name = "FORWARDED_ALLOW_IPS", value = aws_vpc.agentdesk_vpc.cidr_block },
+
+        # ticket journal on EFS (infra/ticket_spool.tf) so queued tickets survive task replacement
+        { name = "TICKET_SPOOL_DIR", value = "/app/data/ticket_spool" }
+      ]
+
+      mountPoints = [
+        {
+          sourceVolume  = "ticket-spool"
+          containerPath = "/app/data/ticket_spool"
+          readOnly      = false
+        }
       ]
 
       logConfiguration = {
@@ -375,7 +410,7 @@ resource "aws_ecs_service" "service" {
     container_port   = var.container_port
   }
 
-  depends_on = [aws_lb_listener.listener]
+  depends_on = [aws_lb_listener.listener, aws_efs_mount_target.ticket_spool_a, aws_efs_mount_target.ticket_spool_b]
 
   service_registries {
   registry_arn = aws_service_discovery_service.api.arn
@@ -17,6 +17,10 @@ resource "aws_ecs_task_definition" "qdrant" {
       {
         containerPort = 6333
         protocol      = "tcp"
+      },
+      {
+        containerPort = 6334
+        protocol      = "tcp"
       }
     ]
 
@@ -0,0 +1,61 @@
+########################################
+# EFS volume for the ticket journal (TICKET_SPOOL_DIR)
+#
+# Tickets are acknowledged once they are fsync()ed to the journal, before they
+# reach Postgres. Fargate task storage disappears with the task, so the journal
+# lives on EFS: a replacement task replays whatever its predecessor had not
+# flushed yet (segments are flock()ed, so live tasks never replay each other's).
+########################################
+resource "aws_efs_file_system" "ticket_spool" {
+  creation_token = "agentdesk-ticket-spool-${random_id.suffix.hex}"
+  encrypted      = true
+
+  tags = {
+    Name = "agentdesk-ticket-spool"
+  }
+}
+
+resource "aws_security_group" "efs_sg" {
+  name        = "agentdesk-efs-sg-${random_id.suffix.hex}"
+  description = "Allow NFS from ECS tasks"
+  vpc_id      = aws_vpc.agentdesk_vpc.id
+
+  ingress {
+    from_port       = 2049
+    to_port         = 2049
+    protocol        = "tcp"
+    security_groups = [aws_security_group.ecs_task_sg.id]
+  }
+
+  egress {
+    from_port   = 0
+    to_port     = 0
+    protocol    = "-1"
+    cidr_blocks = ["0.0.0.0/0"]
+  }
+}
+
+resource "aws_efs_mount_target" "ticket_spool_a" {
+  file_system_id  = aws_efs_file_system.ticket_spool.id
+  subnet_id       = aws_subnet.agentdesk_subnet.id
+  security_groups = [aws_security_group.efs_sg.id]
+}
+
+resource "aws_efs_mount_target" "ticket_spool_b" {
+  file_system_id  = aws_efs_file_system.ticket_spool.id
+  subnet_id       = aws_subnet.agentdesk_subnet_b.id
+  security_groups = [aws_security_group.efs_sg.id]
+}
+
+resource "aws_efs_access_point" "ticket_spool" {
+  file_system_id = aws_efs_file_system.ticket_spool.id
+
+  root_directory {
+    path = "/ticket_spool"
+    creation_info {
+      owner_uid   = 0
+      owner_gid   = 0
+      permissions = "0750"
+    }
+  }
+}
@@ -0,0 +1,132 @@
+# scripts/bench_doc_ingest.py
+"""
+Benchmark peak memory of document ingestion on a large generated document.
+
+sample_docs/*.md are repeated (with PII sprinkled in) into a --mb sized file,
+then each mode runs in its own subprocess so peak RSS is measured in isolation:
+- stream: readers + redacted_pieces + stream_chunks + FullTextSink
+          (what ingest_file() does since streaming ingestion)
+- legacy: f.read() + redact_pii + chunk_text over the whole string
+          (the previous behavior)
+
+Only reading, redaction, chunking and full-text spooling are measured; add
+--embed to also embed every chunk with the configured EMBED_BACKEND.
+
+Usage:
+    python -m scripts.bench_doc_ingest --mb 200 --format txt jsonl html
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SAMPLE_DOCS = os.path.join(os.path.dirname(__file__), "..", "sample_docs", "*.md")
+PII = " Contact jane.roe@example.com or 555-010-4477 for details. "
+
+
+def generate(target_mb: int, fmt: str, out_path: str):
+    paragraphs = []
+    for path in sorted(glob.glob(SAMPLE_DOCS)):
+        with open(path, encoding="utf-8") as f:
+            paragraphs += [p for p in f.read().split("\n\n") if p.strip()]
+    target = target_mb * 1_000_000
+    written = 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        if fmt == "html":
+            f.write("<html><head><title>export</title><style>p{margin:0}</style></head><body>\n")
+        i = 0
+        while written < target:
+            text = paragraphs[i % len(paragraphs)] + (PII if i % 7 == 0 else "")
+            if fmt == "jsonl":
+                line = json.dumps({"id": i, "subject": f"ticket {i}", "body": text}) + "\n"
+            elif fmt == "html":
+                line = f"<div><h2>Ticket {i}</h2><p>{text}</p></div>\n"
+            else:
+                line = text + "\n\n"
+            f.write(line)
+            written += len(line)
+            i += 1
+        if fmt == "html":
+            f.write("</body></html>\n")
+
+
+def run_child(mode: str, path: str, embed: bool):
+    import resource
+    from services.ingestion import ingest_token_chunks as itc
+    from services.ingestion.readers import read_pieces
+
+    model = itc.load_embed_model() if embed else None
+    t0 = time.perf_counter()
+    chunks = 0
+    batch = []
+    if mode == "stream":
+        sink = itc.FullTextSink()
+
+        def pieces():
+            for piece in itc.redacted_pieces(read_pieces(path)):
+                sink.write(piece)
+                yield piece
+
+        for body, _, _, _ in itc.stream_chunks(pieces()):
+            chunks += 1
+            if model is not None:
+                batch.append(body)
+                if len(batch) >= itc.UPSERT_BATCH:
+                    model.encode(batch, batch_size=itc.EMBED_BATCH_SIZE)
+                    batch = []
+        sink.close()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            text = itc.redact_pii(f.read().strip())
+        for body, _ in itc.chunk_text(text):
+            chunks += 1
+            if model is not None:
+                batch.append(body)
+                if len(batch) >= itc.UPSERT_BATCH:
+                    model.encode(batch, batch_size=itc.EMBED_BATCH_SIZE)
+                    batch = []
+    if model is not None and batch:
+        model.encode(batch, batch_size=itc.EMBED_BATCH_SIZE)
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kB on Linux
+    print(json.dumps({"mode": mode, "chunks": chunks, "seconds": elapsed, "peak_rss_mb": peak_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=200)
+    parser.add_argument("--format", nargs="+", choices=["txt", "jsonl", "html"], default=["txt"])
+    parser.add_argument("--modes", nargs="+", default=["stream", "legacy"])
+    parser.add_argument("--embed", action="store_true", help="also embed every chunk (slow)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.path, args.embed)
+        return
+
+    tmp = tempfile.mkdtemp(prefix="agentdesk-doc-bench-")
+    print(f"{'format':<6} {'mode':<8} {'MB':>6} {'chunks':>9} {'seconds':>9} {'MB/s':>7} {'peak RSS MB':>12}")
+    for fmt in args.format:
+        path = os.path.join(tmp, f"export.{fmt}")
+        generate(args.mb, fmt, path)
+        size_mb = os.path.getsize(path) / 1e6
+        for mode in args.modes:
+            if mode == "legacy" and fmt != "txt":
+                continue  # the old path only read plain text
+            cmd = [sys.executable, "-m", "scripts.bench_doc_ingest", "--child", mode, "--path", path]
+            out = subprocess.run(cmd + (["--embed"] if args.embed else []),
+                                 check=True, capture_output=True, text=True)
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{fmt:<6} {mode:<8} {size_mb:>6.0f} {r['chunks']:>9} {r['seconds']:>9.1f} "
+                  f"{size_mb / r['seconds']:>7.1f} {r['peak_rss_mb']:>12.0f}")
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
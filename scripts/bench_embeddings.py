@@ -0,0 +1,105 @@
+# scripts/bench_embeddings.py
+"""
+Embedding throughput per backend and thread count, normalized per CPU core.
+
+For each backend (services/embeddings/backends.py) and --threads value:
+- chunks:  encode --n chunk texts (production chunking of --docs) with
+           --batch-size, as ingestion does; reports embeddings/s, embeddings/s
+           per thread, and embeddings per CPU-second (process CPU time, so
+           idle or oversubscribed threads don't flatter the number)
+- queries: encode the labeled queries one at a time, as /retrieve does;
+           reports p50/p95 latency
+
+Backends are loaded without the guardrail check; this measures speed only,
+services/embeddings/guardrail.py decides whether a backend may be enabled.
+
+Usage:
+    python -m scripts.bench_embeddings --backends torch torch-int8 onnx onnx-int8 --threads 1 2 --json emb.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+from services.embeddings.backends import BACKENDS, EMBED_MODEL, load_embedder
+from services.embeddings.guardrail import reference_set
+
+
+def _set_torch_threads(threads: int):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+
+
+def bench(backend: str, threads: int, texts: list, queries: list, batch_size: int, model_name: str) -> dict:
+    _set_torch_threads(threads)
+    model = load_embedder(backend, model_name, verify=False, threads=threads)
+    model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    model.encode(texts, batch_size=batch_size)
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        model.encode(q)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+
+    per_sec = len(texts) / wall
+    return {
+        "backend": backend,
+        "threads": threads,
+        "texts": len(texts),
+        "batch_size": batch_size,
+        "embeddings_per_sec": round(per_sec, 1),
+        "embeddings_per_sec_per_thread": round(per_sec / threads, 1),
+        "embeddings_per_cpu_second": round(len(texts) / cpu, 1) if cpu else None,
+        "query_p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "query_p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embeddings/sec per core for each embedding backend")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--n", type=int, default=512, help="chunk texts to embed per run")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--docs", default="sample_docs/*.md")
+    parser.add_argument("--labels", default="sample_data/retrieval_eval.jsonl")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    chunks, _, queries, _ = reference_set(args.docs, args.labels)
+    texts = (chunks * (args.n // max(1, len(chunks)) + 1))[:args.n]
+    queries = queries or chunks[:16]
+
+    results = []
+    for backend in args.backends:
+        for threads in args.threads:
+            try:
+                results.append(bench(backend, threads, texts, queries, args.batch_size, args.model))
+            except Exception as e:
+                print(f"{backend} x{threads}: skipped ({type(e).__name__}: {e})")
+
+    base = {r["threads"]: r["embeddings_per_sec"] for r in results if r["backend"] == "torch"}
+    print(f"\n{'backend':<11} {'thr':>3} {'emb/s':>8} {'emb/s/thr':>10} {'emb/cpu-s':>10} "
+          f"{'vs torch':>8} {'q p50 ms':>9} {'q p95 ms':>9}")
+    for r in results:
+        speedup = f"{r['embeddings_per_sec'] / base[r['threads']]:.2f}x" if r["threads"] in base else "-"
+        print(f"{r['backend']:<11} {r['threads']:>3} {r['embeddings_per_sec']:>8} "
+              f"{r['embeddings_per_sec_per_thread']:>10} {r['embeddings_per_cpu_second'] or '-':>10} "
+              f"{speedup:>8} {r['query_p50_ms']:>9} {r['query_p95_ms']:>9}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
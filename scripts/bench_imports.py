@@ -0,0 +1,119 @@
+# scripts/bench_imports.py
+"""
+Track import/startup cost of the API and tools with `python -X importtime`.
+
+Each profile imports one module in a fresh interpreter (with its own feature
+flags) --repeat times and reports:
+- wall time of the whole interpreter run (best of N)
+- cumulative import time of the target module (from -X importtime)
+- the heaviest top-level packages it pulled in
+- which known-heavy ML packages were imported at all
+
+Profiles:
+- api-full:    services.api.main with every subsystem enabled
+- api-tools:   services.api.main with only the tools subsystem (ENABLE_*=0 for the rest)
+- ticket-tool: services.tools.ticket_tool
+- table-tool:  services.tools.table_tool
+
+--max-seconds fails (exit 1) when a profile's best wall time exceeds the
+budget, e.g. in CI:
+    python -m scripts.bench_imports --profiles api-tools ticket-tool --max-seconds 1.0
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+TOOLS_ONLY = {"ENABLE_RETRIEVAL": "0", "ENABLE_AGENTS": "0", "ENABLE_VISION": "0",
+              "ENABLE_OCR": "0", "ENABLE_OTEL": "0"}
+
+PROFILES = {
+    "api-full": ("services.api.main", {}),
+    "api-tools": ("services.api.main", TOOLS_ONLY),
+    "ticket-tool": ("services.tools.ticket_tool", {}),
+    "table-tool": ("services.tools.table_tool", {}),
+}
+
+HEAVY = ("torch", "sentence_transformers", "transformers", "onnxruntime", "clip", "pytesseract", "tiktoken",
+         "opentelemetry", "qdrant_client", "pandas", "numpy")
+
+
+def parse_importtime(stderr: str):
+    """-X importtime lines -> [(module, self_us, cumulative_us, depth)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cum_us, name = line[len("import time:"):].split("|")
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cum_us), depth))
+    return rows
+
+
+def run_once(module: str, env_overrides: dict):
+    env = dict(os.environ, **env_overrides)
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ""
+        raise RuntimeError(f"import {module} failed: {tail}")
+    return wall, parse_importtime(proc.stderr)
+
+
+def profile(name: str, repeat: int, top: int) -> dict:
+    module, env_overrides = PROFILES[name]
+    runs = [run_once(module, env_overrides) for _ in range(repeat)]
+    wall, rows = min(runs, key=lambda r: r[0])
+    target = next((cum for mod, _, cum, depth in rows if mod == module and depth == 0), None)
+    top_level = sorted(((mod, cum) for mod, _, cum, depth in rows if depth == 0),
+                       key=lambda r: r[1], reverse=True)
+    imported = {mod.split(".")[0] for mod, _, _, _ in rows}
+    return {
+        "profile": name,
+        "module": module,
+        "env": env_overrides,
+        "wall_seconds": round(wall, 3),
+        "import_seconds": round(target / 1e6, 3) if target is not None else None,
+        "heavy_imported": [h for h in HEAVY if h in imported],
+        "top": [{"module": m, "seconds": round(c / 1e6, 3)} for m, c in top_level[:top]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark (python -X importtime)")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=list(PROFILES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail if any profile's wall time exceeds this")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = [profile(name, args.repeat, args.top) for name in args.profiles]
+    for r in results:
+        print(f"\n{r['profile']}: import {r['module']}  wall {r['wall_seconds']:.3f}s  "
+              f"import {r['import_seconds']}s")
+        print(f"  heavy packages imported: {', '.join(r['heavy_imported']) or 'none'}")
+        for t in r["top"]:
+            print(f"  {t['seconds']:>7.3f}s  {t['module']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_seconds is not None:
+        slow = [r for r in results if r["wall_seconds"] > args.max_seconds]
+        for r in slow:
+            print(f"\nOVER BUDGET: {r['profile']} took {r['wall_seconds']:.3f}s > {args.max_seconds}s")
+        if slow:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
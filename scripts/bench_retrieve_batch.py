@@ -0,0 +1,79 @@
+# scripts/bench_retrieve_batch.py
+"""
+Compare N sequential /retrieve calls against one /retrieve_batch call.
+
+Usage:
+    python scripts/bench_retrieve_batch.py --n 32 --rounds 5
+Requires a running API (API_URL, default http://localhost:8000).
+"""
+import argparse
+import os
+import statistics
+import time
+
+import requests
+
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+
+QUERIES = [
+    "What is the refund policy?",
+    "How do I reset my password?",
+    "How do I clean the product?",
+    "How long do refunds take to process?",
+    "What does the planner agent do?",
+    "How do I connect the device to Wi-Fi?",
+    "What is machine learning?",
+    "How is PII redacted during ingestion?",
+]
+
+
+def make_queries(n: int):
+    return [QUERIES[i % len(QUERIES)] for i in range(n)]
+
+
+def run_sequential(session, queries, top_k):
+    t0 = time.perf_counter()
+    for q in queries:
+        r = session.post(f"{API_URL}/retrieve", json={"q": q, "top_k": top_k}, timeout=60)
+        r.raise_for_status()
+    return time.perf_counter() - t0
+
+
+def run_batch(session, queries, top_k):
+    t0 = time.perf_counter()
+    body = {"queries": [{"q": q, "top_k": top_k} for q in queries]}
+    r = session.post(f"{API_URL}/retrieve_batch", json=body, timeout=120)
+    r.raise_for_status()
+    assert len(r.json()["results"]) == len(queries)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=32, help="queries per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = make_queries(args.n)
+    session = requests.Session()
+
+    # warm up both paths so model/JIT setup is not measured
+    run_sequential(session, queries[:2], args.top_k)
+    run_batch(session, queries[:2], args.top_k)
+
+    seq, batch = [], []
+    for _ in range(args.rounds):
+        seq.append(run_sequential(session, queries, args.top_k))
+        batch.append(run_batch(session, queries, args.top_k))
+
+    seq_med = statistics.median(seq)
+    batch_med = statistics.median(batch)
+    print(f"queries per round: {args.n}, rounds: {args.rounds}")
+    print(f"sequential /retrieve : {seq_med * 1000:8.1f} ms/round  {args.n / seq_med:8.1f} q/s")
+    print(f"/retrieve_batch      : {batch_med * 1000:8.1f} ms/round  {args.n / batch_med:8.1f} q/s")
+    print(f"speedup              : {seq_med / batch_med:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# scripts/bench_serving.py
+"""
+Measure per-worker memory and throughput scaling of the pre-fork server
+(services/api/serve.py) for different worker counts.
+
+For each WEB_WORKERS value it starts the server, waits for /ready, reads RSS
+and PSS (proportional set size: shared pages split between the processes
+sharing them) of every worker from /proc, then drives POST /retrieve with a
+thread pool for a fixed duration.
+
+Usage (Linux only, needs Qdrant reachable via QDRANT_URL):
+    python scripts/bench_serving.py --workers 1 2 4 --threads 1 --seconds 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+QUERIES = [
+    "What is the refund policy?",
+    "How do I reset my password?",
+    "How do I connect the device to Wi-Fi?",
+    "What does the planner agent do?",
+]
+
+
+def read_mem_kb(pid: int) -> dict:
+    """RSS and PSS in kB from /proc/<pid>/smaps_rollup."""
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                out[parts[0][:-1].lower()] = int(parts[1])
+    return out
+
+
+def child_pids(pid: int):
+    pids = []
+    task_dir = f"/proc/{pid}/task"
+    for tid in os.listdir(task_dir):
+        with open(f"{task_dir}/{tid}/children") as f:
+            pids.extend(int(p) for p in f.read().split())
+    return pids
+
+
+def wait_ready(url: str, timeout: float = 300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/ready", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    raise TimeoutError("server did not become ready")
+
+
+def drive(url: str, seconds: float, concurrency: int) -> int:
+    stop_at = time.time() + seconds
+
+    def loop(i):
+        session = requests.Session()
+        done = 0
+        while time.time() < stop_at:
+            q = QUERIES[(i + done) % len(QUERIES)]
+            r = session.post(f"{url}/retrieve", json={"q": q, "top_k": 5}, timeout=60)
+            r.raise_for_status()
+            done += 1
+        return done
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sum(pool.map(loop, range(concurrency)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=1, help="TORCH_THREADS per worker")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    url = f"http://127.0.0.1:{args.port}"
+    rows = []
+    for n in args.workers:
+        env = dict(os.environ, WEB_WORKERS=str(n), TORCH_THREADS=str(args.threads),
+                   PORT=str(args.port), LOG_LEVEL="warning")
+        proc = subprocess.Popen([sys.executable, "-m", "services.api.serve"], env=env)
+        try:
+            wait_ready(url)
+            mems = [read_mem_kb(pid) for pid in child_pids(proc.pid)]
+            parent = read_mem_kb(proc.pid)
+            drive(url, 2, n)  # warm the request path
+            total = drive(url, args.seconds, concurrency=n * 4)
+            rps = total / args.seconds
+            rows.append((n, parent, mems, rps))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    base = rows[0][3] if rows else 0
+    print(f"{'workers':>7} {'parent RSS MB':>14} {'worker RSS MB':>14} {'worker PSS MB':>14} {'req/s':>8} {'scaling':>8}")
+    for n, parent, mems, rps in rows:
+        rss = sum(m["rss"] for m in mems) / max(1, len(mems)) / 1024
+        pss = sum(m["pss"] for m in mems) / max(1, len(mems)) / 1024
+        print(f"{n:>7} {parent['rss'] / 1024:>14.0f} {rss:>14.0f} {pss:>14.0f} {rps:>8.1f} {rps / base if base else 0:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
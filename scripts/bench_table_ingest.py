@@ -0,0 +1,92 @@
+# scripts/bench_table_ingest.py
+"""
+Benchmark tabular ingestion on a scaled-up sample_data/example.csv.
+
+The sample is replicated (with fresh IDs) to --rows rows, then each mode runs
+in its own subprocess so peak RSS is measured in isolation:
+- stream: services/ingestion/ingest_table.py (chunked read + COPY)
+- legacy: whole-file pd.read_csv + DataFrame.to_sql (the previous behavior)
+
+Usage (needs Postgres from POSTGRES_* env):
+    python -m scripts.bench_table_ingest --rows 2000000 --chunksize 50000
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "sample_data", "example.csv")
+
+
+def scale_csv(target_rows: int, out_path: str):
+    with open(SAMPLE, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    id_col = header.index("ID")
+    with open(out_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(target_rows):
+            row = list(rows[i % len(rows)])
+            row[id_col] = str(i + 1)
+            writer.writerow(row)
+
+
+def run_child(mode: str, csv_path: str, table: str, chunksize: int):
+    import resource
+    t0 = time.perf_counter()
+    if mode == "stream":
+        from services.ingestion.ingest_table import ingest_csv_to_table
+        res = ingest_csv_to_table(csv_path, table, key_columns=["ID"], chunksize=chunksize)
+        rows = res["rows"]
+    else:
+        import pandas as pd
+        from services.ingestion.ingest_table import engine
+        df = pd.read_csv(csv_path)
+        df["ingested_at"] = pd.Timestamp.now(tz="UTC").tz_localize(None)
+        df.to_sql(table, con=engine, if_exists="append", index=False)
+        rows = len(df)
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kB on Linux
+    print(json.dumps({"mode": mode, "rows": rows, "seconds": elapsed, "peak_rss_mb": peak_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--modes", nargs="+", default=["stream", "legacy"])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    parser.add_argument("--table", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.csv, args.table, args.chunksize)
+        return
+
+    tmp = tempfile.mkdtemp(prefix="agentdesk-table-bench-")
+    csv_path = os.path.join(tmp, "example_scaled.csv")
+    scale_csv(args.rows, csv_path)
+    size_mb = os.path.getsize(csv_path) / 1e6
+    print(f"scaled CSV: {args.rows} rows, {size_mb:.1f} MB")
+
+    print(f"{'mode':<8} {'rows':>10} {'seconds':>9} {'rows/s':>10} {'peak RSS MB':>12}")
+    for mode in args.modes:
+        table = f"bench_{mode}_{int(time.time())}"
+        out = subprocess.run(
+            [sys.executable, "-m", "scripts.bench_table_ingest", "--child", mode, "--csv", csv_path, "--table", table,
+             "--chunksize", str(args.chunksize)],
+            check=True, capture_output=True, text=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{mode:<8} {r['rows']:>10} {r['seconds']:>9.2f} {r['rows'] / r['seconds']:>10.0f} {r['peak_rss_mb']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# scripts/compare_vector_backends.py
+"""
+Compare recall and latency of the vector-store backends on the same corpus.
+
+Backends compared:
+- qdrant (in-process ":memory:" client, or QDRANT_URL with --qdrant-url)
+- local float32 brute force
+- local int8 brute force
+- local float32 + IVF (--nlist partitions, --nprobe probed)
+
+Ground truth is exact cosine top-k computed with NumPy, so recall@k measures
+what each backend loses to approximation (HNSW, quantization, IVF probing).
+
+Corpus: synthetic normalized vectors by default (--n, --dim), or real chunk
+embeddings of a document glob with --docs "sample_docs/*.md".
+
+Usage:
+    python -m scripts.compare_vector_backends --n 50000 --queries 200 --k 10
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from services.vectorstore.local_store import LocalStore
+from services.vectorstore.qdrant_store import QdrantStore
+
+COLLECTION = "compare_backends"
+
+
+def synthetic_corpus(n: int, dim: int, n_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # clustered data is closer to real embeddings than isotropic noise
+    centers = rng.normal(size=(max(8, n // 500), dim))
+    data = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, dim))
+    data = (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+    queries = data[rng.choice(n, n_queries, replace=False)] + 0.1 * rng.normal(size=(n_queries, dim))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    return data, queries
+
+
+def document_corpus(pattern: str, n_queries: int):
+    import glob
+    from sentence_transformers import SentenceTransformer
+    from services.ingestion.ingest_token_chunks import chunk_text, EMBED_MODEL
+    model = SentenceTransformer(EMBED_MODEL)
+    texts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            texts.extend(body for body, _ in chunk_text(f.read()))
+    data = np.asarray(model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+    queries = data[:n_queries]
+    return data, queries
+
+
+def exact_topk(data, queries, k):
+    scores = queries @ data.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def load(store, data, batch: int = 1000):
+    store.ensure_collection(COLLECTION, data.shape[1], recreate=True)
+    ids = [str(uuid.UUID(int=i)) for i in range(len(data))]
+    for start in range(0, len(data), batch):
+        store.upsert(COLLECTION, [
+            {"id": ids[i], "vector": data[i], "payload": {"row": i}}
+            for i in range(start, min(start + batch, len(data)))
+        ])
+
+
+def measure(store, queries, truth, k):
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        hits = store.search(COLLECTION, q, limit=k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        got = {h.payload["row"] for h in hits}
+        recalls.append(len(got & expected) / len(expected))
+    latencies.sort()
+    return {
+        "recall": statistics.mean(recalls),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=128)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--docs", help="embed chunks of these files instead of synthetic vectors")
+    parser.add_argument("--qdrant-url", default=":memory:")
+    args = parser.parse_args()
+
+    if args.docs:
+        data, queries = document_corpus(args.docs, args.queries)
+    else:
+        data, queries = synthetic_corpus(args.n, args.dim, args.queries)
+    truth = exact_topk(data, queries, args.k)
+    print(f"corpus: {len(data)} x {data.shape[1]}, queries: {len(queries)}, k={args.k}")
+
+    rows = []
+    tmp = tempfile.mkdtemp(prefix="agentdesk-compare-")
+
+    qdrant = QdrantStore(url=args.qdrant_url)
+    t0 = time.perf_counter()
+    load(qdrant, data)
+    rows.append(("qdrant", time.perf_counter() - t0, measure(qdrant, queries, truth, args.k)))
+
+    for dtype in ("float32", "int8"):
+        local = LocalStore(root=f"{tmp}/{dtype}", dtype=dtype)
+        t0 = time.perf_counter()
+        load(local, data)
+        rows.append((f"local {dtype}", time.perf_counter() - t0, measure(local, queries, truth, args.k)))
+
+    if len(data) >= args.nlist:
+        ivf = LocalStore(root=f"{tmp}/ivf", dtype="float32", nprobe=args.nprobe)
+        t0 = time.perf_counter()
+        load(ivf, data)
+        ivf.build_ivf(COLLECTION, args.nlist)
+        label = f"local ivf{args.nlist}/p{args.nprobe}"
+        rows.append((label, time.perf_counter() - t0, measure(ivf, queries, truth, args.k)))
+
+    print(f"{'backend':<22} {'load s':>8} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, load_s, m in rows:
+        print(f"{name:<22} {load_s:>8.2f} {m['recall']:>9.3f} {m['p50_ms']:>8.2f} {m['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
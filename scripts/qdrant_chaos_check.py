@@ -0,0 +1,101 @@
+# scripts/qdrant_chaos_check.py
+"""
+Exercise the resilient Qdrant layer against a fake flaky server.
+
+Two in-process ":memory:" Qdrant clients act as replicas. FlakyClient wraps
+each one and fails calls with a configurable error rate, plus a full outage
+window in the middle of the run. The script then reports how many searches
+succeeded directly, were answered from the degraded-mode cache, or failed,
+and the breaker state of each replica over time.
+
+Usage:
+    python -m scripts.qdrant_chaos_check --searches 400 --error-rate 0.2
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from services.vectorstore.base import StoreUnavailable
+from services.vectorstore.qdrant_pool import ResilientQdrant
+from services.vectorstore.qdrant_store import QdrantStore
+
+COLLECTION = "chaos"
+
+
+class FlakyClient:
+    """Delegates to a real client but raises ConnectionError at random or while `down`."""
+
+    def __init__(self, inner: QdrantClient, error_rate: float, seed: int):
+        self.inner = inner
+        self.error_rate = error_rate
+        self.down = False
+        self.rng = random.Random(seed)
+
+    def __getattr__(self, name):
+        target = getattr(self.inner, name)
+        if not callable(target):
+            return target
+
+        def call(*args, **kwargs):
+            if self.down or self.rng.random() < self.error_rate:
+                raise ConnectionError(f"injected failure in {name}")
+            return target(*args, **kwargs)
+        return call
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--searches", type=int, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--distinct-queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(args.points, 64)).astype(np.float32)
+    queries = rng.normal(size=(args.distinct_queries, 64)).astype(np.float32)
+
+    # load identical data into both replicas
+    flaky = []
+    for i in range(2):
+        inner = QdrantClient(":memory:")
+        QdrantStore(client=inner).ensure_collection(COLLECTION, 64)
+        QdrantStore(client=inner).upsert(COLLECTION, [
+            {"id": j, "vector": data[j], "payload": {"j": j}} for j in range(args.points)
+        ])
+        flaky.append(FlakyClient(inner, args.error_rate, seed=i))
+
+    clients = iter(flaky)
+    pool = ResilientQdrant(["replica-a", "replica-b"], client_factory=lambda _: next(clients),
+                           retries=2, deadline=2.0, backoff_base=0.001, backoff_max=0.01,
+                           breaker_failures=3, breaker_reset=0.2, health_interval=0)
+    store = QdrantStore(pool=pool)
+
+    counts = {"ok": 0, "degraded": 0, "failed": 0}
+    outage = range(args.searches // 2, args.searches // 2 + args.searches // 5)
+    t0 = time.perf_counter()
+    for n in range(args.searches):
+        for c in flaky:
+            c.down = n in outage
+        before = store.cache.get(store.cache.key(COLLECTION, queries[n % len(queries)].tolist(), 5, None))
+        try:
+            hits = store.search(COLLECTION, queries[n % len(queries)], limit=5)
+            outcome = "degraded" if n in outage and hits is before else "ok"
+            counts[outcome] += 1
+        except StoreUnavailable:
+            counts["failed"] += 1
+        if n % (args.searches // 8 or 1) == 0:
+            print(f"search {n:4d} outage={n in outage!s:5} replicas={pool.status()}")
+    elapsed = time.perf_counter() - t0
+
+    print(f"\n{args.searches} searches in {elapsed:.2f}s, error rate {args.error_rate:.0%}, "
+          f"outage for searches {outage.start}-{outage.stop - 1}")
+    for k, v in counts.items():
+        print(f"  {k:<9} {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,13 @@ class AgentOrchestrator:
     def __init__(self):
         self.planner = PlannerAgent()
 
-    def run(self, query: str, top_k: int = 5):
+    def run(self, query: str, top_k: int = 5, filters: dict = None, answer=None):
+        """
+        `answer(query, top_k, filters)` produces the RAG answer (default answer_query);
+        the API passes a coalescing wrapper. Only this read-only path is ever shared
+        between requests: tool intents (ticket creation) run once per request.
+        """
+        answer = answer or answer_query
 
         # 1) Decide intent
         decision = self.planner.run({"query": query})
@@ -32,7 +38,7 @@ class AgentOrchestrator:
 
         # 3) Knowledge Agent (RAG)
         expanded_query = f"{query} related to machine learning and artificial intelligence"
-        rag_result = answer_query(expanded_query, top_k)
+        rag_result = answer(expanded_query, top_k, filters=filters)
 
 
         return {
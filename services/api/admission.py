@@ -0,0 +1,418 @@
+# services/api/admission.py
+"""
+Admission control in front of the API routers: concurrency limits, priority
+queueing, queue-time load shedding and per-tenant rate limits.
+
+Every routed request belongs to an endpoint class (ROUTE_CLASSES):
+
+    class      priority  endpoints
+    retrieval  0 (first) /retrieve, /retrieve_batch, /search_images
+    tools      1         /execute_tool, /tickets/{id}
+    agents     2         /query (LLM calls)
+    ingest     3 (last)  /embed_image, /ingest_image
+
+- Each class has its own concurrency limit, and all classes share
+  ADMISSION_GLOBAL_LIMIT slots. When slots free up, waiting requests are
+  admitted highest priority first (FIFO within a class), so a burst of
+  /query or image uploads queues behind /retrieve instead of starving it.
+- A request waits at most its class's max queue time and is then shed with
+  503 + Retry-After. Once a class's recent queue wait (EWMA) is already over
+  that budget, new arrivals are shed immediately instead of queueing only to
+  time out; a full queue (ADMISSION_MAX_QUEUE) sheds as well.
+- Per-tenant token buckets (per class) reject with 429 + Retry-After. The
+  bucket key is the client address (the real one behind the load balancer:
+  services/api/serve.py applies X-Forwarded-For from FORWARDED_ALLOW_IPS).
+  X-Tenant / the `tenant` query parameter are client-chosen, so a caller
+  could dodge its quota by rotating them; they are only used with
+  RATE_LIMIT_TRUST_TENANT=1, when an authenticated upstream (gateway, auth
+  proxy) sets or overwrites them. RATE_LIMIT_BACKEND=redis keeps the buckets in Redis
+  (REDIS_HOST/REDIS_PORT) so they are shared by all workers and tasks; the
+  default in-process buckets are per worker. If Redis is unreachable the
+  limiter fails open.
+
+Limits are per worker process. Per-class settings are "class=value" lists:
+
+    ADMISSION_LIMITS="retrieval=16,tools=8,agents=4,ingest=2"
+    ADMISSION_MAX_WAIT="retrieval=0.5,tools=1,agents=5,ingest=2"     # seconds
+    ADMISSION_RATES="retrieval=20:40,tools=5:10,agents=2:5,ingest=1:5"  # tokens/s:burst, 0 = off
+
+Metrics: agentdesk_admission_queue_depth, _inflight, _wait_seconds and
+_rejections_total{class, reason}; alerts.yml pairs them with HighLatency.
+
+The middleware runs on the event loop, so the queue state needs no locks.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+    _queue_depth = Gauge("agentdesk_admission_queue_depth", "Requests waiting for admission",
+                         ["endpoint_class"], multiprocess_mode="livesum")
+    _inflight = Gauge("agentdesk_admission_inflight", "Admitted requests currently running",
+                      ["endpoint_class"], multiprocess_mode="livesum")
+    _wait = Histogram("agentdesk_admission_wait_seconds", "Time spent queued before admission",
+                      ["endpoint_class"],
+                      buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+    _rejections = Counter("agentdesk_admission_rejections_total", "Requests rejected by admission control",
+                          ["endpoint_class", "reason"])
+except Exception:
+    _queue_depth = _inflight = _wait = _rejections = None
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1").lower() in ("1", "true", "yes")
+ADMISSION_GLOBAL_LIMIT = int(os.getenv("ADMISSION_GLOBAL_LIMIT", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+ADMISSION_EWMA_ALPHA = float(os.getenv("ADMISSION_EWMA_ALPHA", "0.2"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+RATE_LIMIT_TRUST_TENANT = os.getenv("RATE_LIMIT_TRUST_TENANT", "0").lower() in ("1", "true", "yes")
+
+# exact paths, or prefixes when they end with "/"
+ROUTE_CLASSES = {
+    "/retrieve": "retrieval",
+    "/retrieve_batch": "retrieval",
+    "/search_images": "retrieval",
+    "/execute_tool": "tools",
+    "/tickets/": "tools",
+    "/query": "agents",
+    "/embed_image": "ingest",
+    "/ingest_image": "ingest",
+}
+
+# class: (priority, concurrency limit, max queue seconds, tokens/s, burst)
+DEFAULT_CLASSES = {
+    "retrieval": (0, 16, 0.5, 20.0, 40),
+    "tools": (1, 8, 1.0, 5.0, 10),
+    "agents": (2, 4, 5.0, 2.0, 5),
+    "ingest": (3, 2, 2.0, 1.0, 5),
+}
+
+
+class Rejected(Exception):
+    """Request refused by admission control; becomes a 429/503 with Retry-After."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+@dataclass
+class EndpointClass:
+    name: str
+    priority: int
+    limit: int
+    max_wait: float
+    rate: float
+    burst: int
+    active: int = 0
+    ewma_wait: float = 0.0
+    queue: Deque[Tuple[float, asyncio.Future]] = field(default_factory=deque)
+
+
+def _parse_spec(raw: Optional[str]) -> Dict[str, str]:
+    """"retrieval=16, agents=4" -> {"retrieval": "16", "agents": "4"}"""
+    out = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            out[name.strip()] = value.strip()
+    return out
+
+
+def load_classes() -> Dict[str, EndpointClass]:
+    limits = _parse_spec(os.getenv("ADMISSION_LIMITS"))
+    waits = _parse_spec(os.getenv("ADMISSION_MAX_WAIT"))
+    rates = _parse_spec(os.getenv("ADMISSION_RATES"))
+    classes = {}
+    for name, (priority, limit, max_wait, rate, burst) in DEFAULT_CLASSES.items():
+        if name in rates:
+            rate_s, _, burst_s = rates[name].partition(":")
+            rate = float(rate_s)
+            burst = int(burst_s) if burst_s else max(1, math.ceil(rate))
+        classes[name] = EndpointClass(
+            name=name, priority=priority,
+            limit=int(limits.get(name, limit)),
+            max_wait=float(waits.get(name, max_wait)),
+            rate=rate, burst=burst,
+        )
+    return classes
+
+
+def classify(path: str) -> Optional[str]:
+    """Endpoint class for a request path (None = not admission controlled, e.g. /ping, /metrics)."""
+    cls = ROUTE_CLASSES.get(path)
+    if cls is not None:
+        return cls
+    for prefix, name in ROUTE_CLASSES.items():
+        if prefix.endswith("/") and path.startswith(prefix):
+            return name
+    return None
+
+
+def tenant_of(scope, trust_tenant: bool = RATE_LIMIT_TRUST_TENANT) -> str:
+    """Rate-limit key: the trusted tenant if enabled, else the client address."""
+    if trust_tenant:
+        for key, value in scope.get("headers") or []:
+            if key == b"x-tenant" and value:
+                return value.decode("latin-1")
+        qs = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if qs.get("tenant"):
+            return qs["tenant"][0]
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "anonymous"
+
+
+# -------------------------
+# Token buckets
+# -------------------------
+class MemoryRateLimiter:
+    """In-process token buckets keyed on (class, tenant); per worker process."""
+
+    def __init__(self, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = {}
+        self._classes = {}
+
+    async def acquire(self, cls: EndpointClass, tenant: str) -> float:
+        """0 if a token was taken, else seconds until one is available."""
+        now = time.monotonic()
+        self._classes[cls.name] = cls
+        key = (cls.name, tenant)
+        tokens, ts = self._buckets.get(key, (float(cls.burst), now))
+        tokens = min(float(cls.burst), tokens + (now - ts) * cls.rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            self._prune(now)
+            return 0.0
+        self._buckets[key] = (tokens, now)
+        return (1 - tokens) / cls.rate
+
+    def _prune(self, now: float):
+        if len(self._buckets) <= self.max_buckets:
+            return
+        # drop buckets that have refilled completely: forgetting them changes nothing
+        for key, (tokens, ts) in list(self._buckets.items()):
+            cls = self._classes[key[0]]
+            if tokens + (now - ts) * cls.rate >= cls.burst:
+                del self._buckets[key]
+
+
+# tokens/ts live in one hash per bucket; Redis TIME keeps every worker on the same clock
+_REDIS_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter:
+    """Token buckets in Redis shared by all workers; fails open when Redis is unavailable."""
+
+    def __init__(self, host: str = None, port: int = None, prefix: str = "agentdesk:ratelimit"):
+        import redis.asyncio as aioredis
+        self.prefix = prefix
+        self._client = aioredis.Redis(host=host or os.getenv("REDIS_HOST", "localhost"),
+                                      port=int(port or os.getenv("REDIS_PORT", "6379")),
+                                      socket_timeout=0.05, socket_connect_timeout=0.2)
+        self._script = self._client.register_script(_REDIS_BUCKET)
+        self._warned = False
+
+    async def acquire(self, cls: EndpointClass, tenant: str) -> float:
+        try:
+            wait = await self._script(keys=[f"{self.prefix}:{cls.name}:{tenant}"], args=[cls.rate, cls.burst])
+            self._warned = False
+            return float(wait)
+        except Exception as e:
+            if not self._warned:
+                print(f"[admission] redis rate limiter unavailable, allowing requests: {e}")
+                self._warned = True
+            return 0.0
+
+
+def make_rate_limiter(backend: str = RATE_LIMIT_BACKEND):
+    if backend == "redis":
+        try:
+            return RedisRateLimiter()
+        except Exception as e:
+            print(f"[admission] redis backend unavailable ({e}); using in-process rate limits")
+    return MemoryRateLimiter()
+
+
+# -------------------------
+# Concurrency + priority queue
+# -------------------------
+class AdmissionController:
+    def __init__(self, classes: Dict[str, EndpointClass] = None, global_limit: int = ADMISSION_GLOBAL_LIMIT,
+                 max_queue: int = ADMISSION_MAX_QUEUE, rate_limiter=None):
+        self.classes = classes or load_classes()
+        self.by_priority = sorted(self.classes.values(), key=lambda c: c.priority)
+        self.global_limit = global_limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.rate_limiter = rate_limiter if rate_limiter is not None else make_rate_limiter()
+
+    def _has_slot(self, cls: EndpointClass) -> bool:
+        return cls.active < cls.limit and self.active < self.global_limit
+
+    def _blocked_by_higher_priority(self, cls: EndpointClass) -> bool:
+        # waiting higher-priority requests get the next global slot, no barging past them
+        return any(o.queue and o.active < o.limit for o in self.by_priority if o.priority < cls.priority)
+
+    def _grant(self, cls: EndpointClass, waited: float):
+        cls.active += 1
+        self.active += 1
+        cls.ewma_wait += ADMISSION_EWMA_ALPHA * (waited - cls.ewma_wait)
+        if _inflight is not None:
+            _inflight.labels(cls.name).inc()
+            _wait.labels(cls.name).observe(waited)
+
+    def _reject(self, cls: EndpointClass, status_code: int, reason: str, retry_after: float) -> Rejected:
+        if _rejections is not None:
+            _rejections.labels(cls.name, reason).inc()
+        return Rejected(status_code, reason, retry_after)
+
+    def _set_depth(self, cls: EndpointClass):
+        if _queue_depth is not None:
+            _queue_depth.labels(cls.name).set(len(cls.queue))
+
+    async def acquire(self, name: str, tenant: str):
+        """Wait for a slot for `name`; raises Rejected (429 rate limited, 503 shed)."""
+        cls = self.classes[name]
+        if cls.rate > 0:
+            wait = await self.rate_limiter.acquire(cls, tenant)
+            if wait > 0:
+                raise self._reject(cls, 429, "rate_limited", wait)
+
+        if not cls.queue and self._has_slot(cls) and not self._blocked_by_higher_priority(cls):
+            self._grant(cls, 0.0)
+            return
+        if len(cls.queue) >= self.max_queue:
+            raise self._reject(cls, 503, "queue_full", max(cls.ewma_wait, cls.max_wait))
+        if cls.queue and cls.ewma_wait > cls.max_wait:
+            # the queue is already slower than this class tolerates: fail fast
+            raise self._reject(cls, 503, "overloaded", cls.ewma_wait)
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (time.monotonic(), fut)
+        cls.queue.append(entry)
+        self._set_depth(cls)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=cls.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # granted just as we gave up: hand the slot back
+                self.release(name)
+            else:
+                fut.cancel()
+                self._remove(cls, entry)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            # the wait itself counts towards the class's queue-time estimate
+            cls.ewma_wait += ADMISSION_EWMA_ALPHA * (cls.max_wait - cls.ewma_wait)
+            raise self._reject(cls, 503, "queue_timeout", cls.ewma_wait)
+
+    def _remove(self, cls: EndpointClass, entry):
+        try:
+            cls.queue.remove(entry)
+        except ValueError:
+            pass
+        self._set_depth(cls)
+
+    def release(self, name: str):
+        cls = self.classes[name]
+        cls.active -= 1
+        self.active -= 1
+        if _inflight is not None:
+            _inflight.labels(cls.name).dec()
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        for cls in self.by_priority:
+            while cls.queue and self._has_slot(cls):
+                enqueued, fut = cls.queue.popleft()
+                if fut.done():
+                    continue
+                self._grant(cls, now - enqueued)
+                fut.set_result(None)
+            self._set_depth(cls)
+            if self.active >= self.global_limit:
+                break
+
+    def snapshot(self) -> dict:
+        return {
+            "global_limit": self.global_limit,
+            "active": self.active,
+            "classes": {c.name: {"priority": c.priority, "limit": c.limit, "active": c.active,
+                                 "queued": len(c.queue), "ewma_wait_seconds": round(c.ewma_wait, 4)}
+                        for c in self.by_priority},
+        }
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware: admit, run the app, release (after the response body is sent)."""
+
+    def __init__(self, app, controller: AdmissionController = None):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = classify(scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        controller = self.controller or get_controller()
+        try:
+            await controller.acquire(name, tenant_of(scope))
+        except Rejected as r:
+            return await _send_rejection(send, r)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(name)
+
+
+async def _send_rejection(send, r: Rejected):
+    detail = "Rate limit exceeded" if r.status_code == 429 else "Server busy, retry later"
+    body = ('{"detail": "%s", "reason": "%s"}' % (detail, r.reason)).encode()
+    await send({
+        "type": "http.response.start",
+        "status": r.status_code,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(r.retry_after).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,95 @@
+# services/api/deps.py
+"""
+Shared request dependencies and helpers for the API routers.
+
+Nothing here imports ML libraries: the vector store is created on first use
+(get_store) and tiktoken is loaded on the first token estimate.
+"""
+import os
+import threading
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from prometheus_client import Histogram
+
+from services.api.singleflight import SingleFlight, SingleFlightTimeout, request_key
+
+_auth_scheme = HTTPBearer(auto_error=False)
+
+# Request coalescing for identical in-flight /retrieve and /query calls
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1").lower() in ("1", "true", "yes")
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "60"))
+
+# Custom metric: tokens per request (Histogram)
+# This will appear in the /metrics output and can be used in Grafana dashboards.
+tokens_per_request = Histogram(
+    "agentdesk_tokens_per_request",
+    "Histogram of number of tokens processed per API request (approx.)"
+)
+
+_flights = SingleFlight()
+_enc = None
+_enc_lock = threading.Lock()
+
+
+def get_store():
+    """Vector backend (Qdrant or the embedded local index) chosen by VECTOR_BACKEND."""
+    from services.vectorstore.base import get_vector_store
+    return get_vector_store()
+
+
+def _encoder():
+    """tiktoken cl100k_base, loaded on first use (False if unavailable)."""
+    global _enc
+    with _enc_lock:
+        if _enc is None:
+            try:
+                import tiktoken
+                _enc = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _enc = False
+        return _enc
+
+
+def estimate_token_count(text: str) -> int:
+    """Estimate token count for a string.
+    Uses tiktoken if available (preferred), otherwise falls back to simple whitespace word count.
+    """
+    enc = _encoder()
+    if enc:
+        try:
+            return len(enc.encode(text))
+        except Exception:
+            pass
+    # fallback: approximate by words
+    return max(1, len(text.split()))
+
+
+def coalesce(endpoint: str, inp, fn):
+    """Run fn once for all concurrent requests with the same normalized (endpoint, q, top_k, filters)."""
+    if not SINGLEFLIGHT_ENABLED:
+        return fn()
+    key = request_key(endpoint, inp.q, inp.top_k, inp.filter_dict())
+    try:
+        return _flights.do(key, fn, timeout=SINGLEFLIGHT_WAIT_SECONDS, label=endpoint)
+    except SingleFlightTimeout as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+
+
+def get_current_role(credentials: HTTPAuthorizationCredentials = Depends(_auth_scheme)):
+    """
+    Resolve role from a simple Bearer token.
+    - Bearer <ADMIN_TOKEN> => "admin"
+    - Bearer <USER_TOKEN> => "user"
+    Raises 401 if missing/invalid.
+    """
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing credentials")
+    token = credentials.credentials
+    admin_token = os.getenv("ADMIN_TOKEN", "admin123")
+    user_token = os.getenv("USER_TOKEN", "user123")
+    if token == admin_token:
+        return "admin"
+    if token == user_token:
+        return "user"
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
@@ -0,0 +1,40 @@
+# services/api/features.py
+"""
+Feature flags for the API's subsystems.
+
+Each subsystem is on by default and turned off with ENABLE_<NAME>=0:
+- retrieval: /retrieve, /retrieve_batch (embedding model + reranker)
+- agents:    /query (orchestrator, RAG answer generation)
+- tools:     /execute_tool, /tickets (Postgres only, no ML models)
+- vision:    /embed_image, /search_images (CLIP, torch)
+- ocr:       /ingest_image (pytesseract)
+- otel:      OpenTelemetry tracing of requests
+
+A disabled subsystem's router is never imported, and the model components it
+needs are neither warmed nor required by /ready, so e.g. a tools-only
+deployment (ENABLE_RETRIEVAL=0 ENABLE_AGENTS=0 ENABLE_VISION=0 ENABLE_OCR=0)
+starts without importing torch at all.
+"""
+import os
+
+FEATURES = ("retrieval", "agents", "tools", "vision", "ocr", "otel")
+
+# model components (services/models/registry.py) each subsystem serves with
+MODEL_COMPONENTS = {
+    "retrieval": ("embed", "reranker"),
+    "agents": ("embed",),
+    "vision": ("clip",),
+}
+
+
+def enabled(name: str) -> bool:
+    return os.getenv(f"ENABLE_{name.upper()}", "1").lower() in ("1", "true", "yes")
+
+
+def enabled_features() -> list:
+    return [name for name in FEATURES if enabled(name)]
+
+
+def model_components() -> set:
+    """Model components needed by the enabled subsystems."""
+    return {c for name, comps in MODEL_COMPONENTS.items() if enabled(name) for c in comps}
@@ -0,0 +1,24 @@
+# services/api/routers/agents.py
+"""Agent endpoint: /query (ENABLE_AGENTS). The orchestrator is imported on first request."""
+from fastapi import APIRouter
+
+from services.api.deps import coalesce
+from services.api.schemas import QueryIn
+
+router = APIRouter(tags=["agents"])
+
+
+@router.post("/query")
+def query_endpoint(inp: QueryIn):
+
+    from services.agents.orchestrator import AgentOrchestrator
+    from services.rag.rag_runner import answer_query
+
+    def answer(query, top_k, filters=None):
+        # during incident bursts many users ask the same thing: one LLM call serves them all.
+        # Only the read-only RAG answer is coalesced, after intent routing; side-effecting
+        # tools (e.g. one ticket per report) always run for each request.
+        return coalesce("query", inp, lambda: answer_query(query, top_k, filters=filters))
+
+    orchestrator = AgentOrchestrator()
+    return orchestrator.run(inp.q, inp.top_k, filters=inp.filter_dict(), answer=answer)
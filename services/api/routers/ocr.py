@@ -0,0 +1,25 @@
+# services/api/routers/ocr.py
+"""OCR endpoint: /ingest_image (ENABLE_OCR). pytesseract/PIL load on first request."""
+import os
+import shutil
+import tempfile
+
+from fastapi import APIRouter, File, UploadFile
+
+router = APIRouter(tags=["ocr"])
+
+
+@router.post("/ingest_image")
+async def ingest_image(file: UploadFile = File(...)):
+    from services.vision.ocr_ingest import extract_text_from_image
+
+    # Save upload to temp file
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1])
+    try:
+        with open(tmp.name, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+        text = extract_text_from_image(tmp.name)
+        return {"ok": True, "extracted_chars": len(text), "preview": text[:300]}
+    finally:
+        try: os.unlink(tmp.name)
+        except: pass
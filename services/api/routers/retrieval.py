@@ -0,0 +1,137 @@
+# services/api/routers/retrieval.py
+"""
+Retrieval endpoints: /retrieve and /retrieve_batch (ENABLE_RETRIEVAL).
+
+Models come from services/api/warmup.py; the embed -> coarse search -> rerank
+pipeline is services/rag/retrieval.py, shared with the evaluation harness.
+"""
+import os
+from typing import List
+
+from fastapi import APIRouter, HTTPException, status
+
+from services.api import warmup
+from services.api.deps import coalesce, estimate_token_count, get_store, tokens_per_request
+from services.api.schemas import BatchQueryIn, QueryIn
+from services.rag import retrieval as pipeline
+
+router = APIRouter(tags=["retrieval"])
+
+# Config
+COLLECTION = "agentdesk_docs"
+COARSE_LIMIT = int(os.getenv("COARSE_LIMIT", "50"))
+
+# /retrieve_batch limits
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "64"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "64"))
+
+
+def require_embed_model():
+    """Return the embedding model, or 503 if it could not be loaded."""
+    model = warmup.get_model("embed")
+    if model is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Embedding model not available")
+    return model
+
+
+def _format_hit(it) -> dict:
+    """Flatten a Qdrant point into the hit shape returned by the retrieval endpoints."""
+    return {
+        "doc_id": it.payload.get("doc_id"),
+        "chunk_id": it.payload.get("chunk_id"),
+        "char_start": it.payload.get("char_start"),
+        "char_end": it.payload.get("char_end"),
+        "token_count": it.payload.get("token_count"),
+        "text": it.payload.get("text"),
+        "score": it.score
+    }
+
+
+def _select_hits(coarse, scores, top_k: int) -> List[dict]:
+    """Pick the top_k coarse results, ordered by reranker scores when given."""
+    return [_format_hit(it) for it in pipeline.order_by_scores(coarse, scores, top_k)]
+
+
+@router.post("/retrieve")
+def retrieve(inp: QueryIn):
+    """
+    Lightweight retrieval endpoint:
+    - embeds the query
+    - coarse-searches the vector store (optionally scoped by payload filters)
+    - optional reranking
+    Returns top chunks and scores.
+    We observe tokens_per_request here for observability.
+    """
+    query = inp.q
+
+    # Observability: estimate tokens used by request and record
+    tok_count = estimate_token_count(query)
+    tokens_per_request.observe(tok_count)
+
+    # identical concurrent requests share one embed/search/rerank pass
+    hits = coalesce("retrieve", inp, lambda: _retrieve_hits(inp))
+    return {"query": query, "hits": hits}
+
+
+def _retrieve_hits(inp: QueryIn) -> List[dict]:
+    # embed -> coarse search (top COARSE_LIMIT) -> cross-encoder rerank if available
+    hits = pipeline.retrieve(
+        inp.q, require_embed_model(), get_store(), COLLECTION,
+        top_k=inp.top_k,
+        coarse_limit=COARSE_LIMIT,
+        filters=inp.filter_dict(),
+        reranker=warmup.get_model("reranker")
+    )
+    return [_format_hit(it) for it in hits]
+
+
+@router.post("/retrieve_batch")
+def retrieve_batch(inp: BatchQueryIn):
+    """
+    Batched variant of /retrieve for clients that issue many queries at once:
+    - embeds every query in one forward pass
+    - coarse-searches the vector store with a single search_batch call
+    - reranks all (query, chunk) pairs in one CrossEncoder call
+    Results are returned in the same order as the input queries.
+    """
+    items = inp.queries
+    if len(items) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many queries: {len(items)} > {MAX_BATCH_QUERIES}"
+        )
+    if not items:
+        return {"results": []}
+
+    queries = [item.q for item in items]
+    for query in queries:
+        tokens_per_request.observe(estimate_token_count(query))
+
+    # 1) embed all queries together
+    embed_model = require_embed_model()
+    reranker = warmup.get_model("reranker")
+    qvecs = embed_model.encode(queries, batch_size=EMBED_BATCH_SIZE)
+
+    # 2) one round-trip to the vector store for all coarse searches
+    specs = [(vec, COARSE_LIMIT, item.filter_dict()) for item, vec in zip(items, qvecs)]
+    coarse_batches = get_store().search_batch(COLLECTION, specs)
+
+    # 3) flatten every (query, chunk) pair into one rerank call, then split back
+    per_query_scores = [None] * len(items)
+    if reranker is not None:
+        pairs = []
+        offsets = []
+        for query, coarse in zip(queries, coarse_batches):
+            offsets.append(len(pairs))
+            pairs.extend((query, item.payload.get("text", "")) for item in coarse)
+        if pairs:
+            all_scores = reranker.predict(pairs, batch_size=RERANK_BATCH_SIZE)
+            for i, coarse in enumerate(coarse_batches):
+                if coarse:
+                    per_query_scores[i] = all_scores[offsets[i]:offsets[i] + len(coarse)]
+
+    results = []
+    for item, coarse, scores in zip(items, coarse_batches, per_query_scores):
+        results.append({"query": item.q, "hits": _select_hits(coarse, scores, item.top_k)})
+    return {"results": results}
@@ -0,0 +1,42 @@
+# services/api/routers/tools.py
+"""Tool endpoints: /execute_tool and /tickets (ENABLE_TOOLS). Postgres only, no ML imports."""
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from services.api.deps import get_current_role
+from services.api.schemas import ToolCall
+from services.tools.ticket_tool import TicketStoreUnavailable, create_ticket, get_ticket_status
+from services.tools.table_tool import query_table, list_tables
+
+router = APIRouter(tags=["tools"])
+
+
+@router.post("/execute_tool")
+def execute_tool(call: ToolCall, role: str = Depends(get_current_role)):
+    # Only admin may run tools (example)
+    if role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: admin role required")
+    if call.name == "create_ticket":
+        res = create_ticket(call.args)
+        return {"ok": True, "result": res}
+    elif call.name == "query_table":
+        try:
+            res = query_table(call.args)
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "result": res}
+    elif call.name == "list_tables":
+        return {"ok": True, "result": list_tables()}
+    else:
+        return {"ok": False, "error": "Unknown tool"}
+
+
+@router.get("/tickets/{ticket_id}")
+def ticket_status(ticket_id: str, role: str = Depends(get_current_role)):
+    try:
+        ticket = get_ticket_status(ticket_id)
+    except TicketStoreUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+                            headers={"Retry-After": "5"})
+    if ticket is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown ticket")
+    return ticket
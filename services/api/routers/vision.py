@@ -0,0 +1,90 @@
+# services/api/routers/vision.py
+"""
+Image endpoints: /embed_image and /search_images (ENABLE_VISION).
+
+CLIP (and torch) come from services/vision/clip_embed.py, imported on first
+request or by the "clip" warm-up component, never at app import.
+
+CLIP and the vector store block (store calls retry with backoff for up to
+QDRANT_DEADLINE), so they run in the threadpool, never on the event loop.
+"""
+import os
+import tempfile
+import uuid
+
+from fastapi import APIRouter, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from services.api.deps import get_store
+
+router = APIRouter(tags=["vision"])
+
+
+@router.post("/embed_image")
+async def embed_image_endpoint(file: UploadFile = File(...), tenant: str = "default"):
+    data = await file.read()
+    await run_in_threadpool(_embed_and_store, file.filename, data, tenant)
+    return {"ok": True, "message": "Image embedded successfully"}
+
+
+def _embed_and_store(filename: str, data: bytes, tenant: str):
+    from services.vision.clip_embed import embed_image
+
+    store = get_store()
+
+    # Save the uploaded file temporarily
+    tmp_dir = tempfile.gettempdir()
+    tmp_path = os.path.join(tmp_dir, filename)
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+
+    # Generate embedding for the image
+    vec = embed_image(tmp_path)
+
+    # Use per-tenant collection name (for multi-user support)
+    coll = f"user_{tenant}"
+
+    # Ensure collection exists with correct vector size and distance metric
+    try:
+        store.ensure_collection(coll, len(vec))
+    except Exception:
+        pass
+
+    # Upsert single image embedding
+    point = {
+        "id": str(uuid.uuid4()),  # valid UUID for Qdrant
+        "vector": vec,
+        "payload": {"path": tmp_path}
+    }
+
+    store.upsert(coll, [point])
+
+    # Clean up temporary file
+    os.remove(tmp_path)
+
+
+@router.post("/search_images")
+def search_images_endpoint(query: str, tenant: str = "default"):
+    from services.vision.clip_embed import embed_texts
+
+    # Embed the text query
+    vec = embed_texts([query])[0]
+
+    # Collection name for this tenant
+    coll = f"user_{tenant}"
+
+    # Search top 3 results
+    results = get_store().search(coll, vec, limit=3)
+
+    return {
+        "ok": True,
+        "query": query,
+        "results": [
+            {
+                "id": r.id,
+                "score": r.score,
+                "payload": r.payload
+            }
+            for r in results
+        ]
+    }
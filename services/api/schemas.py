@@ -0,0 +1,37 @@
+# services/api/schemas.py
+"""Request models shared by the API routers."""
+from datetime import datetime
+from typing import List, Optional, Union
+
+from pydantic import BaseModel
+
+
+class SearchFilters(BaseModel):
+    """Payload filters pushed down to Qdrant (see services/rag/filters.py)."""
+    doc_id: Optional[Union[str, List[str]]] = None
+    source: Optional[Union[str, List[str]]] = None
+    tenant: Optional[str] = None
+    tags: Optional[List[str]] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+
+
+class QueryIn(BaseModel):
+    q: str
+    top_k: int = 5
+    filters: Optional[SearchFilters] = None
+
+    def filter_dict(self) -> Optional[dict]:
+        if self.filters is None:
+            return None
+        return self.filters.model_dump(exclude_none=True) or None
+
+
+class BatchQueryIn(BaseModel):
+    queries: List[QueryIn]
+
+
+class ToolCall(BaseModel):
+    name: str
+    args: dict
+    run_id: str = None
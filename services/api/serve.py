@@ -0,0 +1,207 @@
+# services/api/serve.py
+"""
+Production serving mode for the API: pre-fork uvicorn workers that share model weights.
+
+The parent process imports services.api.main, loads and warms every model
+(services/api/warmup.py), freezes the GC so collections don't dirty shared
+pages, binds the listening socket and only then forks the workers. Model
+weights therefore live in pages shared copy-on-write by all workers instead
+of one private copy per worker (which is what `uvicorn --workers N` does).
+
+Config (env):
+- WEB_WORKERS:   number of worker processes (default: usable CPUs // TORCH_THREADS)
+- TORCH_THREADS: torch intra-op threads per worker (default 1)
+- HOST / PORT:   bind address (default 0.0.0.0:8000)
+- FORWARDED_ALLOW_IPS: proxies (IPs or CIDRs, comma-separated) whose
+                 X-Forwarded-For/-Proto are trusted (default 127.0.0.1). Set
+                 it to the load balancer's subnets so request.client, and the
+                 per-client rate limits of services/api/admission.py, see the
+                 caller's address instead of the load balancer's
+- WORKER_MIN_UPTIME:        a worker dying sooner than this (seconds, default
+                            30) counts as a fast failure
+- WORKER_RESTART_BACKOFF:   delay before restarting after a fast failure,
+                            doubled per consecutive fast failure (default 1s,
+                            capped by WORKER_RESTART_BACKOFF_MAX, default 30s)
+- WORKER_MAX_FAST_FAILURES: consecutive fast failures after which the server
+                            gives up and exits 1 (default 5), so a crash loop
+                            surfaces to the container orchestrator
+
+Keep WEB_WORKERS x TORCH_THREADS <= available vCPUs. Many workers with one
+thread each gives the best throughput for small requests; fewer workers with
+more threads gives lower latency per request for large batches
+(/retrieve_batch).
+
+Thread pools don't survive fork(): a worker forked while the parent's
+OpenMP/intra-op pool is running can deadlock on its first parallel op. The
+parent therefore imports and warms everything with a single thread (OMP/MKL/
+OpenBLAS pinned to 1 before torch or numpy are imported), and each worker
+raises torch to TORCH_THREADS only after the fork.
+
+Usage:
+    WEB_WORKERS=4 TORCH_THREADS=1 python -m services.api.serve
+"""
+import os
+import gc
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+
+def _usable_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except Exception:
+        return os.cpu_count() or 1
+
+
+TORCH_THREADS = max(1, int(os.getenv("TORCH_THREADS", "1")))
+WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS", str(max(1, _usable_cpus() // TORCH_THREADS)))))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+WORKER_MIN_UPTIME = float(os.getenv("WORKER_MIN_UPTIME", "30"))
+WORKER_RESTART_BACKOFF = float(os.getenv("WORKER_RESTART_BACKOFF", "1"))
+WORKER_RESTART_BACKOFF_MAX = float(os.getenv("WORKER_RESTART_BACKOFF_MAX", "30"))
+WORKER_MAX_FAST_FAILURES = int(os.getenv("WORKER_MAX_FAST_FAILURES", "5"))
+
+
+def _pin_thread_env():
+    # must happen before torch / numpy are imported anywhere. The parent stays single-threaded
+    # so no native thread pool exists when it forks; workers raise torch's threads after the fork.
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = "1"
+    # ONNX Runtime embedding backends (services/embeddings/backends.py)
+    os.environ.setdefault("EMBED_THREADS", str(TORCH_THREADS))
+    # HF tokenizers' own thread pool is not fork-safe
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+
+def _prepare_metrics_dir():
+    # prometheus_client needs a shared directory to aggregate metrics across workers
+    if WEB_WORKERS > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="agentdesk-prom-")
+
+
+def _set_torch_threads(threads: int):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception as e:
+        print("Could not set torch threads:", e)
+
+
+def _bind_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket):
+    import uvicorn
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    _set_torch_threads(TORCH_THREADS)
+    config = uvicorn.Config(app, host=HOST, port=PORT, log_level=os.getenv("LOG_LEVEL", "info"),
+                            proxy_headers=True, forwarded_allow_ips=FORWARDED_ALLOW_IPS)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _run_worker(app, sock)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def _sleep_unless(stop, seconds: float):
+    """Sleep up to `seconds`, returning early once stop() is true (SIGTERM during a backoff)."""
+    deadline = time.monotonic() + seconds
+    while not stop() and time.monotonic() < deadline:
+        time.sleep(min(0.2, deadline - time.monotonic()))
+
+
+def main():
+    _pin_thread_env()
+    _prepare_metrics_dir()
+
+    # 1) import the app and load every model once, in the parent
+    from services.api import main as api
+    from services.api import warmup
+    _set_torch_threads(1)
+    t0 = time.perf_counter()
+    warmup.warm_all(started_at=api._IMPORT_STARTED)
+    print(f"Models warm in {time.perf_counter() - t0:.1f}s:", warmup.readiness()["components"])
+
+    # 2) move everything allocated so far out of the GC's reach, so collections
+    #    in the workers don't write to (and un-share) the parent's pages
+    gc.collect()
+    gc.freeze()
+
+    # 3) fork workers that share the socket and the model pages
+    sock = _bind_socket()
+    print(f"Serving on {HOST}:{PORT} with {WEB_WORKERS} workers x {TORCH_THREADS} torch threads")
+    workers = {}  # pid -> start time
+    for _ in range(WEB_WORKERS):
+        workers[_spawn(api.app, sock)] = time.monotonic()
+
+    stopping = False
+    exit_code = 0
+    fast_failures = 0
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    # 4) supervise: replace workers that die unexpectedly, backing off while they keep
+    #    dying right after start and giving up on a crash loop
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            try:
+                from prometheus_client import multiprocess
+                multiprocess.mark_process_dead(pid)
+            except Exception:
+                pass
+        if stopping:
+            continue
+        uptime = time.monotonic() - started if started is not None else 0.0
+        fast_failures = fast_failures + 1 if uptime < WORKER_MIN_UPTIME else 0
+        if fast_failures >= WORKER_MAX_FAST_FAILURES:
+            print(f"Worker {pid} exited after {uptime:.1f}s; {fast_failures} fast failures in a row, giving up")
+            exit_code = 1
+            _stop(None, None)
+            continue
+        delay = min(WORKER_RESTART_BACKOFF_MAX, WORKER_RESTART_BACKOFF * 2 ** (fast_failures - 1)) if fast_failures else 0.0
+        print(f"Worker {pid} exited after {uptime:.1f}s; restarting in {delay:.1f}s")
+        _sleep_unless(lambda: stopping, delay)
+        if not stopping:
+            workers[_spawn(api.app, sock)] = time.monotonic()
+
+    sock.close()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
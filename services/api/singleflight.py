@@ -0,0 +1,135 @@
+# services/api/singleflight.py
+"""
+Request coalescing ("single-flight") for identical in-flight requests.
+
+When many callers ask for the same key at the same time, the first one (the
+leader) runs the computation and everyone else (followers) waits for its
+result instead of repeating the embed/search/rerank or LLM call. Nothing is
+kept once the leader finishes, so this only collapses concurrent bursts; it
+is not a result cache.
+
+- Followers wait at most `timeout` seconds and then get SingleFlightTimeout;
+  the leader keeps running and still serves any remaining followers.
+- If the leader raises, every follower waiting on that call gets its own
+  copy of the exception (chained to the leader's, so its traceback is kept),
+  and the next request for the key starts a fresh computation. The original
+  object is never raised in more than one thread: each raise appends to its
+  __traceback__, so sharing it would splice the callers' tracebacks together.
+- Only side-effect-free work may be coalesced: a follower never runs fn.
+- Results are shared between callers and must be treated as read-only.
+
+The API endpoints are sync (run in the threadpool), so this is thread-based.
+"""
+import copy
+import json
+import threading
+from typing import Callable, Optional
+
+try:
+    from prometheus_client import Counter, Gauge
+    _requests = Counter("agentdesk_singleflight_requests_total",
+                        "Requests through the single-flight layer", ["endpoint", "role"])
+    _timeouts = Counter("agentdesk_singleflight_timeouts_total",
+                        "Followers that gave up waiting for the leader", ["endpoint"])
+    _inflight = Gauge("agentdesk_singleflight_inflight_keys",
+                      "Distinct keys currently being computed", ["endpoint"])
+except Exception:
+    _requests = _timeouts = _inflight = None
+
+
+class SingleFlightTimeout(Exception):
+    """A follower waited longer than its timeout for the leader's result."""
+
+
+class SingleFlightError(Exception):
+    """The leader failed with an exception that could not be copied for a follower."""
+
+
+def _follower_error(error: BaseException) -> BaseException:
+    """A fresh exception for one follower, chained to the leader's."""
+    try:
+        err = copy.copy(error)
+    except Exception:
+        # __init__ doesn't accept its own args (e.g. raised with keyword arguments):
+        # build the instance without __init__ and carry the attributes over
+        try:
+            err = type(error).__new__(type(error), *error.args)
+            err.__dict__.update(error.__dict__)
+        except Exception:
+            err = None
+    if type(err) is not type(error):
+        err = SingleFlightError(f"in-flight request failed: {type(error).__name__}: {error}")
+    err.__traceback__ = None
+    err.__cause__ = error
+    return err
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+def request_key(endpoint: str, query: str, top_k: int, filters: Optional[dict] = None) -> str:
+    """Normalized key: whitespace/case-insensitive query plus canonical filters."""
+    norm_q = " ".join(query.lower().split())
+    norm_f = json.dumps(filters or {}, sort_keys=True, default=str)
+    return f"{endpoint}|{top_k}|{norm_f}|{norm_q}"
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: str, fn: Callable, timeout: Optional[float] = None, label: str = "default"):
+        """Run fn() once per concurrent key and hand its result to every caller."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.followers += 1
+
+        if leader:
+            return self._lead(key, call, fn, label)
+        return self._follow(call, timeout, label)
+
+    def _lead(self, key: str, call: _Call, fn: Callable, label: str):
+        if _requests is not None:
+            _requests.labels(endpoint=label, role="leader").inc()
+            _inflight.labels(endpoint=label).inc()
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+            if _inflight is not None:
+                _inflight.labels(endpoint=label).dec()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _follow(self, call: _Call, timeout: Optional[float], label: str):
+        if _requests is not None:
+            _requests.labels(endpoint=label, role="coalesced").inc()
+        if not call.done.wait(timeout):
+            if _timeouts is not None:
+                _timeouts.labels(endpoint=label).inc()
+            raise SingleFlightTimeout(f"timed out after {timeout}s waiting for in-flight request")
+        if call.error is not None:
+            raise _follower_error(call.error)
+        return call.result
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,93 @@
+# services/api/warmup.py
+"""
+Model warm-up and readiness tracking for the API.
+
+The models themselves live in the process-wide registry
+(services/models/registry.py: embed, reranker, clip), which the RAG layer
+uses too. This module decides which of them the API warms and requires:
+
+warm_all() loads components in parallel threads (each is warmed with a dummy
+forward pass) so the first real request does not pay for lazy kernel/allocator
+setup. get_model() returns a component, loading it in the caller's thread if
+nothing else has started it (so scripts that never call warm_all keep working).
+readiness() reports per-component state for the /ready endpoint.
+Components of subsystems switched off by feature flags (services/api/features.py)
+are neither warmed nor required for readiness.
+
+Run `python -m services.api.warmup --download` at image build time to cache
+all artifacts so containers can start with HF_HUB_OFFLINE=1.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.api import features
+from services.models import registry
+from services.models.registry import get_model  # noqa: F401  (re-exported for the routers)
+
+_ENABLED = features.model_components()
+# components loaded by warm_all (others load lazily on first use)
+WARMUP_COMPONENTS = [c.strip() for c in os.getenv("WARMUP_COMPONENTS", "embed,reranker,clip").split(",")
+                     if c.strip() in _ENABLED]
+# components that must be loaded before /ready reports ready
+READY_REQUIRED = [c.strip() for c in os.getenv("READY_REQUIRED", "embed").split(",") if c.strip() in _ENABLED]
+
+_warmup_done = threading.Event()
+_timings = {"import_seconds": None, "startup_seconds": None}
+
+try:
+    from prometheus_client import Gauge
+    _import_seconds = Gauge("agentdesk_import_seconds", "Time spent importing the API module")
+    _startup_seconds = Gauge("agentdesk_startup_seconds", "Time from API import until warm-up finished")
+except Exception:
+    _import_seconds = _startup_seconds = None
+
+
+def warm_all(components=None, started_at: float = None):
+    """Load and warm components in parallel threads. Blocks until all finish."""
+    names = [n for n in (components or WARMUP_COMPONENTS) if n in registry.LOADERS]
+    if names:
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="warmup") as pool:
+            list(pool.map(registry.ensure, names))
+    if started_at is not None:
+        elapsed = time.perf_counter() - started_at
+        _timings["startup_seconds"] = round(elapsed, 3)
+        if _startup_seconds is not None:
+            _startup_seconds.set(elapsed)
+    _warmup_done.set()
+
+
+def start_background_warmup(started_at: float = None) -> threading.Thread:
+    """Kick off warm_all in a daemon thread so liveness checks answer immediately."""
+    t = threading.Thread(target=warm_all, kwargs={"started_at": started_at}, name="warmup", daemon=True)
+    t.start()
+    return t
+
+
+def record_import_time(seconds: float):
+    _timings["import_seconds"] = round(seconds, 3)
+    if _import_seconds is not None:
+        _import_seconds.set(seconds)
+
+
+def readiness() -> dict:
+    """Per-component state plus an overall ready flag for the /ready endpoint."""
+    components = registry.status()
+    ready = all(components[name]["state"] == "ready" for name in READY_REQUIRED if name in components)
+    return {
+        "ready": ready,
+        "warmup_finished": _warmup_done.is_set(),
+        "components": components,
+        **_timings,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    if "--download" in sys.argv:
+        registry.download_artifacts()
+    else:
+        t0 = time.perf_counter()
+        warm_all(started_at=t0)
+        print(readiness())
@@ -0,0 +1,222 @@
+# services/embeddings/backends.py
+"""
+Selectable embedding backends for EMBED_MODEL (query and chunk embeddings).
+
+EMBED_BACKEND:
+- torch       SentenceTransformer, fp32 PyTorch (default, the reference)
+- torch-int8  the same model with its Linear layers dynamically quantized to int8
+- onnx        ONNX Runtime over the exported fp32 graph
+- onnx-int8   ONNX Runtime over the dynamically int8-quantized export
+
+Every backend offers the part of the SentenceTransformer API the services
+use: encode(sentences, batch_size=..., normalize_embeddings=...) and
+get_sentence_embedding_dimension(). Callers don't care which one answers;
+the loaded model's `embed_backend` attribute says which one did.
+
+Anything other than torch is only enabled after it passed the accuracy
+guardrail (services/embeddings/guardrail.py): the report next to the
+artifacts must say "passed" for exactly the artifact on disk. Otherwise
+load_embedder() warns and falls back to torch fp32. EMBED_ALLOW_UNVERIFIED=1
+skips the check (benchmarks, experiments).
+
+Artifacts live in EMBED_ARTIFACT_DIR/<model>/ and are created with
+    python -m services.embeddings.export --backends onnx onnx-int8 torch-int8
+
+ONNX Runtime uses EMBED_THREADS intra-op threads (default TORCH_THREADS, so
+the pre-fork server's one-thread-per-worker setting applies to both).
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+EMBED_ARTIFACT_DIR = os.getenv("EMBED_ARTIFACT_DIR", os.path.join(os.getcwd(), "models", "embeddings"))
+EMBED_ALLOW_UNVERIFIED = os.getenv("EMBED_ALLOW_UNVERIFIED", "").lower() in ("1", "true", "yes")
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", os.getenv("TORCH_THREADS", "0")))  # 0 = runtime default
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model-int8.onnx"}
+
+try:
+    from prometheus_client import Gauge
+    _backend_info = Gauge("agentdesk_embed_backend_info", "Embedding backend in use (1 = active)",
+                          ["model", "backend"])
+except Exception:
+    _backend_info = None
+
+
+# -------------------------
+# Artifacts
+# -------------------------
+def artifact_dir(model_name: str = None) -> str:
+    return os.path.join(EMBED_ARTIFACT_DIR, (model_name or EMBED_MODEL).replace("/", "__"))
+
+
+def read_manifest(model_dir: str) -> dict:
+    with open(os.path.join(model_dir, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def artifact_fingerprint(backend: str, model_name: str = None) -> str:
+    """Identifies what a guardrail report was computed for; a re-export or upgrade invalidates it."""
+    model_name = model_name or EMBED_MODEL
+    if backend in ONNX_FILES:
+        return "sha256:" + _sha256(os.path.join(artifact_dir(model_name), ONNX_FILES[backend]))
+    if backend == "torch-int8":
+        import torch
+        return f"{model_name}|torch-{torch.__version__}|{torch.backends.quantized.engine}"
+    return model_name
+
+
+def report_path(backend: str, model_name: str = None) -> str:
+    return os.path.join(artifact_dir(model_name), f"guardrail-{backend}.json")
+
+
+def guardrail_status(backend: str, model_name: str = None):
+    """(enabled?, reason) for a backend from its latest guardrail report."""
+    if backend == "torch":
+        return True, "reference backend"
+    path = report_path(backend, model_name)
+    try:
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+    except FileNotFoundError:
+        return False, f"no guardrail report at {path}"
+    if not report.get("passed"):
+        return False, f"guardrail failed: {', '.join(report.get('failures', [])) or 'see ' + path}"
+    try:
+        current = artifact_fingerprint(backend, model_name)
+    except FileNotFoundError as e:
+        return False, f"artifact missing: {e.filename}"
+    if report.get("fingerprint") != current:
+        return False, "guardrail report is for a different artifact; re-run the guardrail"
+    return True, "guardrail passed"
+
+
+# -------------------------
+# Backends
+# -------------------------
+def _normalize(emb: np.ndarray) -> np.ndarray:
+    return emb / np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+
+
+class OnnxEmbedder:
+    """SentenceTransformer-compatible encoder over an exported transformer + numpy pooling."""
+
+    def __init__(self, model_dir: str, backend: str = "onnx", threads: int = None, path: str = None):
+        from transformers import AutoTokenizer
+
+        manifest = read_manifest(model_dir)
+        self.embed_backend = backend
+        self.pooling = manifest["pooling"]
+        self.normalize = manifest["normalize"]
+        self.max_seq_length = manifest["max_seq_length"]
+        self.dim = manifest["dim"]
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.join(model_dir, "tokenizer"))
+
+        self.path = path or os.path.join(model_dir, ONNX_FILES[backend])
+        self.threads = EMBED_THREADS if threads is None else threads
+        self._session = None
+        self._pid = None
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @property
+    def session(self):
+        # A single-threaded session runs in the caller's thread and is safe to share with
+        # forked workers. With more threads its intra-op pool would not survive the fork,
+        # so each process builds its own session.
+        if self._session is None or (self.threads != 1 and self._pid != os.getpid()):
+            import onnxruntime as ort
+            opts = ort.SessionOptions()
+            if self.threads > 0:
+                opts.intra_op_num_threads = self.threads
+                opts.inter_op_num_threads = 1
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self._session = ort.InferenceSession(self.path, opts, providers=["CPUExecutionProvider"])
+            self._pid = os.getpid()
+        return self._session
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _embed_batch(self, texts) -> np.ndarray:
+        enc = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                             return_tensors="np")
+        feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        mask = enc["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # longest first, like SentenceTransformer, so batches carry little padding
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        parts = [self._embed_batch([texts[i] for i in order[start:start + batch_size]])
+                 for start in range(0, len(texts), batch_size)]
+        emb = np.concatenate(parts)[np.argsort(order, kind="stable")].astype(np.float32)
+        if self.normalize or normalize_embeddings:
+            emb = _normalize(emb)
+        return emb[0] if single else emb
+
+
+def _load_torch(model_name: str, threads: int = None, device: str = None):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device=device)
+
+
+def _load_torch_int8(model_name: str, threads: int = None):
+    import torch
+    model = _load_torch(model_name, device="cpu")  # quantized kernels are CPU-only
+    # weights int8, activations quantized on the fly: no calibration data needed
+    torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def _load_onnx(model_name: str, threads: int = None):
+    return OnnxEmbedder(artifact_dir(model_name), "onnx", threads)
+
+
+def _load_onnx_int8(model_name: str, threads: int = None):
+    return OnnxEmbedder(artifact_dir(model_name), "onnx-int8", threads)
+
+
+LOADERS = {
+    "torch": _load_torch,
+    "torch-int8": _load_torch_int8,
+    "onnx": _load_onnx,
+    "onnx-int8": _load_onnx_int8,
+}
+
+
+def load_embedder(backend: str = None, model_name: str = None, verify: bool = True, threads: int = None):
+    """Embedding model for a backend (default EMBED_BACKEND), guardrail-checked unless verify=False."""
+    backend = (backend or EMBED_BACKEND).lower()
+    model_name = model_name or EMBED_MODEL
+    if backend not in LOADERS:
+        raise ValueError(f"Unknown EMBED_BACKEND: {backend} (expected one of {', '.join(BACKENDS)})")
+    if verify and not EMBED_ALLOW_UNVERIFIED and backend != "torch":
+        ok, reason = guardrail_status(backend, model_name)
+        if not ok:
+            print(f"[embeddings] {backend} is not enabled for {model_name} ({reason}); using torch fp32")
+            backend = "torch"
+    model = LOADERS[backend](model_name, threads)
+    model.embed_backend = backend
+    if _backend_info is not None:
+        _backend_info.labels(model=model_name, backend=backend).set(1)
+    return model
@@ -0,0 +1,182 @@
+# services/embeddings/export.py
+"""
+Export EMBED_MODEL for the ONNX backends, calibrate the int8 quantization and
+run the accuracy guardrail.
+
+Steps (artifacts in EMBED_ARTIFACT_DIR/<model>/):
+1. onnx:      export the transformer to model.onnx (dynamic batch and sequence
+              axes) and save the tokenizer plus a manifest with the pooling,
+              normalization and max sequence length of the SentenceTransformer
+2. onnx-int8: dynamically quantize model.onnx to int8 weights with each
+              candidate config (per-tensor, per-channel, per-channel with
+              reduced range), embed the calibration texts with each and keep
+              the config closest to fp32 (mean cosine) as model-int8.onnx.
+              The calibration texts (--calibration, one per line) are held
+              out from the guardrail's reference set, so the guardrail does
+              not grade the config on the texts it was chosen on
+3. guardrail: services/embeddings/guardrail.py for every requested backend;
+              only backends whose report passed can be enabled
+
+torch-int8 needs no artifact (it is quantized at load time), only step 3.
+
+Usage:
+    python -m services.embeddings.export --backends onnx onnx-int8 torch-int8
+"""
+import argparse
+import inspect
+import json
+import os
+import time
+
+import numpy as np
+
+from services.embeddings.backends import (
+    BACKENDS, EMBED_MODEL, ONNX_FILES, OnnxEmbedder, artifact_dir, load_embedder, read_manifest
+)
+
+ONNX_OPSET = int(os.getenv("EMBED_ONNX_OPSET", "17"))
+CALIBRATION_TEXTS = "sample_data/embed_calibration.txt"
+INT8_CONFIGS = {
+    "per-tensor": {"per_channel": False, "reduce_range": False},
+    "per-channel": {"per_channel": True, "reduce_range": False},
+    "per-channel-reduced": {"per_channel": True, "reduce_range": True},
+}
+
+
+def _pooling_mode(st_model) -> str:
+    pooling = next((m for m in st_model if type(m).__name__ == "Pooling"), None)
+    if pooling is not None and getattr(pooling, "pooling_mode_cls_token", False):
+        return "cls"
+    return "mean"
+
+
+def export_onnx(model_name: str, out_dir: str, opset: int = ONNX_OPSET) -> dict:
+    """Write model.onnx, tokenizer/ and manifest.json. Returns the manifest."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0]
+    hf_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["warm-up query", "a somewhat longer warm-up passage"], padding=True, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class _Encoder(torch.nn.Module):
+        # positional inputs in input_names order -> last_hidden_state; pooling happens in numpy
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, ONNX_FILES["onnx"])
+    axes = {n: {0: "batch", 1: "sequence"} for n in input_names + ["last_hidden_state"]}
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(_Encoder(hf_model), tuple(sample[n] for n in input_names), path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=opset, do_constant_folding=True, **kwargs)
+    tokenizer.save_pretrained(os.path.join(out_dir, "tokenizer"))
+
+    manifest = {
+        "model": model_name,
+        "pooling": _pooling_mode(st),
+        "normalize": any(type(m).__name__ == "Normalize" for m in st),
+        "max_seq_length": int(st.max_seq_length),
+        "dim": int(st.get_sentence_embedding_dimension()),
+        "opset": opset,
+        "torch": torch.__version__,
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "files": {"onnx": ONNX_FILES["onnx"]},
+    }
+    _write_manifest(out_dir, manifest)
+    print(f"exported {model_name} -> {path} in {time.perf_counter() - t0:.1f}s")
+    return manifest
+
+
+def _write_manifest(out_dir: str, manifest: dict):
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_calibration_texts(path: str, exclude=()) -> list:
+    """Non-empty lines of `path`, minus any that also appear in `exclude` (the guardrail texts)."""
+    exclude = set(exclude)
+    with open(path, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    kept = [t for t in texts if t not in exclude]
+    if len(kept) < len(texts):
+        print(f"dropped {len(texts) - len(kept)} calibration texts that are also guardrail texts")
+    if not kept:
+        raise ValueError(f"No calibration texts in {path}")
+    return kept
+
+
+def calibrate_int8(model_name: str, out_dir: str, texts: list) -> dict:
+    """Quantize model.onnx with each INT8_CONFIGS entry and keep the one closest to fp32 on `texts`."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    fp32 = load_embedder("torch", model_name, verify=False)
+    reference = np.asarray(fp32.encode(texts, batch_size=64, normalize_embeddings=True))
+    src = os.path.join(out_dir, ONNX_FILES["onnx"])
+    dst = os.path.join(out_dir, ONNX_FILES["onnx-int8"])
+    candidate_path = dst + ".candidate"
+
+    scores = {}
+    best = None
+    for name, opts in INT8_CONFIGS.items():
+        quantize_dynamic(src, candidate_path, weight_type=QuantType.QInt8, **opts)
+        # model-int8.onnx is only replaced by the best candidate so far
+        model = OnnxEmbedder(out_dir, "onnx-int8", threads=0, path=candidate_path)
+        emb = np.asarray(model.encode(texts, batch_size=64, normalize_embeddings=True))
+        cos = (emb * reference).sum(1)
+        scores[name] = {"mean_cosine": float(cos.mean()), "p1_cosine": float(np.percentile(cos, 1))}
+        print(f"int8 {name}: mean cosine {cos.mean():.4f}, p1 {np.percentile(cos, 1):.4f}")
+        if best is None or scores[name]["mean_cosine"] > scores[best]["mean_cosine"]:
+            best = name
+            os.replace(candidate_path, dst)
+        else:
+            os.remove(candidate_path)
+
+    manifest = read_manifest(out_dir)
+    manifest["files"]["onnx-int8"] = ONNX_FILES["onnx-int8"]
+    manifest["int8"] = {"config": best, **INT8_CONFIGS[best], "calibration_texts": len(texts),
+                        "candidates": scores}
+    _write_manifest(out_dir, manifest)
+    print(f"kept int8 config {best} -> {dst}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export/calibrate embedding backends and run the guardrail")
+    parser.add_argument("--backends", nargs="+", choices=[b for b in BACKENDS if b != "torch"],
+                        default=["onnx", "onnx-int8", "torch-int8"])
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--docs", default="sample_docs/*.md", help="guardrail reference documents")
+    parser.add_argument("--calibration", default=CALIBRATION_TEXTS,
+                        help="int8 calibration texts, one per line (kept apart from the guardrail set)")
+    parser.add_argument("--labels", default="sample_data/retrieval_eval.jsonl")
+    parser.add_argument("--opset", type=int, default=ONNX_OPSET)
+    parser.add_argument("--no-guardrail", action="store_true", help="export only (backends stay disabled)")
+    args = parser.parse_args()
+
+    from services.embeddings.guardrail import reference_set, run_guardrail
+
+    out_dir = artifact_dir(args.model)
+    if {"onnx", "onnx-int8"} & set(args.backends):
+        export_onnx(args.model, out_dir, args.opset)
+    if "onnx-int8" in args.backends:
+        texts, _, queries, _ = reference_set(args.docs, args.labels)
+        calibrate_int8(args.model, out_dir, load_calibration_texts(args.calibration, exclude=texts + queries))
+    if args.no_guardrail:
+        return
+    reports = run_guardrail(args.backends, args.model, args.docs, args.labels)
+    raise SystemExit(0 if all(r["passed"] for r in reports.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# services/embeddings/guardrail.py
+"""
+Accuracy guardrail for the non-fp32 embedding backends.
+
+Embeds a reference set with torch fp32 and with the candidate backend and
+compares them:
+- cosine(fp32, candidate) per text: mean, 1st percentile and minimum
+- top-k agreement with fp32 retrieval (overlap@k) over the chunk index,
+  both "self" (candidate queries against a candidate-embedded index, i.e.
+  after re-ingesting) and "cross" (candidate queries against the existing
+  fp32 index, i.e. switching only the query side)
+- labeled recall@k on sample_data/retrieval_eval.jsonl, fp32 vs candidate
+
+The reference set is the production chunking (chunk_text + with_source) of
+--docs plus the labeled queries. The report goes to
+EMBED_ARTIFACT_DIR/<model>/guardrail-<backend>.json together with the
+artifact fingerprint; load_embedder() only enables a backend whose report
+passed for the artifact on disk.
+
+Usage:
+    python -m services.embeddings.guardrail --backends onnx onnx-int8 torch-int8
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from services.embeddings.backends import (
+    BACKENDS, EMBED_MODEL, artifact_fingerprint, load_embedder, report_path
+)
+
+THRESHOLDS = {
+    "min_mean_cosine": float(os.getenv("GUARDRAIL_MIN_MEAN_COSINE", "0.99")),
+    "min_p1_cosine": float(os.getenv("GUARDRAIL_MIN_P1_COSINE", "0.97")),
+    "min_overlap": float(os.getenv("GUARDRAIL_MIN_OVERLAP", "0.9")),
+    "max_recall_drop": float(os.getenv("GUARDRAIL_MAX_RECALL_DROP", "0.02")),
+}
+OVERLAP_K = 10
+RECALL_K = (1, 3, 5)
+ENCODE_BATCH = 64
+
+
+def reference_set(docs_pattern: str, labels_path: str):
+    """(chunk texts, chunk keys [(doc_id, chunk_id)], queries, relevance units per query)."""
+    from services.eval.retrieval_eval import (
+        chunk_spans, label_spans, load_corpus, load_labels, relevant_chunks
+    )
+    from services.ingestion.ingest_token_chunks import CHUNK_OVERLAP, CHUNK_TOKENS, chunk_text, with_source
+
+    docs = load_corpus(docs_pattern)
+    texts, keys, spans = [], [], {}
+    for doc_id, text in docs.items():
+        spans[doc_id] = chunk_spans(text, CHUNK_TOKENS, CHUNK_OVERLAP)
+        for chunk_id, (body, _) in enumerate(chunk_text(text)):
+            texts.append(with_source(doc_id, body))
+            keys.append((doc_id, chunk_id))
+    queries, units = [], []
+    if labels_path and os.path.exists(labels_path):
+        labeled = load_labels(labels_path)
+        resolved = label_spans(labeled, docs, (CHUNK_TOKENS, CHUNK_OVERLAP))
+        queries = [q["query"] for q in labeled]
+        units = [relevant_chunks(u, spans) for u in resolved]
+    return texts, keys, queries, units
+
+
+def _encode(model, texts) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return np.asarray(model.encode(texts, batch_size=ENCODE_BATCH, normalize_embeddings=True), dtype=np.float32)
+
+
+def _top_k(queries: np.ndarray, index: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ index.T
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+
+def _overlap(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean([len(set(x) & set(y)) / len(x) for x, y in zip(a, b)])) if len(a) else 1.0
+
+
+def _labeled_recall(top: np.ndarray, keys: list, units: list) -> dict:
+    from services.eval.retrieval_eval import score_ranking
+    per_query = [score_ranking([keys[i] for i in row], u, RECALL_K) for row, u in zip(top, units)]
+    return {f"recall@{k}": float(np.mean([m[f"recall@{k}"] for m in per_query])) if per_query else None
+            for k in RECALL_K}
+
+
+def compare(reference: dict, candidate_model, keys: list, units: list, thresholds: dict = None) -> dict:
+    """Metrics and pass/fail for one candidate against precomputed fp32 embeddings."""
+    thresholds = thresholds or THRESHOLDS
+    t0 = time.perf_counter()
+    chunks = _encode(candidate_model, reference["texts"])
+    queries = _encode(candidate_model, reference["queries"])
+    embed_s = time.perf_counter() - t0
+
+    ref_chunks, ref_queries = reference["chunks"], reference["query_vecs"]
+    cos = np.concatenate([(chunks * ref_chunks).sum(1), (queries * ref_queries).sum(1)])
+    k = min(OVERLAP_K, len(keys))
+    ref_top = _top_k(ref_queries, ref_chunks, k)
+    self_top = _top_k(queries, chunks, k)
+    cross_top = _top_k(queries, ref_chunks, k)
+
+    metrics = {
+        "texts": int(len(cos)),
+        "mean_cosine": float(cos.mean()),
+        "p1_cosine": float(np.percentile(cos, 1)),
+        "min_cosine": float(cos.min()),
+        f"overlap@{k}_self": _overlap(self_top, ref_top),
+        f"overlap@{k}_cross": _overlap(cross_top, ref_top),
+        "fp32": _labeled_recall(_top_k(ref_queries, ref_chunks, max(RECALL_K)), keys, units),
+        "self": _labeled_recall(self_top[:, :max(RECALL_K)], keys, units),
+        "cross": _labeled_recall(cross_top[:, :max(RECALL_K)], keys, units),
+        "embed_seconds": round(embed_s, 3),
+    }
+
+    failures = []
+    if metrics["mean_cosine"] < thresholds["min_mean_cosine"]:
+        failures.append(f"mean cosine {metrics['mean_cosine']:.4f} < {thresholds['min_mean_cosine']}")
+    if metrics["p1_cosine"] < thresholds["min_p1_cosine"]:
+        failures.append(f"p1 cosine {metrics['p1_cosine']:.4f} < {thresholds['min_p1_cosine']}")
+    for mode in ("self", "cross"):
+        ov = metrics[f"overlap@{k}_{mode}"]
+        if ov < thresholds["min_overlap"]:
+            failures.append(f"overlap@{k} ({mode}) {ov:.3f} < {thresholds['min_overlap']}")
+        for name, base in metrics["fp32"].items():
+            got = metrics[mode][name]
+            if base is not None and base - got > thresholds["max_recall_drop"]:
+                failures.append(f"{name} ({mode}) {got:.3f} vs fp32 {base:.3f}")
+    return {"metrics": metrics, "failures": failures, "passed": not failures}
+
+
+def fp32_reference(texts: list, queries: list, model_name: str = None) -> dict:
+    model = load_embedder("torch", model_name, verify=False)
+    return {"texts": texts, "queries": queries,
+            "chunks": _encode(model, texts), "query_vecs": _encode(model, queries)}
+
+
+def run_guardrail(backends, model_name: str = None, docs: str = "sample_docs/*.md",
+                  labels: str = "sample_data/retrieval_eval.jsonl", thresholds: dict = None) -> dict:
+    """Check each backend against fp32 and write its report. Returns {backend: report}."""
+    model_name = model_name or EMBED_MODEL
+    thresholds = thresholds or THRESHOLDS
+    texts, keys, queries, units = reference_set(docs, labels)
+    reference = fp32_reference(texts, queries, model_name)
+    reports = {}
+    for backend in backends:
+        if backend == "torch":
+            continue
+        candidate = load_embedder(backend, model_name, verify=False)
+        result = compare(reference, candidate, keys, units, thresholds)
+        report = {
+            "model": model_name,
+            "backend": backend,
+            "fingerprint": artifact_fingerprint(backend, model_name),
+            "reference": {"docs": docs, "labels": labels, "chunks": len(texts), "queries": len(queries)},
+            "thresholds": thresholds,
+            "checked_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            **result,
+        }
+        path = report_path(backend, model_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        reports[backend] = report
+        print_report(report)
+        print(f"  report: {path}")
+    return reports
+
+
+def print_report(report: dict):
+    m = report["metrics"]
+    overlap = {key: v for key, v in m.items() if key.startswith("overlap@")}
+    print(f"\n{report['backend']}: {'PASSED' if report['passed'] else 'FAILED'}  ({m['texts']} texts)")
+    print(f"  cosine vs fp32: mean {m['mean_cosine']:.4f}  p1 {m['p1_cosine']:.4f}  min {m['min_cosine']:.4f}")
+    print("  " + "  ".join(f"{key} {v:.3f}" for key, v in overlap.items()))
+    for mode in ("fp32", "self", "cross"):
+        print(f"  {mode:<5} " + "  ".join(f"{key} {v:.3f}" for key, v in m[mode].items() if v is not None))
+    for failure in report["failures"]:
+        print(f"  - {failure}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends against torch fp32")
+    parser.add_argument("--backends", nargs="+", choices=[b for b in BACKENDS if b != "torch"],
+                        default=["onnx", "onnx-int8", "torch-int8"])
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--docs", default="sample_docs/*.md")
+    parser.add_argument("--labels", default="sample_data/retrieval_eval.jsonl")
+    args = parser.parse_args()
+    reports = run_guardrail(args.backends, args.model, args.docs, args.labels)
+    raise SystemExit(0 if all(r["passed"] for r in reports.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# services/eval/retrieval_eval.py
+"""
+Offline retrieval evaluation: sweep chunking and search settings over a
+labeled query set and compare quality against latency and index size.
+
+Every configuration is built and queried with the production code paths:
+chunk_text()/redact_pii()/with_source() from ingestion and retrieve() from
+services/rag/retrieval.py (the /retrieve pipeline). Nothing needs a running
+service: the index lives in an in-process ":memory:" Qdrant or in the
+embedded local store under a temp directory.
+
+Swept parameters (each flag takes a list; the grid is their product):
+- --chunk-tokens / --overlap   chunking (one index per pair)
+- --coarse                     coarse vector-search depth before rerank
+- --rerank on|off              cross-encoder rerank of the coarse hits
+- --ef                         HNSW ef at search time (0 = collection default)
+- --quant none|int8            vector quantization
+
+--embed-backend runs the whole sweep with another embedding backend
+(services/embeddings/backends.py), guardrail or not.
+
+Embedded (":memory:") Qdrant always searches exactly, so --ef has no effect
+there and int8 runs on the local store's int8 index instead; point
+--qdrant-url at a Qdrant server to measure real HNSW and scalar quantization.
+
+Labeled queries are JSONL, one {"query": ..., "relevant": [...]} per line.
+Each relevant entry is one of:
+- {"doc_id": "refund_policy.md"}                    any chunk of the document
+- {"doc_id": "security.md", "chunk_id": 3}          chunk 3 under --label-chunking
+- {"doc_id": "security.md", "text": "self-signed"}  the chunk(s) containing the text
+chunk_id and text labels are mapped to character spans, so they stay valid
+when the chunking being evaluated differs from the one used for labeling.
+
+Report per configuration: recall@k for each --k, MRR and nDCG@max(k), p50/p95
+per stage (embed, search, rerank, total) and index size. Printed as a table
+and written as JSON to --out.
+
+Usage:
+    python -m services.eval.retrieval_eval --labels sample_data/retrieval_eval.jsonl \\
+        --chunk-tokens 200 500 --overlap 0 50 --coarse 10 50 --rerank on off --quant none int8
+"""
+import argparse
+import glob
+import itertools
+import json
+import math
+import os
+import re
+import statistics
+import tempfile
+import time
+import uuid
+
+from services.ingestion.ingest_token_chunks import (
+    CHUNK_OVERLAP, CHUNK_TOKENS, EMBED_MODEL, TOKTI, chunk_text, enc, redact_pii, with_source
+)
+from services.rag.retrieval import retrieve
+
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+ENCODE_BATCH = 64
+UPSERT_BATCH = 256
+STAGES = ("embed_ms", "search_ms", "rerank_ms", "total_ms")
+
+
+# ------------------------
+# Corpus and labels
+# ------------------------
+def token_spans(text: str):
+    """Character span of every token, consistent with tokenize_text()."""
+    if TOKTI and enc:
+        tokens = enc.encode(text)
+        _, offsets = enc.decode_with_offsets(tokens)
+        ends = offsets[1:] + [len(text)]
+        return list(zip(offsets, ends))
+    return [m.span() for m in re.finditer(r"\S+", text)]
+
+
+def chunk_spans(text: str, chunk_tokens: int, chunk_overlap: int):
+    """Character span of every chunk chunk_text() produces for the same settings."""
+    spans = token_spans(text)
+    step = max(1, chunk_tokens - chunk_overlap)
+    return [
+        (spans[start][0], spans[min(start + chunk_tokens, len(spans)) - 1][1])
+        for start in range(0, len(spans), step)
+    ]
+
+
+def load_corpus(pattern: str) -> dict:
+    """{doc_id: redacted text}, prepared the way ingest_file() prepares it."""
+    docs = {}
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            docs[os.path.basename(path)] = redact_pii(f.read().strip())
+    if not docs:
+        raise SystemExit(f"No documents match {pattern}")
+    return docs
+
+
+def load_labels(path: str) -> list:
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                queries.append(json.loads(line))
+    return queries
+
+
+def label_spans(queries: list, docs: dict, label_chunking) -> list:
+    """Resolve each relevant entry to (doc_id, char span or None)."""
+    spans_cache = {}
+    resolved = []
+    for q in queries:
+        units = []
+        for rel in q["relevant"]:
+            doc_id = rel["doc_id"]
+            if doc_id not in docs:
+                print(f"warning: label for unknown document {doc_id!r} ({q['query']!r})")
+                units.append((doc_id, None))
+            elif "chunk_id" in rel:
+                if doc_id not in spans_cache:
+                    spans_cache[doc_id] = chunk_spans(docs[doc_id], *label_chunking)
+                units.append((doc_id, spans_cache[doc_id][rel["chunk_id"]]))
+            elif "text" in rel:
+                pos = docs[doc_id].lower().find(rel["text"].lower())
+                if pos < 0:
+                    print(f"warning: {rel['text']!r} not found in {doc_id}, using the whole document")
+                    units.append((doc_id, None))
+                else:
+                    units.append((doc_id, (pos, pos + len(rel["text"]))))
+            else:
+                units.append((doc_id, None))
+        resolved.append(units)
+    return resolved
+
+
+def relevant_chunks(units: list, doc_chunk_spans: dict) -> list:
+    """Per unit: (doc_id, set of chunk_ids that satisfy it, or None for any chunk)."""
+    out = []
+    for doc_id, span in units:
+        if span is None:
+            out.append((doc_id, None))
+            continue
+        lo, hi = span
+        ids = {i for i, (s, e) in enumerate(doc_chunk_spans.get(doc_id, [])) if s < hi and e > lo}
+        out.append((doc_id, ids))
+    return out
+
+
+# ------------------------
+# Metrics
+# ------------------------
+def _satisfies(hit_key, unit) -> bool:
+    doc_id, chunk_ids = unit
+    return hit_key[0] == doc_id and (chunk_ids is None or hit_key[1] in chunk_ids)
+
+
+def score_ranking(ranked: list, units: list, ks) -> dict:
+    """recall@k per k, reciprocal rank and nDCG@max(k) for one query.
+
+    ranked: [(doc_id, chunk_id)] in retrieval order. A hit earns gain 1 the
+    first time it satisfies a not-yet-satisfied relevance unit.
+    """
+    k_max = max(ks)
+    satisfied_at = {}
+    rr = 0.0
+    dcg = 0.0
+    for rank, key in enumerate(ranked[:k_max], start=1):
+        new = [i for i, u in enumerate(units) if i not in satisfied_at and _satisfies(key, u)]
+        if new and rr == 0.0:
+            rr = 1.0 / rank
+        if new:
+            dcg += 1.0 / math.log2(rank + 1)
+        for i in new:
+            satisfied_at[i] = rank
+    ideal = sum(1.0 / math.log2(r + 1) for r in range(1, min(k_max, len(units)) + 1))
+    out = {f"recall@{k}": sum(1 for r in satisfied_at.values() if r <= k) / len(units) for k in ks}
+    out["rr"] = rr
+    out[f"ndcg@{k_max}"] = dcg / ideal if ideal else 0.0
+    return out
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+# ------------------------
+# Index building
+# ------------------------
+def make_store(quant: str, qdrant_url: str, tmp: str):
+    """(store, backend label, ensure_collection kwargs). See the module docstring for the :memory: caveat."""
+    if quant == "int8" and qdrant_url == ":memory:":
+        from services.vectorstore.local_store import LocalStore
+        return LocalStore(root=os.path.join(tmp, "int8"), dtype="int8"), "local-int8", {}
+    from services.vectorstore.qdrant_store import QdrantStore
+    create = {"quantization": "int8"} if quant == "int8" else {}
+    return QdrantStore(url=qdrant_url), f"qdrant-{quant}", create
+
+
+def build_index(store, collection: str, docs: dict, chunking, embed_model, create: dict, vectors_cache: dict):
+    """Chunk, embed and load the corpus. Returns (chunk spans per doc, build seconds, embed seconds)."""
+    chunk_tokens, chunk_overlap = chunking
+    t0 = time.perf_counter()
+    cached = vectors_cache.get(chunking)
+    if cached is None:
+        texts, payloads, spans = [], [], {}
+        for doc_id, text in docs.items():
+            spans[doc_id] = chunk_spans(text, chunk_tokens, chunk_overlap)
+            for chunk_id, (body, token_count) in enumerate(chunk_text(text, chunk_tokens, chunk_overlap)):
+                texts.append(with_source(doc_id, body))
+                payloads.append({"doc_id": doc_id, "chunk_id": chunk_id, "source": doc_id,
+                                 "token_count": token_count, "text": body})
+        vectors = embed_model.encode(texts, batch_size=ENCODE_BATCH, normalize_embeddings=True)
+        cached = vectors_cache[chunking] = (vectors, payloads, spans, time.perf_counter() - t0)
+    vectors, payloads, spans, embed_s = cached
+
+    t1 = time.perf_counter()
+    store.ensure_collection(collection, vectors.shape[1], recreate=True, **create)
+    for start in range(0, len(payloads), UPSERT_BATCH):
+        store.upsert(collection, [
+            {"id": str(uuid.UUID(int=i + 1)), "vector": vectors[i], "payload": payloads[i]}
+            for i in range(start, min(start + UPSERT_BATCH, len(payloads)))
+        ])
+    return spans, embed_s + (time.perf_counter() - t1), embed_s
+
+
+def index_bytes(store, collection: str, dim: int, quant: str):
+    """(bytes, exact?) On-disk size for the local store, vector-memory estimate for Qdrant."""
+    if hasattr(store, "disk_bytes"):
+        return store.disk_bytes(collection), True
+    n = store.count(collection)
+    per_vector = dim * 4 + (dim if quant == "int8" else 0)
+    return n * per_vector, False
+
+
+# ------------------------
+# Sweep
+# ------------------------
+def evaluate(store, collection: str, queries: list, resolved: list, spans: dict, embed_model, reranker,
+             coarse: int, ef: int, ks) -> dict:
+    per_query = []
+    stage = {s: [] for s in STAGES}
+    for q, units in zip(queries, resolved):
+        timings = {}
+        t0 = time.perf_counter()
+        hits = retrieve(q["query"], embed_model, store, collection, top_k=max(ks), coarse_limit=coarse,
+                        filters=q.get("filters"), reranker=reranker, ef=ef or None, timings=timings)
+        timings["total_ms"] = (time.perf_counter() - t0) * 1000
+        for s in STAGES:
+            stage[s].append(timings.get(s, 0.0))
+        ranked = [(h.payload.get("doc_id"), h.payload.get("chunk_id")) for h in hits]
+        per_query.append(score_ranking(ranked, relevant_chunks(units, spans), ks))
+
+    k_max = max(ks)
+    metrics = {f"recall@{k}": statistics.mean(m[f"recall@{k}"] for m in per_query) for k in ks}
+    metrics["mrr"] = statistics.mean(m["rr"] for m in per_query)
+    metrics[f"ndcg@{k_max}"] = statistics.mean(m[f"ndcg@{k_max}"] for m in per_query)
+    latency = {}
+    for s in STAGES:
+        latency[s.replace("_ms", "") + "_p50_ms"] = _percentile(stage[s], 0.5)
+        latency[s.replace("_ms", "") + "_p95_ms"] = _percentile(stage[s], 0.95)
+    return {"metrics": metrics, "latency": latency}
+
+
+def run_sweep(args) -> list:
+    from services.embeddings.backends import load_embedder
+    docs = load_corpus(args.docs)
+    queries = load_labels(args.labels)
+    resolved = label_spans(queries, docs, tuple(args.label_chunking))
+    embed_model = load_embedder(args.embed_backend, args.embed_model, verify=False)
+
+    reranker = None
+    if "on" in args.rerank:
+        from sentence_transformers import CrossEncoder
+        reranker = CrossEncoder(args.reranker_model)
+
+    # warm the models so the first configuration's latency is not a cold start
+    embed_model.encode("warmup")
+    if reranker is not None:
+        reranker.predict([("warmup", "warmup")])
+
+    ks = sorted(set(args.k))
+    tmp = tempfile.mkdtemp(prefix="agentdesk-eval-")
+    vectors_cache = {}
+    results = []
+    chunkings = [(t, o) for t, o in itertools.product(args.chunk_tokens, args.overlap) if o < t]
+    for chunking, quant in itertools.product(chunkings, args.quant):
+        store, backend, create = make_store(quant, args.qdrant_url, tmp)
+        collection = f"eval_{chunking[0]}_{chunking[1]}_{quant}"
+        spans, build_s, embed_s = build_index(store, collection, docs, chunking, embed_model, create, vectors_cache)
+        dim = vectors_cache[chunking][0].shape[1]
+        size, exact = index_bytes(store, collection, dim, quant)
+        n_chunks = len(vectors_cache[chunking][1])
+
+        for coarse, rerank, ef in itertools.product(args.coarse, args.rerank, args.ef):
+            out = evaluate(store, collection, queries, resolved, spans, embed_model,
+                           reranker if rerank == "on" else None, coarse, ef, ks)
+            results.append({
+                "config": {"chunk_tokens": chunking[0], "chunk_overlap": chunking[1], "coarse": coarse,
+                           "rerank": rerank == "on", "hnsw_ef": ef or None, "quant": quant, "backend": backend},
+                "index": {"chunks": n_chunks, "bytes": size, "bytes_exact": exact,
+                          "build_seconds": round(build_s, 3), "embed_seconds": round(embed_s, 3)},
+                **out,
+            })
+            print(f"done: {results[-1]['config']}")
+    return results
+
+
+def print_table(results: list, ks):
+    k_max = max(ks)
+    cols = ["chunk", "ovl", "coarse", "rerank", "ef", "quant"]
+    cols += [f"R@{k}" for k in ks] + ["MRR", f"nDCG@{k_max}"]
+    cols += ["embed p50", "search p50", "rerank p50", "total p50", "total p95", "index MB"]
+    print(" | ".join(cols))
+    print(" | ".join("-" * len(c) for c in cols))
+    for r in results:
+        c, m, lat, idx = r["config"], r["metrics"], r["latency"], r["index"]
+        row = [str(c["chunk_tokens"]), str(c["chunk_overlap"]), str(c["coarse"]),
+               "on" if c["rerank"] else "off", str(c["hnsw_ef"] or "-"), c["backend"]]
+        row += [f"{m[f'recall@{k}']:.3f}" for k in ks] + [f"{m['mrr']:.3f}", f"{m[f'ndcg@{k_max}']:.3f}"]
+        row += [f"{lat[s]:.1f}" for s in ("embed_p50_ms", "search_p50_ms", "rerank_p50_ms",
+                                          "total_p50_ms", "total_p95_ms")]
+        row.append(f"{idx['bytes'] / 1e6:.2f}" + ("" if idx["bytes_exact"] else "~"))
+        print(" | ".join(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval evaluation sweep")
+    parser.add_argument("--labels", default="sample_data/retrieval_eval.jsonl")
+    parser.add_argument("--docs", default="sample_docs/*.md")
+    parser.add_argument("--chunk-tokens", type=int, nargs="+", default=[CHUNK_TOKENS])
+    parser.add_argument("--overlap", type=int, nargs="+", default=[CHUNK_OVERLAP])
+    parser.add_argument("--coarse", type=int, nargs="+", default=[50])
+    parser.add_argument("--rerank", choices=["on", "off"], nargs="+", default=["on", "off"])
+    parser.add_argument("--ef", type=int, nargs="+", default=[0], help="HNSW ef (0 = collection default)")
+    parser.add_argument("--quant", choices=["none", "int8"], nargs="+", default=["none"])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--label-chunking", type=int, nargs=2, metavar=("TOKENS", "OVERLAP"),
+                        default=[CHUNK_TOKENS, CHUNK_OVERLAP], help="chunking that chunk_id labels refer to")
+    parser.add_argument("--qdrant-url", default=":memory:")
+    parser.add_argument("--embed-model", default=EMBED_MODEL)
+    parser.add_argument("--embed-backend", choices=["torch", "torch-int8", "onnx", "onnx-int8"], default="torch")
+    parser.add_argument("--reranker-model", default=RERANKER_MODEL)
+    parser.add_argument("--out", default="data/eval/retrieval_eval.json")
+    args = parser.parse_args()
+
+    results = run_sweep(args)
+    print()
+    print_table(results, sorted(set(args.k)))
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"labels": args.labels, "docs": args.docs, "k": sorted(set(args.k)),
+                   "embed_backend": args.embed_backend,
+                   "results": results}, f, indent=2)
+    print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,31 @@
 # services/ingestion/ingest_table.py
-import pandas as pd
-from sqlalchemy import create_engine, text
+"""
+Tabular ingestion: stream CSVs into Postgres tables the agents can query.
+
+- the CSV is read in chunks (CSV_CHUNK_ROWS), so memory stays bounded by the
+  chunk size instead of the file size; column types are inferred once from a
+  sample (declared ones via --dtypes Age:float win) and then pinned for every
+  chunk. A later value that doesn't fit its column's type (text in an int
+  column) fails the load with its data row, column and value, before anything
+  reaches COPY
+- an existing table must have exactly the columns and types of the CSV;
+  otherwise the load fails with the differences instead of loading into (or
+  registering) a mismatched table
+- each chunk is bulk-loaded with COPY ... FROM STDIN, all in one transaction;
+  with replace=True (--replace) the table's old rows are deleted in that same
+  transaction, so a reload swaps the contents atomically instead of appending
+- indexes are created on the declared key columns
+- the table is recorded in `table_registry` (columns, types, key columns, row
+  count) so services/tools/table_tool.py can answer aggregate questions with
+  parameterized SQL instead of embedding rows for RAG
+"""
+import io
+import json
 import os
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
 
 # read DB creds from env or default
 PG_USER = os.getenv("POSTGRES_USER", "agentdesk")
@@ -10,20 +34,251 @@ PG_HOST = os.getenv("POSTGRES_HOST", "postgres")
 PG_DB = os.getenv("POSTGRES_DB", "agentdesk")
 PG_PORT = os.getenv("POSTGRES_PORT", "5432")
 
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "50000"))
+INFER_ROWS = int(os.getenv("CSV_INFER_ROWS", "10000"))
+
 engine = create_engine(f"postgresql+psycopg2://{PG_USER}:{PG_PASS}@{PG_HOST}:{PG_PORT}/{PG_DB}")
 
-def ingest_csv_to_table(csv_path: str, table_name: str = "features"):
-    df = pd.read_csv(csv_path)
-    # optional: add ingestion metadata
-    df['ingested_at'] = pd.Timestamp.utcnow()
-    df.to_sql(table_name, con=engine, if_exists="append", index=False)
-    return {"rows": len(df)}
+# declared type -> (pandas dtype, Postgres type)
+TYPES = {
+    "int": ("Int64", "BIGINT"),
+    "float": ("float64", "DOUBLE PRECISION"),
+    "bool": ("boolean", "BOOLEAN"),
+    "text": ("string", "TEXT"),
+    "timestamp": (None, "TIMESTAMP"),  # parsed via pd.to_datetime
+    "date": (None, "DATE"),
+}
+# Postgres type -> information_schema.columns.data_type
+PG_DATA_TYPES = {
+    "BIGINT": "bigint",
+    "DOUBLE PRECISION": "double precision",
+    "BOOLEAN": "boolean",
+    "TEXT": "text",
+    "TIMESTAMP": "timestamp without time zone",
+    "DATE": "date",
+}
+_BOOLS = {"true": True, "false": False}
+
+REGISTRY_DDL = """
+CREATE TABLE IF NOT EXISTS table_registry (
+    table_name TEXT PRIMARY KEY,
+    columns JSONB NOT NULL,
+    key_columns JSONB NOT NULL,
+    row_count BIGINT NOT NULL,
+    source TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def infer_types(csv_path: str, sample_rows: int = INFER_ROWS) -> dict:
+    """Infer declared types ({column: type}) from the first rows of the file."""
+    sample = pd.read_csv(csv_path, nrows=sample_rows)
+    out = {}
+    for col, dtype in sample.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            out[col] = "bool"
+        elif pd.api.types.is_integer_dtype(dtype):
+            out[col] = "int"
+        elif pd.api.types.is_float_dtype(dtype):
+            out[col] = "float"
+        else:
+            out[col] = "text"
+    return out
+
+
+def parse_dtypes(spec: str) -> dict:
+    """'ID:int,Age:float' -> {"ID": "int", "Age": "float"}"""
+    out = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        col, typ = part.rsplit(":", 1)
+        if typ.strip() not in TYPES:
+            raise ValueError(f"Unknown type {typ!r} for column {col!r}; use one of {sorted(TYPES)}")
+        out[col.strip()] = typ.strip()
+    return out
+
+
+def _check_schema(cur, table_name: str, types: dict):
+    """Fail if `table_name` exists with other columns or types than the CSV's."""
+    cur.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s",
+        (table_name,)
+    )
+    existing = dict(cur.fetchall())
+    if not existing:
+        return
+    expected = {c: PG_DATA_TYPES[TYPES[t][1]] for c, t in types.items()}
+    expected["ingested_at"] = PG_DATA_TYPES["TIMESTAMP"]
+    # tables created by the earlier pandas to_sql loader have a timestamptz ingested_at
+    accepted = {"ingested_at": {PG_DATA_TYPES["TIMESTAMP"], "timestamp with time zone"}}
+    problems = []
+    missing = [c for c in expected if c not in existing]
+    extra = [c for c in existing if c not in expected]
+    if missing:
+        problems.append(f"CSV columns missing from the table: {missing}")
+    if extra:
+        problems.append(f"table columns not in the CSV: {extra}")
+    for col, typ in expected.items():
+        if col in existing and existing[col] not in accepted.get(col, {typ}):
+            problems.append(f"{col} is {existing[col]} in the table but {typ} in the CSV")
+    if problems:
+        raise ValueError(
+            f"Table {table_name} already exists with a different schema: {'; '.join(problems)}. "
+            "Declare matching types with --dtypes, or drop/rename the table to load the new schema."
+        )
+
+
+def _create_table(cur, table_name: str, types: dict):
+    from psycopg2 import sql
+    cols = [sql.SQL("{} {}").format(sql.Identifier(c), sql.SQL(TYPES[t][1])) for c, t in types.items()]
+    cols.append(sql.SQL("ingested_at TIMESTAMP"))
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(
+        sql.Identifier(table_name), sql.SQL(", ").join(cols)))
+
+
+def _create_indexes(cur, table_name: str, key_columns):
+    from psycopg2 import sql
+    for col in key_columns:
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})").format(
+            sql.Identifier(f"idx_{table_name}_{col}"[:63]), sql.Identifier(table_name), sql.Identifier(col)))
+
+
+def _register(cur, table_name: str, types: dict, key_columns, csv_path: str):
+    from psycopg2 import sql
+    cur.execute(REGISTRY_DDL)
+    cur.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(table_name)))
+    row_count = cur.fetchone()[0]
+    columns = {c: t for c, t in types.items()}
+    columns["ingested_at"] = "timestamp"
+    cur.execute(
+        """
+        INSERT INTO table_registry (table_name, columns, key_columns, row_count, source, updated_at)
+        VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (table_name) DO UPDATE SET
+            columns = EXCLUDED.columns, key_columns = EXCLUDED.key_columns,
+            row_count = EXCLUDED.row_count, source = EXCLUDED.source, updated_at = EXCLUDED.updated_at
+        """,
+        (table_name, json.dumps(columns), json.dumps(list(key_columns)), row_count, os.path.basename(csv_path))
+    )
+    return row_count
+
+
+def _convert(values: pd.Series, typ: str):
+    """(converted column, mask of non-empty values that don't fit `typ`) for a column read as text."""
+    if typ == "text":
+        return values, pd.Series(False, index=values.index)
+    if typ == "int":
+        stripped = values.str.strip()
+        ok = (stripped.str.fullmatch(r"[+-]?\d+") | (stripped == "")).fillna(True).astype(bool)
+        return stripped.where(ok & (stripped != "")).astype("Int64"), ~ok
+    if typ == "float":
+        out = pd.to_numeric(values, errors="coerce")
+    elif typ == "bool":
+        out = values.str.strip().str.lower().map(_BOOLS).astype("boolean")
+    else:  # timestamp, date
+        out = pd.to_datetime(values, errors="coerce")
+        retry = values.notna() & out.isna()
+        if retry.any():  # formats that differ from the first value's
+            out[retry] = pd.to_datetime(values[retry], errors="coerce", format="mixed")
+    return out, values.notna() & (values.str.strip() != "") & out.isna()
+
+
+def iter_chunks(csv_path: str, types: dict, chunksize: int = CSV_CHUNK_ROWS):
+    """
+    Yield DataFrame chunks converted to the declared types.
+
+    Raises ValueError naming the first value that doesn't fit its column's type
+    (data row numbers start at 1 after the header).
+    """
+    reader = pd.read_csv(csv_path, chunksize=chunksize, dtype="string", usecols=list(types))
+    for chunk in reader:
+        for col, typ in types.items():
+            converted, bad = _convert(chunk[col], typ)
+            if bad.any():
+                row = bad.idxmax()  # read_csv numbers rows across chunks
+                raise ValueError(
+                    f"{os.path.basename(csv_path)}: data row {row + 1}, column {col!r}: "
+                    f"{chunk.at[row, col]!r} is not a valid {typ} "
+                    f"(use --dtypes {col}:text to load the column as text)"
+                )
+            chunk[col] = converted
+        yield chunk
+
+
+def ingest_csv_to_table(csv_path: str, table_name: str = "features", dtypes: dict = None,
+                        key_columns=None, chunksize: int = CSV_CHUNK_ROWS, replace: bool = False):
+    """
+    Stream a CSV into `table_name` with COPY. Returns row count and throughput.
+    replace=True deletes the existing rows first (readers see the old rows until commit).
+    """
+    from psycopg2 import sql
+    types = infer_types(csv_path)
+    unknown = [c for c in (dtypes or {}) if c not in types]
+    if unknown:
+        raise ValueError(f"Declared columns not in CSV: {unknown}")
+    types.update(dtypes or {})
+    key_columns = list(key_columns or [])
+    missing = [c for c in key_columns if c not in types]
+    if missing:
+        raise ValueError(f"Key columns not in CSV: {missing}")
+
+    t0 = time.perf_counter()
+    rows = 0
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        _check_schema(cur, table_name, types)
+        _create_table(cur, table_name, types)
+        if replace:
+            cur.execute(sql.SQL("DELETE FROM {}").format(sql.Identifier(table_name)))
+        copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '')").format(
+            sql.Identifier(table_name),
+            sql.SQL(", ").join(sql.Identifier(c) for c in [*types, "ingested_at"])
+        ).as_string(cur)
+
+        # tz-aware: correct in a timestamptz column, the offset is ignored by a timestamp one
+        ingested_at = pd.Timestamp.now(tz="UTC")
+        for chunk in iter_chunks(csv_path, types, chunksize):
+            chunk["ingested_at"] = ingested_at
+            buf = io.StringIO()
+            chunk.to_csv(buf, index=False, header=False)
+            buf.seek(0)
+            cur.copy_expert(copy_sql, buf)
+            rows += len(chunk)
+
+        _create_indexes(cur, table_name, key_columns)
+        cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table_name)))
+        total = _register(cur, table_name, types, key_columns, csv_path)
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - t0
+    return {"rows": rows, "table": table_name, "table_rows": total,
+            "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed, 1) if elapsed else None}
+
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print("Usage: python ingest_table.py example.csv [table_name]")
-        sys.exit(1)
-    csv = sys.argv[1]
-    table = sys.argv[2] if len(sys.argv) > 2 else "features"
-    print(ingest_csv_to_table(csv, table))
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Stream a CSV into a registered Postgres table")
+    parser.add_argument("csv")
+    parser.add_argument("table", nargs="?", default="features")
+    parser.add_argument("--dtypes", help="explicit column types, e.g. ID:int,Age:float,Gender:text")
+    parser.add_argument("--keys", default="", help="comma-separated key columns to index")
+    parser.add_argument("--chunksize", type=int, default=CSV_CHUNK_ROWS)
+    parser.add_argument("--replace", action="store_true", help="replace the table's rows instead of appending")
+    args = parser.parse_args()
+    print(ingest_csv_to_table(
+        args.csv, args.table,
+        dtypes=parse_dtypes(args.dtypes) if args.dtypes else None,
+        key_columns=[k.strip() for k in args.keys.split(",") if k.strip()],
+        chunksize=args.chunksize,
+        replace=args.replace,
+    ))
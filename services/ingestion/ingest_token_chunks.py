@@ -4,13 +4,37 @@ Improved token-based ingestion with:
 - PII redaction
 - Chunk source labeling
 - Better metadata for RAG accuracy
-- Environment-driven Postgres + Qdrant config
+- Environment-driven Postgres + vector store config
+
+Chunks are written to the vector store picked by VECTOR_BACKEND (Qdrant or
+the embedded local index, see services/vectorstore/base.py); --backend
+overrides it. --no-postgres skips the documents/chunks metadata tables,
+which small/edge deployments may not run.
+
+Files are streamed, so memory stays bounded regardless of document size:
+- a reader from services/ingestion/readers.py yields the text piece by piece
+  (plain text/Markdown, JSONL, HTML; chosen by extension)
+- PII redaction and tokenization run per piece, cut between words
+- stream_chunks() slides the chunk_text() window over the token stream,
+  carrying the overlap from one piece to the next, and records each chunk's
+  character span (chunks.char_start/char_end and the payload)
+- chunks are embedded and upserted in batches of UPSERT_BATCH
+- documents.full_text keeps texts up to FULL_TEXT_INLINE_MAX characters;
+  longer ones are zlib-compressed into a Postgres large object
+  (documents.full_text_oid) instead; read either with iter_full_text()
+
+Usage:
+    python -m services.ingestion.ingest_token_chunks [--backend local] [--no-postgres] [glob]
 """
 
+import codecs
 import os
 import glob
+import tempfile
 import uuid
 import re
+import zlib
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 # ------------------------
@@ -21,10 +45,8 @@ try:
 except Exception:
     pass
 
-import psycopg2
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams, Distance
+from services.ingestion.readers import read_pieces, supported
+from services.vectorstore.base import get_vector_store
 
 # ------------------------
 # Try tiktoken
@@ -40,11 +62,22 @@ except Exception:
 # ------------------------
 # Config
 # ------------------------
-QDRANT_URL = os.getenv("QDRANT_URL", "http://qdrant:6333")
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "agentdesk_docs")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
 CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "500"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+UPSERT_BATCH = 100
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "32"))
+# longer redacted texts are stored compressed out of row instead of in documents.full_text
+FULL_TEXT_INLINE_MAX = int(os.getenv("FULL_TEXT_INLINE_MAX", str(1 << 20)))
+# redacted pieces are at least this long before being cut (between words)
+STREAM_BLOCK_CHARS = int(os.getenv("INGEST_STREAM_BLOCK_CHARS", str(256 * 1024)))
+# text kept back at every cut so PII matches and tokens never straddle it
+_CARRY_CHARS = 256
+
+# Scoping metadata written to every chunk payload (filterable at query time)
+INGEST_TENANT = os.getenv("INGEST_TENANT", "default")
+INGEST_TAGS = [t.strip() for t in os.getenv("INGEST_TAGS", "").split(",") if t.strip()]
 
 PG = dict(
     dbname=os.getenv("POSTGRES_DB", "agentdesk"),
@@ -78,142 +111,377 @@ def decode_tokens(tokens):
         return enc.decode(tokens)
     return " ".join(tokens)
 
+def chunk_text(text: str, chunk_tokens: int = CHUNK_TOKENS, chunk_overlap: int = CHUNK_OVERLAP):
+    """Split text into overlapping token windows. Returns [(chunk_body, token_count)]."""
+    tokens = tokenize_text(text)
+    step = max(1, chunk_tokens - chunk_overlap)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunk_tokens_ = tokens[start:start + chunk_tokens]
+        chunks.append((decode_tokens(chunk_tokens_), len(chunk_tokens_)))
+    return chunks
+
 # ------------------------
-# Init models
+# Streaming (bounded memory)
 # ------------------------
-print("Loading embedding model...")
-embed_model = SentenceTransformer(EMBED_MODEL)
-
-print("Connecting to Qdrant...")
-qdrant = QdrantClient(url=QDRANT_URL, check_compatibility=False)
+def _cut_point(buf: str, keep: int) -> int:
+    """Index of a single space between two words, at least `keep` chars before the end (-1 if none).
+
+    Cutting there gives the same tokens and PII matches as the uncut text: tiktoken
+    attaches the space to the next word, and neither pattern spans a word followed
+    by a space unless digits precede it (phone numbers), which are skipped.
+    """
+    i = buf.rfind(" ", 0, len(buf) - keep)
+    while i > 0:
+        before, after = buf[i - 1], buf[i + 1]
+        if not before.isspace() and not before.isdigit() and not after.isspace():
+            return i
+        i = buf.rfind(" ", 0, i)
+    return -1
+
+
+def redacted_pieces(pieces, block_chars: int = STREAM_BLOCK_CHARS):
+    """redact_pii() over a stream of text pieces, like redact_pii(text.strip()) on the whole text."""
+    buf = ""
+    started = False
+    for piece in pieces:
+        if not started:
+            piece = piece.lstrip()
+            started = bool(piece)
+        buf += piece
+        while len(buf) >= block_chars:
+            cut = _cut_point(buf, _CARRY_CHARS)
+            if cut < 0:
+                if len(buf) < 4 * block_chars:
+                    break
+                cut = len(buf) - _CARRY_CHARS  # no word break in sight: cut anyway
+            yield redact_pii(buf[:cut])
+            buf = buf[cut:]
+    buf = buf.rstrip()
+    if buf:
+        yield redact_pii(buf)
+
+
+def _piece_tokens(piece: str):
+    """(tokens, character offset of each token within the piece), consistent with tokenize_text()."""
+    if TOKTI and enc:
+        tokens = enc.encode(piece, disallowed_special=())
+        return tokens, enc.decode_with_offsets(tokens)[1]
+    return piece.split(), [m.start() for m in _WORD_RE.finditer(piece)]
+
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def stream_chunks(pieces, chunk_tokens: int = CHUNK_TOKENS, chunk_overlap: int = CHUNK_OVERLAP):
+    """chunk_text() as a sliding window over a stream of text pieces.
+
+    Yields (chunk_body, token_count, char_start, char_end); the offsets are positions
+    in the concatenated pieces. Only the current window and one piece of tokens are
+    held, the overlap is carried across pieces.
+    """
+    step = max(1, chunk_tokens - chunk_overlap)
+    tokens, starts = [], []
+    base = 0
+    subword = bool(TOKTI and enc)
+
+    def window(start):
+        body = tokens[start:start + chunk_tokens]
+        last = start + len(body) - 1
+        if not subword:
+            end = starts[last] + len(tokens[last])  # words: the whitespace after them isn't theirs
+        elif last + 1 < len(starts):
+            end = starts[last + 1]  # subword tokens tile the text: a token ends where the next starts
+        else:
+            end = base
+        return decode_tokens(body), len(body), starts[start], end
+
+    for piece in pieces:
+        piece_tokens, offsets = _piece_tokens(piece)
+        tokens.extend(piece_tokens)
+        starts.extend(map(base.__add__, offsets))
+        base += len(piece)
+        start = 0
+        # a full window is only emitted once the token after it is known (its end offset)
+        while len(tokens) - start > chunk_tokens:
+            yield window(start)
+            start += step
+        del tokens[:start], starts[:start]
+
+    start = 0
+    while start < len(tokens):
+        yield window(start)
+        start += step
+
+
+class FullTextSink:
+    """Collects a document's redacted text: inline up to FULL_TEXT_INLINE_MAX characters,
+    beyond that zlib-compressed into a temp file (copied into a large object by store())."""
+
+    def __init__(self, inline_max: int = FULL_TEXT_INLINE_MAX):
+        self.inline_max = inline_max
+        self.chars = 0
+        self._parts = []
+        self._spool = None
+        self._z = None
+
+    def write(self, text: str):
+        self.chars += len(text)
+        if self._spool is not None:
+            self._spool.write(self._z.compress(text.encode("utf-8")))
+            return
+        self._parts.append(text)
+        if self.chars > self.inline_max:
+            self._spool = tempfile.TemporaryFile()
+            self._z = zlib.compressobj(6)
+            for part in self._parts:
+                self._spool.write(self._z.compress(part.encode("utf-8")))
+            self._parts = []
+
+    @property
+    def inline(self):
+        """The full text, or None once it went to the compressed spool."""
+        return None if self._spool is not None else "".join(self._parts)
+
+    def store(self, conn) -> int:
+        """Copy the compressed text into a new large object; returns its OID."""
+        self._spool.write(self._z.flush())
+        self._spool.seek(0)
+        lo = conn.lobject(0, "wb")
+        for block in iter(lambda: self._spool.read(1 << 20), b""):
+            lo.write(block)
+        oid = lo.oid
+        lo.close()
+        return oid
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+
+
+def iter_full_text(conn, source: str, block_bytes: int = 1 << 20):
+    """Yield a stored document's redacted text in pieces (inline or compressed large object)."""
+    cur = conn.cursor()
+    cur.execute("SELECT full_text, full_text_oid FROM documents WHERE source=%s", (source,))
+    row = cur.fetchone()
+    cur.close()
+    if row is None:
+        return
+    if row[1] is None:
+        if row[0]:
+            yield row[0]
+        return
+    z = zlib.decompressobj()
+    utf8 = codecs.getincrementaldecoder("utf-8")()  # characters may straddle blocks
+    lo = conn.lobject(row[1], "rb")
+    try:
+        for block in iter(lambda: lo.read(block_bytes), b""):
+            text = utf8.decode(z.decompress(block))
+            if text:
+                yield text
+        text = utf8.decode(z.flush(), final=True)
+        if text:
+            yield text
+    finally:
+        lo.close()
+
+
+def with_source(filename: str, chunk_body: str) -> str:
+    """Text that gets embedded for a chunk: the body prefixed with its source file."""
+    return f"Source: {filename}\n\n{chunk_body}"
 
 # ------------------------
-# Ensure collection exists
+# Init models / stores
 # ------------------------
-try:
-    existing = [c.name for c in qdrant.get_collections().collections]
-    if COLLECTION_NAME not in existing:
-        qdrant.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(
-                size=embed_model.get_sentence_embedding_dimension(),
-                distance=Distance.COSINE
-            )
-        )
-        print(f"Created collection {COLLECTION_NAME}")
-    else:
-        print(f"Collection {COLLECTION_NAME} exists.")
-except Exception as e:
-    print("Collection check error:", e)
+def load_embed_model(backend: str = None):
+    """Chunk embedding model; backend defaults to EMBED_BACKEND (services/embeddings/backends.py)."""
+    from services.embeddings.backends import load_embedder
+    print("Loading embedding model...")
+    return load_embedder(backend, EMBED_MODEL)
+
+def prepare_store(store, dim: int):
+    """Ensure the collection and its payload indexes exist."""
+    try:
+        store.ensure_collection(COLLECTION_NAME, dim)
+        print(f"Collection {COLLECTION_NAME} ready.")
+    except Exception as e:
+        print("Collection check error:", e)
+
+    # payload indexes back the filters accepted by /retrieve and /query
+    store.ensure_payload_indexes(COLLECTION_NAME)
 
 # ------------------------
 # Postgres
 # ------------------------
-print("Connecting to Postgres...")
-conn = psycopg2.connect(**PG)
-cur = conn.cursor()
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS documents (
-    id SERIAL PRIMARY KEY,
-    source TEXT,
-    full_text TEXT,
-    inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS chunks (
-    id SERIAL PRIMARY KEY,
-    doc_id TEXT,
-    chunk_id INTEGER,
-    text TEXT,
-    token_count INTEGER,
-    char_start INTEGER,
-    char_end INTEGER,
-    inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-""")
-
-conn.commit()
+def connect_postgres():
+    import psycopg2
+    print("Connecting to Postgres...")
+    conn = psycopg2.connect(**PG)
+    cur = conn.cursor()
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS documents (
+        id SERIAL PRIMARY KEY,
+        source TEXT,
+        full_text TEXT,
+        inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    # long documents: compressed text in a large object instead of full_text
+    cur.execute("""
+    ALTER TABLE documents
+        ADD COLUMN IF NOT EXISTS full_text_oid OID,
+        ADD COLUMN IF NOT EXISTS full_text_chars BIGINT
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS chunks (
+        id SERIAL PRIMARY KEY,
+        doc_id TEXT,
+        chunk_id INTEGER,
+        text TEXT,
+        token_count INTEGER,
+        char_start INTEGER,
+        char_end INTEGER,
+        inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    conn.commit()
+    cur.close()
+    return conn
 
 # ------------------------
 # Ingest Files
 # ------------------------
-files = sorted(glob.glob("sample_docs/*.md"))
-print(f"Found {len(files)} markdown files.")
-
-for fpath in files:
-    with open(fpath, "r", encoding="utf-8") as f:
-        raw_text = f.read().strip()
-
-    redacted_text = redact_pii(raw_text)
+def ingest_file(fpath: str, embed_model, store, conn=None) -> int:
+    """Stream one file: read, redact, chunk, embed and upsert. Returns the number of chunks."""
     filename = os.path.basename(fpath)
-
-    # Store document
-    cur.execute("SELECT id FROM documents WHERE source=%s", (filename,))
-    row = cur.fetchone()
-
-    if row:
-        doc_db_id = row[0]
-    else:
-        cur.execute(
-            "INSERT INTO documents (source, full_text) VALUES (%s,%s) RETURNING id",
-            (filename, redacted_text)
-        )
-        doc_db_id = cur.fetchone()[0]
+    ingested_at = datetime.now(timezone.utc).isoformat()
+    cur = conn.cursor() if conn is not None else None
+    doc_row = None
+
+    # Re-ingesting replaces the document's chunk rows (its text is replaced at the end)
+    if cur is not None:
+        cur.execute("SELECT id FROM documents WHERE source=%s", (filename,))
+        row = cur.fetchone()
+        if not row:
+            cur.execute("INSERT INTO documents (source) VALUES (%s) RETURNING id", (filename,))
+            row = cur.fetchone()
+        doc_row = row[0]
+        cur.execute("DELETE FROM chunks WHERE doc_id=%s", (filename,))
         conn.commit()
 
     print(f"Ingesting {filename}")
 
-    tokens = tokenize_text(redacted_text)
-    total_tokens = len(tokens)
-
-    step = CHUNK_TOKENS - CHUNK_OVERLAP
-    points = []
+    full_text = FullTextSink() if cur is not None else None
+    pending = []
+    point_ids = []
     chunk_id = 0
 
-    for start in range(0, total_tokens, step):
-        chunk_tokens = tokens[start:start + CHUNK_TOKENS]
-        chunk_body = decode_tokens(chunk_tokens)
+    def pieces():
+        for piece in redacted_pieces(read_pieces(fpath)):
+            if full_text is not None:
+                full_text.write(piece)
+            yield piece
 
+    def flush():
         # ⭐ Add document context
-        chunk_text = f"Source: {filename}\n\n{chunk_body}"
-
-        embedding = embed_model.encode(chunk_text).tolist()
+        vectors = embed_model.encode([with_source(filename, c[1]) for c in pending], batch_size=EMBED_BATCH_SIZE)
+        points = []
+        for (cid, chunk_body, token_count, char_start, char_end), vector in zip(pending, vectors):
+            payload = {
+                "doc_id": filename,
+                "chunk_id": cid,
+                "source": filename,
+                "tenant": INGEST_TENANT,
+                "tags": INGEST_TAGS,
+                "ingested_at": ingested_at,
+                "token_count": token_count,
+                "char_start": char_start,
+                "char_end": char_end,
+                "text": chunk_body
+            }
+            points.append({
+                # stable per (document, chunk) so re-ingesting or retrying overwrites instead of duplicating
+                "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{filename}#{cid}")),
+                "vector": vector.tolist(),
+                "payload": payload
+            })
+        store.upsert(COLLECTION_NAME, points)
+        point_ids.extend(p["id"] for p in points)
+        if cur is not None:
+            from psycopg2.extras import execute_values
+            execute_values(
+                cur,
+                "INSERT INTO chunks (doc_id, chunk_id, text, token_count, char_start, char_end) VALUES %s",
+                [(filename, *c) for c in pending]
+            )
+            conn.commit()
+        pending.clear()
+
+    try:
+        for chunk_body, token_count, char_start, char_end in stream_chunks(pieces()):
+            pending.append((chunk_id, chunk_body, token_count, char_start, char_end))
+            chunk_id += 1
+            if len(pending) >= UPSERT_BATCH:
+                flush()
+        if pending:
+            flush()
+        # drop every other point of the document: the tail of a longer old version and points
+        # written with random ids before they were derived from (document, chunk)
+        store.delete_by_doc(COLLECTION_NAME, filename, keep_ids=point_ids)
+
+        if cur is not None:
+            # drop the previous version's large object, then store the text inline or compressed
+            cur.execute("SELECT lo_unlink(full_text_oid) FROM documents WHERE id=%s AND full_text_oid IS NOT NULL",
+                        (doc_row,))
+            inline = full_text.inline
+            oid = full_text.store(conn) if inline is None else None
+            cur.execute(
+                "UPDATE documents SET full_text=%s, full_text_oid=%s, full_text_chars=%s WHERE id=%s",
+                (inline, oid, full_text.chars, doc_row)
+            )
+            conn.commit()
+    finally:
+        if full_text is not None:
+            full_text.close()
+        if cur is not None:
+            cur.close()
 
-        payload = {
-            "doc_id": filename,
-            "chunk_id": chunk_id,
-            "source": filename,
-            "text": chunk_body
-        }
+    print(f"Finished {filename} ({chunk_id} chunks)")
+    return chunk_id
 
-        points.append({
-            "id": str(uuid.uuid4()),
-            "vector": embedding,
-            "payload": payload
-        })
 
-        cur.execute(
-            "INSERT INTO chunks (doc_id, chunk_id, text, token_count, char_start, char_end) VALUES (%s,%s,%s,%s,%s,%s)",
-            (filename, chunk_id, chunk_body, len(chunk_tokens), 0, 0)
-        )
+def main(pattern: str = "sample_docs/*.md", backend: str = None, use_postgres: bool = True,
+         embed_backend: str = None):
+    embed_model = load_embed_model(embed_backend)
+    store = get_vector_store(backend)
+    prepare_store(store, embed_model.get_sentence_embedding_dimension())
+    conn = connect_postgres() if use_postgres else None
 
-        chunk_id += 1
+    files = sorted(glob.glob(pattern))
+    skipped = [f for f in files if not supported(f)]
+    files = [f for f in files if supported(f)]
+    print(f"Found {len(files)} files." + (f" Skipping {len(skipped)} without a reader." if skipped else ""))
 
-        if len(points) >= 100:
-            qdrant.upsert(collection_name=COLLECTION_NAME, points=points)
-            points = []
-            conn.commit()
+    for fpath in files:
+        ingest_file(fpath, embed_model, store, conn)
 
-    if points:
-        qdrant.upsert(collection_name=COLLECTION_NAME, points=points)
-        conn.commit()
+    print("✅ Ingestion complete.")
 
-    print(f"Finished {filename} ({chunk_id} chunks)")
+    if conn is not None:
+        conn.close()
 
-print("✅ Ingestion complete.")
 
-cur.close()
-conn.close()
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Token-chunk ingestion into the vector store")
+    parser.add_argument("pattern", nargs="?", default="sample_docs/*.md")
+    parser.add_argument("--backend", choices=["qdrant", "local"], default=None,
+                        help="vector store backend (default: VECTOR_BACKEND)")
+    parser.add_argument("--no-postgres", action="store_true", help="skip Postgres metadata tables")
+    parser.add_argument("--embed-backend", choices=["torch", "torch-int8", "onnx", "onnx-int8"], default=None,
+                        help="embedding backend (default: EMBED_BACKEND)")
+    args = parser.parse_args()
+    main(args.pattern, backend=args.backend, use_postgres=not args.no_postgres, embed_backend=args.embed_backend)
@@ -0,0 +1,167 @@
+# services/ingestion/readers.py
+"""
+Pluggable document readers for token-chunk ingestion.
+
+A reader turns one file into its text as a stream of pieces (str), in order,
+without ever holding the whole document, so ingestion memory is bounded by
+the piece size (INGEST_READ_BLOCK_CHARS) and not by the file size.
+
+Built-in readers (picked by file extension):
+- TextReader   .txt .md .markdown .rst .log   fixed-size blocks of the file
+- JsonlReader  .jsonl .ndjson                 one record at a time; the text is
+               the record's JSONL_TEXT_FIELDS joined by newlines (the whole
+               record as JSON if none is present), records separated by a
+               blank line; malformed lines are skipped and counted
+- HtmlReader   .html .htm                     visible text via the stdlib HTML
+               parser fed block by block; script/style are dropped and block
+               elements become line breaks
+
+Undecodable bytes are replaced rather than failing the whole file.
+
+Add a format by subclassing DocumentReader and calling register_reader().
+"""
+import json
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterator
+
+READ_BLOCK_CHARS = int(os.getenv("INGEST_READ_BLOCK_CHARS", str(256 * 1024)))
+JSONL_TEXT_FIELDS = [f.strip() for f in os.getenv(
+    "JSONL_TEXT_FIELDS", "title,subject,text,body,content,message,description").split(",") if f.strip()]
+
+
+class DocumentReader:
+    """Yields a document's text as a sequence of pieces."""
+
+    extensions = ()
+
+    def read(self, path: str) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class TextReader(DocumentReader):
+    extensions = (".txt", ".md", ".markdown", ".rst", ".log")
+
+    def read(self, path: str) -> Iterator[str]:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for block in iter(lambda: f.read(READ_BLOCK_CHARS), ""):
+                yield block
+
+
+class JsonlReader(DocumentReader):
+    extensions = (".jsonl", ".ndjson")
+
+    def __init__(self, fields=None):
+        self.fields = fields or JSONL_TEXT_FIELDS
+
+    def record_text(self, record) -> str:
+        if isinstance(record, dict):
+            parts = [str(record[f]) for f in self.fields if isinstance(record.get(f), (str, int, float))]
+            if parts:
+                return "\n".join(parts)
+        elif isinstance(record, str):
+            return record
+        return json.dumps(record, ensure_ascii=False)
+
+    def read(self, path: str) -> Iterator[str]:
+        skipped = 0
+        first = True
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    text = self.record_text(json.loads(line))
+                except json.JSONDecodeError:
+                    skipped += 1
+                    continue
+                yield text if first else "\n\n" + text
+                first = False
+        if skipped:
+            print(f"{os.path.basename(path)}: skipped {skipped} malformed JSONL lines")
+
+
+class _TextExtractor(HTMLParser):
+    SKIP = {"script", "style", "noscript", "template", "svg"}
+    BLOCK = {"p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article", "header", "footer",
+             "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "title", "hr", "dt", "dd"}
+    _SPACES = re.compile(r"\s+")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self._skip = 0
+        self._pre = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag == "pre":
+            self._pre += 1
+        if tag in self.BLOCK:
+            self.out.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "pre":
+            self._pre = max(0, self._pre - 1)
+        if tag in self.BLOCK:
+            self.out.append("\n")
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        self.out.append(data if self._pre else self._SPACES.sub(" ", data))
+
+    def take(self) -> str:
+        text = "".join(self.out)
+        self.out = []
+        return text
+
+
+class HtmlReader(DocumentReader):
+    extensions = (".html", ".htm")
+
+    def read(self, path: str) -> Iterator[str]:
+        parser = _TextExtractor()
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for block in iter(lambda: f.read(READ_BLOCK_CHARS), ""):
+                parser.feed(block)
+                text = parser.take()
+                if text:
+                    yield text
+        parser.close()
+        text = parser.take()
+        if text:
+            yield text
+
+
+READERS: Dict[str, DocumentReader] = {}
+
+
+def register_reader(reader: DocumentReader, extensions=None):
+    """Use `reader` for the given extensions (default: reader.extensions)."""
+    for ext in extensions or reader.extensions:
+        READERS[ext.lower()] = reader
+
+
+for _reader in (TextReader(), JsonlReader(), HtmlReader()):
+    register_reader(_reader)
+
+
+def supported(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in READERS
+
+
+def get_reader(path: str) -> DocumentReader:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"No document reader for {ext or 'files without an extension'} ({path})")
+    return READERS[ext]
+
+
+def read_pieces(path: str) -> Iterator[str]:
+    """The document's text as pieces, via the reader registered for its extension."""
+    return get_reader(path).read(path)
@@ -0,0 +1,128 @@
+# services/models/registry.py
+"""
+Process-wide registry of the heavy models the services share.
+
+Every model is a named component:
+- embed:    query/chunk embedding model (EMBED_BACKEND, see services/embeddings/backends.py)
+- reranker: CrossEncoder used by retrieval
+- clip:     CLIP ViT-B/32 used by the image endpoints
+
+get_model() loads a component once per process (concurrent callers wait for
+the first loader) and runs a dummy forward pass on it, so the first real
+request does not pay for lazy kernel/allocator setup. status() reports the
+per-component load state.
+
+This module knows nothing about the API: the API's warm-up and readiness
+(services/api/warmup.py) and the RAG layer (services/rag/rag_runner.py) both
+load their models through it, so they share one copy.
+"""
+import os
+import threading
+import time
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+CLIP_MODEL = "ViT-B/32"
+CLIP_DIR = os.path.join(os.getcwd(), "models", "clip")
+
+COMPONENTS = ("embed", "reranker", "clip")
+
+_lock = threading.Lock()
+_models = {}
+_events = {name: threading.Event() for name in COMPONENTS}
+_status = {name: {"state": "pending", "seconds": None, "error": None} for name in COMPONENTS}
+
+try:
+    from prometheus_client import Gauge
+    _load_seconds = Gauge("agentdesk_model_load_seconds", "Load + warm-up time per model component", ["component"])
+    _component_ready = Gauge("agentdesk_component_ready", "1 when a model component is loaded and warm", ["component"])
+except Exception:
+    _load_seconds = _component_ready = None
+
+
+# -------------------------
+# Loaders (each returns the warmed model)
+# -------------------------
+def _load_embed():
+    from services.embeddings.backends import load_embedder
+    model = load_embedder(model_name=EMBED_MODEL)
+    model.encode(["warm-up query"])
+    return model
+
+
+def _load_reranker():
+    from sentence_transformers import CrossEncoder
+    model = CrossEncoder(RERANKER_MODEL)
+    model.predict([("warm-up query", "warm-up passage")])
+    return model
+
+
+def _load_clip():
+    from services.vision import clip_embed
+    clip_embed.embed_texts(["warm-up"])
+    return clip_embed
+
+
+LOADERS = {
+    "embed": _load_embed,
+    "reranker": _load_reranker,
+    "clip": _load_clip,
+}
+
+
+def ensure(name: str):
+    """Load a component once; concurrent callers wait for the first loader."""
+    with _lock:
+        owner = _status[name]["state"] == "pending"
+        if owner:
+            _status[name]["state"] = "loading"
+    if not owner:
+        _events[name].wait()
+        return
+
+    t0 = time.perf_counter()
+    try:
+        _models[name] = LOADERS[name]()
+        _status[name]["state"] = "ready"
+    except Exception as e:
+        _status[name]["state"] = "failed"
+        _status[name]["error"] = str(e)
+        print(f"Model component {name} failed to load:", e)
+    finally:
+        elapsed = time.perf_counter() - t0
+        _status[name]["seconds"] = round(elapsed, 3)
+        if _load_seconds is not None:
+            _load_seconds.labels(component=name).set(elapsed)
+            _component_ready.labels(component=name).set(1 if _status[name]["state"] == "ready" else 0)
+        _events[name].set()
+
+
+def get_model(name: str):
+    """Return a loaded component (None if it failed to load)."""
+    ensure(name)
+    return _models.get(name)
+
+
+def status() -> dict:
+    """Copy of the per-component load state."""
+    return {name: dict(info) for name, info in _status.items()}
+
+
+# -------------------------
+# Build-time artifact download
+# -------------------------
+def download_artifacts():
+    """Fetch every model artifact into the local caches (used by the Dockerfile)."""
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+    print("Caching", EMBED_MODEL)
+    SentenceTransformer(EMBED_MODEL)
+    print("Caching", RERANKER_MODEL)
+    CrossEncoder(RERANKER_MODEL)
+    try:
+        import clip
+        os.makedirs(CLIP_DIR, exist_ok=True)
+        print("Caching CLIP", CLIP_MODEL, "->", CLIP_DIR)
+        # clip saves ViT-B/32 as models/clip/ViT-B-32.pt, which clip_embed loads first
+        clip.load(CLIP_MODEL, device="cpu", download_root=CLIP_DIR)
+    except Exception as e:
+        print("CLIP not cached:", e)
@@ -0,0 +1,119 @@
+# services/rag/filters.py
+"""
+Structured retrieval filters shared by the API and the RAG runner.
+
+Filters are plain dicts with any of:
+- doc_id / source: a value or a list of values (match any)
+- tenant: a single tenant id
+- tags: a list of tags (chunk matches if it carries any of them)
+- date_from / date_to: bounds on the chunk's ingested_at timestamp
+
+They are pushed down to Qdrant as payload filters. Ingestion creates payload
+indexes for the same fields (PAYLOAD_INDEXES, via the vector store's
+ensure_payload_indexes) so filtered search does not degrade into a full scan
+as the collection grows. payload_matches applies the same semantics
+in-process for the embedded vector store.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from qdrant_client.http import models
+
+# payload field -> index schema created at ingest time
+PAYLOAD_INDEXES = {
+    "doc_id": models.PayloadSchemaType.KEYWORD,
+    "source": models.PayloadSchemaType.KEYWORD,
+    "tenant": models.PayloadSchemaType.KEYWORD,
+    "tags": models.PayloadSchemaType.KEYWORD,
+    "ingested_at": models.PayloadSchemaType.DATETIME,
+}
+
+DATE_FIELD = "ingested_at"
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [v for v in value if v is not None and v != ""]
+    return [value] if value != "" else []
+
+
+def _match(key: str, values: list) -> models.FieldCondition:
+    if len(values) == 1:
+        return models.FieldCondition(key=key, match=models.MatchValue(value=values[0]))
+    return models.FieldCondition(key=key, match=models.MatchAny(any=values))
+
+
+def build_filter(filters: Optional[dict]) -> Optional[models.Filter]:
+    """Translate a filter dict into a Qdrant Filter. Returns None when nothing is set."""
+    if not filters:
+        return None
+
+    must = []
+    for key in ("doc_id", "source", "tenant", "tags"):
+        values = _as_list(filters.get(key))
+        if values:
+            must.append(_match(key, values))
+
+    date_from = filters.get("date_from")
+    date_to = filters.get("date_to")
+    if date_from is not None or date_to is not None:
+        must.append(models.FieldCondition(
+            key=DATE_FIELD,
+            range=models.DatetimeRange(gte=date_from, lte=date_to)
+        ))
+
+    if not must:
+        return None
+    return models.Filter(must=must)
+
+
+# -------------------------
+# In-process evaluation (embedded vector store)
+# -------------------------
+def _to_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def keyword_conditions(filters: Optional[dict]) -> dict:
+    """The match-any conditions of a filter dict as {field: [values]}."""
+    if not filters:
+        return {}
+    out = {}
+    for key in ("doc_id", "source", "tenant", "tags"):
+        values = _as_list(filters.get(key))
+        if values:
+            out[key] = values
+    return out
+
+
+def payload_matches(payload: dict, filters: Optional[dict]) -> bool:
+    """Evaluate a filter dict against one payload, with the same semantics as build_filter."""
+    if not filters:
+        return True
+    for key, values in keyword_conditions(filters).items():
+        have = _as_list(payload.get(key))
+        if not set(have) & set(values):
+            return False
+
+    date_from = _to_datetime(filters.get("date_from"))
+    date_to = _to_datetime(filters.get("date_to"))
+    if date_from is not None or date_to is not None:
+        try:
+            ts = _to_datetime(payload.get(DATE_FIELD))
+        except ValueError:
+            return False
+        if ts is None:
+            return False
+        if date_from is not None and ts < date_from:
+            return False
+        if date_to is not None and ts > date_to:
+            return False
+    return True
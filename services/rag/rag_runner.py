@@ -1,35 +1,27 @@
 # services/rag/rag_runner.py
 import os, requests, json
 from typing import List, Dict
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
+from services.vectorstore.base import get_vector_store
+from services.rag.retrieval import retrieve
+from services.models import registry
 
 # optional LLMs
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 HF_KEY = os.getenv("HUGGINGFACE_API_KEY")
 
-# fallback local HF model
-try:
-    from transformers import pipeline
-    HF_PIPE = None
-except Exception:
-    HF_PIPE = None
+# fallback local HF model (not configured by default; importing transformers
+# here only cost startup time, so it is left to whoever wires up a pipeline)
+HF_PIPE = None
 
-EMBED_MODEL = "all-MiniLM-L6-v2"
-embed_model = SentenceTransformer(EMBED_MODEL)
-QDRANT_URL = os.getenv("QDRANT_URL", "http://qdrant:6333")
-qdrant = QdrantClient(url=QDRANT_URL, check_compatibility=False)
+# embedding model is shared with the API process (loaded once by services/models/registry.py)
+store = get_vector_store()
 COLLECTION = "agentdesk_docs"
 
-def retrieve_docs(query: str, top_k: int = 5):
-    qvec = embed_model.encode(query).tolist()
-    # don't pass vector_name if your qdrant-client version doesn't accept it
-    hits = qdrant.search(
-        collection_name=COLLECTION,
-        query_vector=qvec,
-        limit=50
-    )
-    return hits[:top_k]
+def retrieve_docs(query: str, top_k: int = 5, filters: dict = None):
+    embed_model = registry.get_model("embed")
+    if embed_model is None:
+        raise RuntimeError("Embedding model not available")
+    return retrieve(query, embed_model, store, COLLECTION, top_k=top_k, coarse_limit=50, filters=filters)
 
 def build_prompt(query: str, hits) -> str:
     context = []
@@ -134,9 +126,9 @@ def call_llm(prompt: str, max_tokens: int = 256):
     # 3) nothing configured
     raise RuntimeError("No LLM configured. Set HUGGINGFACE_API_KEY or OPENAI_API_KEY or install local HF_PIPE.")
 
-def answer_query(query: str, top_k: int = 5):
+def answer_query(query: str, top_k: int = 5, filters: dict = None):
     print("Received query:", query)
-    hits = retrieve_docs(query, top_k=top_k)
+    hits = retrieve_docs(query, top_k=top_k, filters=filters)
     print(f"Retrieved {len(hits)} hits from Qdrant")
     prompt = build_prompt(query, hits)
     print("Built prompt")
@@ -0,0 +1,48 @@
+# services/rag/retrieval.py
+"""
+The retrieval pipeline shared by /retrieve, retrieve_docs() and the offline
+evaluation harness (services/eval/retrieval_eval.py):
+
+    embed query -> coarse vector search (coarse_limit) -> optional rerank -> top_k
+
+Pass a `timings` dict to get per-stage wall time added to it in milliseconds
+(keys: embed_ms, search_ms, rerank_ms).
+"""
+import time
+from typing import List, Optional
+
+
+def order_by_scores(coarse, scores, top_k: int) -> list:
+    """Top_k coarse hits, ordered by reranker scores when given."""
+    if scores is None:
+        return list(coarse[:top_k])
+    scored = [(float(s), it) for it, s in zip(coarse, scores)]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [it for _, it in scored[:top_k]]
+
+
+def _add(timings: Optional[dict], key: str, started: float):
+    if timings is not None:
+        timings[key] = timings.get(key, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def retrieve(query: str, embed_model, store, collection: str, top_k: int, coarse_limit: int,
+             filters: Optional[dict] = None, reranker=None, ef: Optional[int] = None,
+             timings: Optional[dict] = None) -> List:
+    """Run the pipeline for one query. Returns store hits (.id, .score, .payload)."""
+    t0 = time.perf_counter()
+    qvec = embed_model.encode(query).tolist()
+    _add(timings, "embed_ms", t0)
+
+    t0 = time.perf_counter()
+    coarse = store.search(collection, qvec, limit=coarse_limit, filters=filters, ef=ef)
+    _add(timings, "search_ms", t0)
+
+    scores = None
+    if reranker is not None and len(coarse) > 0:
+        t0 = time.perf_counter()
+        pairs = [(query, item.payload.get("text", "")) for item in coarse]
+        scores = reranker.predict(pairs)  # higher -> more relevant
+        _add(timings, "rerank_ms", t0)
+
+    return order_by_scores(coarse, scores, top_k)
@@ -0,0 +1,176 @@
+# services/tools/table_tool.py
+"""
+Structured-data tool: aggregate queries over tables registered by
+services/ingestion/ingest_table.py.
+
+Only tables and columns listed in `table_registry` can be referenced; they are
+quoted as identifiers and every value is passed as a query parameter, so the
+SQL is never built from raw user text.
+
+query_table args:
+- table:    registered table name
+- metric:   count | sum | avg | min | max (default count)
+- column:   column to aggregate (not needed for count)
+- group_by: column or list of columns
+- filters:  {column: value | [values] | {"gte": x, "lte": y}}
+- order:    "desc" | "asc" by the metric (default desc)
+- limit:    max groups returned (default 50, capped at 1000)
+
+Decimals come back as floats, dates and timestamps as ISO strings. Database
+errors (statement timeout, a filter value of the wrong type, no registry yet)
+raise TableQueryError, a ValueError, so callers report them like bad arguments.
+"""
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from dotenv import load_dotenv
+
+# load .env if available (dev convenience)
+try:
+    load_dotenv()
+except Exception:
+    pass
+
+import psycopg2
+from psycopg2 import sql
+
+PG = dict(
+    dbname=os.getenv("POSTGRES_DB", "agentdesk"),
+    user=os.getenv("POSTGRES_USER", "agentdesk"),
+    password=os.getenv("POSTGRES_PASSWORD", "example"),
+    host=os.getenv("POSTGRES_HOST", "localhost"),
+    port=int(os.getenv("POSTGRES_PORT", "5432")),
+)
+
+METRICS = {"count", "sum", "avg", "min", "max"}
+NUMERIC_TYPES = {"int", "float"}
+MAX_LIMIT = 1000
+STATEMENT_TIMEOUT_MS = int(os.getenv("TABLE_TOOL_TIMEOUT_MS", "5000"))
+
+
+class TableQueryError(ValueError):
+    """Postgres rejected or aborted the query."""
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _load_registry(cur, table: str) -> dict:
+    cur.execute("SELECT columns FROM table_registry WHERE table_name=%s", (table,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"Unknown table: {table}")
+    columns = row[0]
+    return json.loads(columns) if isinstance(columns, str) else columns
+
+
+def _check_column(columns: dict, col: str) -> str:
+    if col not in columns:
+        raise ValueError(f"Unknown column: {col}")
+    return col
+
+
+def _where(columns: dict, filters: dict):
+    clauses, params = [], []
+    for col, cond in (filters or {}).items():
+        ident = sql.Identifier(_check_column(columns, col))
+        if isinstance(cond, dict):
+            for op, symbol in (("gte", ">="), ("gt", ">"), ("lte", "<="), ("lt", "<")):
+                if op in cond:
+                    clauses.append(sql.SQL("{} " + symbol + " %s").format(ident))
+                    params.append(cond[op])
+        elif isinstance(cond, list):
+            clauses.append(sql.SQL("{} = ANY(%s)").format(ident))
+            params.append(cond)
+        else:
+            clauses.append(sql.SQL("{} = %s").format(ident))
+            params.append(cond)
+    if not clauses:
+        return sql.SQL(""), params
+    return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(clauses), params
+
+
+def build_query(columns: dict, args: dict):
+    """Compose the parameterized aggregate query. Returns (sql.Composed, params, group_cols)."""
+    table = args["table"]
+    metric = args.get("metric", "count").lower()
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+
+    if metric == "count" and not args.get("column"):
+        agg = sql.SQL("count(*)")
+    else:
+        col = _check_column(columns, args.get("column") or "")
+        if metric in ("sum", "avg") and columns[col] not in NUMERIC_TYPES:
+            raise ValueError(f"{metric} needs a numeric column, {col} is {columns[col]}")
+        agg = sql.SQL("{}({})").format(sql.SQL(metric), sql.Identifier(col))
+
+    group_by = args.get("group_by") or []
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    group_cols = [_check_column(columns, c) for c in group_by]
+
+    where, params = _where(columns, args.get("filters"))
+    select = [sql.Identifier(c) for c in group_cols] + [agg + sql.SQL(" AS value")]
+    query = sql.SQL("SELECT {} FROM {}").format(sql.SQL(", ").join(select), sql.Identifier(table)) + where
+
+    if group_cols:
+        order = sql.SQL("ASC") if str(args.get("order", "desc")).lower() == "asc" else sql.SQL("DESC")
+        limit = max(1, min(int(args.get("limit", 50)), MAX_LIMIT))
+        query += sql.SQL(" GROUP BY {} ORDER BY value {} LIMIT %s").format(
+            sql.SQL(", ").join(sql.Identifier(c) for c in group_cols), order)
+        params.append(limit)
+    return query, params, group_cols
+
+
+def query_table(args: dict):
+    table = args.get("table")
+    if not table:
+        raise ValueError("table is required")
+    try:
+        conn = psycopg2.connect(**PG)
+        try:
+            conn.set_session(readonly=True)
+            cur = conn.cursor()
+            cur.execute("SET statement_timeout = %s", (STATEMENT_TIMEOUT_MS,))
+            columns = _load_registry(cur, table)
+            query, params, group_cols = build_query(columns, args)
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            cur.close()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        raise TableQueryError(f"Query on {table} failed: {str(e).strip()}") from e
+
+    results = []
+    for row in rows:
+        item = {c: _jsonable(v) for c, v in zip(group_cols, row[:-1])}
+        item["value"] = _jsonable(row[-1])
+        results.append(item)
+    return {"table": table, "metric": args.get("metric", "count"), "column": args.get("column"),
+            "group_by": group_cols, "rows": results}
+
+
+def list_tables():
+    conn = psycopg2.connect(**PG)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT table_name, columns, key_columns, row_count FROM table_registry ORDER BY table_name")
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    return [
+        {"table": t, "columns": c if isinstance(c, dict) else json.loads(c),
+         "key_columns": k if isinstance(k, list) else json.loads(k), "row_count": n}
+        for t, c, k, n in rows
+    ]
@@ -1,9 +1,40 @@
 # services/tools/ticket_tool.py
 """
-Small tool to create a ticket in Postgres.
+Ticket tool with a write-behind queue.
+
+create_ticket() never waits on Postgres: the ticket ID is generated and
+returned immediately with status "queued", and a background flusher inserts
+tickets in multi-row batches over its own connection.
+
+- a batch is flushed when TICKET_BATCH_SIZE tickets are waiting or every
+  TICKET_FLUSH_INTERVAL seconds, whichever comes first
+- every ticket is appended to a journal segment under TICKET_SPOOL_DIR and
+  fsync()ed before it is acknowledged (TICKET_FSYNC=1, the default), so an
+  accepted ticket survives an OS or host crash, not just a process crash.
+  Concurrent submits share one fsync (group commit). The spool must be on
+  persistent storage (a volume, EFS on Fargate) to survive a task replacement;
+  a segment is deleted once all of its tickets are
+  committed, so after a crash or restart the leftover segments are replayed
+  (inserts use ON CONFLICT (ticket_id) DO NOTHING, replays are idempotent)
+- segments are flock()ed by the process that owns them, so with several
+  workers sharing the spool directory only orphaned segments get replayed
+- if Postgres is down, batches are retried with backoff and stay journaled
+- status lookups answer from memory and the spool before asking Postgres, and
+  connect with a short timeout (TICKET_CONNECT_TIMEOUT); while Postgres is
+  unreachable they raise TicketStoreUnavailable instead of blocking
+- lookups share a pool of TICKET_POOL_MAX connections and wait at most
+  TICKET_POOL_WAIT seconds for one; the flusher has a dedicated connection,
+  so status polling never starves inserts, and a busy pool is not an outage
+- the tickets DDL runs once per process, not per ticket
+
 Reads Postgres connection info from environment for safety.
 """
+import fcntl
+import glob
+import json
 import os
+import threading
+import time
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
@@ -15,6 +46,8 @@ except Exception:
     pass
 
 import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import execute_values
 
 PG = dict(
     dbname=os.getenv("POSTGRES_DB", "agentdesk"),
@@ -22,29 +55,452 @@ PG = dict(
     password=os.getenv("POSTGRES_PASSWORD", "example"),
     host=os.getenv("POSTGRES_HOST", "localhost"),
     port=int(os.getenv("POSTGRES_PORT", "5432")),
+    connect_timeout=int(os.getenv("TICKET_CONNECT_TIMEOUT", "2")),
 )
 
+SPOOL_DIR = os.getenv("TICKET_SPOOL_DIR", "./data/ticket_spool")
+BATCH_SIZE = int(os.getenv("TICKET_BATCH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.getenv("TICKET_FLUSH_INTERVAL", "0.5"))
+POOL_MAX = int(os.getenv("TICKET_POOL_MAX", "4"))
+POOL_WAIT = float(os.getenv("TICKET_POOL_WAIT", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("TICKET_RETRY_MAX_SECONDS", "30"))
+FSYNC = os.getenv("TICKET_FSYNC", "1").lower() in ("1", "true", "yes")
+# after a failed connect, status lookups skip Postgres for this long
+STATUS_DB_BACKOFF = float(os.getenv("TICKET_STATUS_DB_BACKOFF", "5"))
+
+TICKETS_DDL = """
+  CREATE TABLE IF NOT EXISTS tickets (
+    id SERIAL PRIMARY KEY,
+    ticket_id TEXT,
+    title TEXT,
+    description TEXT,
+    priority TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+  );
+  CREATE UNIQUE INDEX IF NOT EXISTS tickets_ticket_id_key ON tickets (ticket_id);
+"""
+
+COLUMNS = ("ticket_id", "title", "description", "priority", "created_at")
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+    _queued = Gauge("agentdesk_ticket_queue_depth", "Tickets accepted but not yet committed to Postgres")
+    _flushed = Counter("agentdesk_tickets_flushed_total", "Tickets committed to Postgres by the flusher")
+    _flush_errors = Counter("agentdesk_ticket_flush_errors_total", "Failed ticket batch inserts")
+    _replayed = Counter("agentdesk_tickets_replayed_total", "Tickets replayed from orphaned spool segments")
+    _batch_size = Histogram("agentdesk_ticket_batch_size", "Tickets per flushed batch",
+                            buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000))
+except Exception:
+    _queued = _flushed = _flush_errors = _replayed = _batch_size = None
+
+
+class TicketStoreUnavailable(Exception):
+    """The ticket is not queued locally and Postgres cannot be reached to look it up."""
+
+
+class _Segment:
+    """One journal file. Stays open (and locked) until all its tickets are committed."""
+
+    def __init__(self, path: str, f, pending: int = 0):
+        self.path = path
+        self.file = f
+        self.pending = pending
+        self.closed = False
+
+
+class TicketWriter:
+    def __init__(self, spool_dir: str = SPOOL_DIR, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, pool_max: int = POOL_MAX, pg: dict = None,
+                 fsync: bool = FSYNC):
+        self.spool_dir = spool_dir
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pool_max = pool_max
+        self.pg = pg or PG
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._queue = []          # [(segment, row)]
+        self._pending = {}        # ticket_id -> row, for status lookups
+        self._segment = None
+        self._seq = 0
+        self._pool = None         # status lookups
+        self._pool_lock = threading.Lock()
+        self._pool_slots = threading.BoundedSemaphore(pool_max)
+        self._flush_conn = None   # flusher only
+        self._schema_ready = False
+        self._thread = None
+        self._sync_lock = threading.Lock()
+        self._written = 0         # journal lines written
+        self._synced = 0          # journal lines known to be on disk
+        self._dirty = set()       # segments written since the last fsync
+        self._db_down_until = 0.0
+        self._spool_lock = threading.Lock()
+        self._spool_index = {}    # other workers' segment path -> (bytes parsed, {ticket_id: row})
+        self._own_paths = set()   # segments this process has open (written or replayed)
+
+    # ---- lifecycle ----
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._replay_orphans()
+        self._thread = threading.Thread(target=self._run, name="ticket-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the flusher after a last flush attempt. Unflushed tickets stay journaled."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._pool is not None:
+            self._pool.closeall()
+        if self._flush_conn is not None:
+            self._flush_conn.close()
+
+    # ---- request path ----
+    def submit(self, row: dict):
+        line = json.dumps(row, default=str) + "\n"
+        with self._lock:
+            seg = self._segment
+            if seg is None:
+                seg = self._segment = self._open_segment()
+            seg.file.write(line)
+            seg.file.flush()
+            seg.pending += 1
+            self._written += 1
+            seq = self._written
+            self._dirty.add(seg)
+            self._queue.append((seg, row))
+            self._pending[row["ticket_id"]] = row
+            depth = len(self._queue)
+        if self.fsync:
+            self._sync(seq)
+        if _queued is not None:
+            _queued.inc()
+        if depth >= self.batch_size:
+            self._wake.set()
+
+    def status(self, ticket_id: str):
+        """The ticket with status "queued" or "created", None if unknown.
+
+        Raises TicketStoreUnavailable if it is not queued and Postgres is unreachable.
+        """
+        with self._lock:
+            row = self._pending.get(ticket_id)
+        if row is not None:
+            return dict(row, status="queued")
+        # another worker may have accepted it and not flushed yet
+        row = self._lookup_spool(ticket_id)
+        if row is not None:
+            return dict(row, status="queued")
+        row = self._lookup_db(ticket_id)
+        if row is not None:
+            return dict(row, status="created")
+        return None
+
+    # ---- journal ----
+    def _open_segment(self) -> _Segment:
+        self._seq += 1
+        path = os.path.join(self.spool_dir, f"tickets-{os.getpid()}-{int(time.time() * 1000)}-{self._seq}.jsonl")
+        # lock under a name replay does not match, then publish it
+        f = open(path + ".new", "a", encoding="utf-8")
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(path + ".new", path)
+        if self.fsync:
+            self._sync_dir()  # the segment's name must survive a crash, not only its contents
+        self._own_paths.add(path)
+        return _Segment(path, f)
+
+    def _sync(self, seq: int):
+        """Make journal lines up to `seq` durable. One fsync covers every line written before it."""
+        with self._sync_lock:
+            if self._synced >= seq:
+                return  # another submit's fsync already covered this line
+            with self._lock:
+                upto = self._written
+                # dup the descriptors: a segment may be committed and closed while we sync
+                fds = []
+                for seg in self._dirty:
+                    try:
+                        fds.append(os.dup(seg.file.fileno()))
+                    except (ValueError, OSError):
+                        pass  # released: its tickets are already committed
+                self._dirty = set()
+            try:
+                for fd in fds:
+                    os.fsync(fd)
+            finally:
+                for fd in fds:
+                    os.close(fd)
+            self._synced = upto
+
+    def _sync_dir(self):
+        fd = os.open(self.spool_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _replay_orphans(self):
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "tickets-*.jsonl"))):
+            try:
+                f = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()  # owned by a live worker
+                continue
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass  # torn last line from a crash
+            seg = _Segment(path, f, pending=len(rows))
+            seg.closed = True
+            with self._lock:
+                self._own_paths.add(path)
+                for row in rows:
+                    self._queue.append((seg, row))
+                    self._pending[row["ticket_id"]] = row
+            if not rows:
+                self._release(seg)
+            if rows and _replayed is not None:
+                _replayed.inc(len(rows))
+                _queued.inc(len(rows))
+
+    def _release(self, seg: _Segment):
+        with self._lock:
+            self._own_paths.discard(seg.path)
+        try:
+            os.unlink(seg.path)
+        except FileNotFoundError:
+            pass
+        seg.file.close()
+
+    def _lookup_spool(self, ticket_id: str):
+        """Find a ticket in other workers' segments. Only bytes appended since the last lookup are parsed."""
+        # tickets of our own segments are in self._pending (pids can repeat across hosts sharing the spool)
+        with self._lock:
+            own = set(self._own_paths)
+        paths = set(glob.glob(os.path.join(self.spool_dir, "tickets-*.jsonl"))) - own
+        with self._spool_lock:
+            for path in set(self._spool_index) - paths:
+                del self._spool_index[path]  # committed and deleted
+            for path in paths:
+                offset, rows = self._spool_index.setdefault(path, (0, {}))
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(offset)
+                        for line in f:
+                            if not line.endswith(b"\n"):
+                                break  # being written; read it next time
+                            offset += len(line)
+                            try:
+                                row = json.loads(line)
+                            except json.JSONDecodeError:
+                                continue  # torn line from a crash
+                            rows[row["ticket_id"]] = row
+                except FileNotFoundError:
+                    self._spool_index.pop(path, None)
+                    continue
+                self._spool_index[path] = (offset, rows)
+            for _, rows in self._spool_index.values():
+                if ticket_id in rows:
+                    return rows[ticket_id]
+        return None
+
+    # ---- database ----
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = pg_pool.ThreadedConnectionPool(1, self.pool_max, **self.pg)
+            return self._pool
+
+    def _ensure_schema(self, conn):
+        if self._schema_ready:
+            return
+        with conn.cursor() as cur:
+            cur.execute(TICKETS_DDL)
+        conn.commit()
+        self._schema_ready = True
+
+    def _insert(self, rows):
+        if self._flush_conn is None or self._flush_conn.closed:
+            self._flush_conn = psycopg2.connect(**self.pg)
+        conn = self._flush_conn
+        try:
+            self._ensure_schema(conn)
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO tickets ({', '.join(COLUMNS)}) VALUES %s ON CONFLICT (ticket_id) DO NOTHING",
+                    [tuple(r[c] for c in COLUMNS) for r in rows],
+                    page_size=len(rows)
+                )
+            conn.commit()
+        except Exception:
+            # drop the connection in case it is broken (no rollback: that can raise on a dead connection)
+            self._flush_conn = None
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+            raise
+
+    def _lookup_db(self, ticket_id: str):
+        if time.monotonic() < self._db_down_until:
+            raise TicketStoreUnavailable("ticket database unavailable")
+        # at most pool_max lookups hold a connection; the rest wait briefly instead of failing
+        if not self._pool_slots.acquire(timeout=POOL_WAIT):
+            raise TicketStoreUnavailable("ticket database busy")
+        try:
+            return self._query_db(ticket_id)
+        finally:
+            self._pool_slots.release()
+
+    def _query_db(self, ticket_id: str):
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+        except pg_pool.PoolError as e:
+            # exhausted, not down: don't arm the backoff
+            raise TicketStoreUnavailable(f"ticket database busy: {e}") from e
+        except psycopg2.Error as e:
+            self._db_down_until = time.monotonic() + STATUS_DB_BACKOFF
+            raise TicketStoreUnavailable(f"ticket database unavailable: {e}") from e
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {', '.join(COLUMNS)} FROM tickets WHERE ticket_id=%s", (ticket_id,))
+                row = cur.fetchone()
+            conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # the connection is broken: drop it without a rollback, which would raise again
+            pool.putconn(conn, close=True)
+            self._db_down_until = time.monotonic() + STATUS_DB_BACKOFF
+            raise TicketStoreUnavailable(f"ticket database unavailable: {e}") from e
+        except psycopg2.Error:
+            # e.g. the tickets table does not exist yet
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pool.putconn(conn, close=True)
+                return None
+            row = None
+        pool.putconn(conn)
+        if row is None:
+            return None
+        out = dict(zip(COLUMNS, row))
+        out["created_at"] = out["created_at"].isoformat() if out["created_at"] else None
+        return out
+
+    # ---- flusher ----
+    def _take_batch(self):
+        with self._lock:
+            batch = self._queue[:self.batch_size]
+            del self._queue[:self.batch_size]
+            # new tickets go to a fresh segment so this one can be deleted once committed
+            if self._segment is not None and any(seg is self._segment for seg, _ in batch):
+                self._segment.closed = True
+                self._segment = None
+        return batch
+
+    def _commit(self, batch):
+        done = []
+        with self._lock:
+            for seg, row in batch:
+                self._pending.pop(row["ticket_id"], None)
+                seg.pending -= 1
+                if seg.closed and seg.pending == 0:
+                    done.append(seg)
+        for seg in done:
+            self._release(seg)
+        if _flushed is not None:
+            _flushed.inc(len(batch))
+            _queued.dec(len(batch))
+            _batch_size.observe(len(batch))
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._queue[:0] = batch
+
+    def flush_once(self) -> int:
+        """Insert one batch. Returns the number of tickets committed (0 if none waiting)."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        try:
+            self._insert([row for _, row in batch])
+        except Exception:
+            self._requeue(batch)
+            raise
+        self._commit(batch)
+        return len(batch)
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                # drain full batches back to back, then wait for the next trigger
+                while self.flush_once() >= self.batch_size:
+                    pass
+                backoff = self.flush_interval
+            except Exception as e:
+                if _flush_errors is not None:
+                    _flush_errors.inc()
+                print(f"ticket flush failed, retrying in {backoff:.1f}s: {e}")
+                if self._stop.wait(backoff):
+                    return
+                backoff = min(backoff * 2, RETRY_MAX_SECONDS)
+                continue
+            if self._stop.is_set():
+                return
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> TicketWriter:
+    """Process-wide writer, started on first use (after fork under services/api/serve.py)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = TicketWriter().start()
+        return _writer
+
+
+def shutdown_writer(timeout: float = 5.0):
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop(timeout)
+            _writer = None
+
+
 def create_ticket(payload: dict):
-    conn = psycopg2.connect(**PG)
-    cur = conn.cursor()
     ticket_id = str(uuid.uuid4())
     title = payload.get("title", "")[:200]
-    description = payload.get("description", "")[:4000]
-    priority = payload.get("priority", "medium")
-    created_at = datetime.utcnow()
-    cur.execute("""
-      CREATE TABLE IF NOT EXISTS tickets (
-        id SERIAL PRIMARY KEY,
-        ticket_id TEXT,
-        title TEXT,
-        description TEXT,
-        priority TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-      )
-    """)
-    cur.execute("INSERT INTO tickets (ticket_id, title, description, priority, created_at) VALUES (%s,%s,%s,%s,%s)",
-                (ticket_id, title, description, priority, created_at))
-    conn.commit()
-    cur.close()
-    conn.close()
-    return {"ticket_id": ticket_id, "status": "created", "title": title}
\ No newline at end of file
+    row = {
+        "ticket_id": ticket_id,
+        "title": title,
+        "description": payload.get("description", "")[:4000],
+        "priority": payload.get("priority", "medium"),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    get_writer().submit(row)
+    return {"ticket_id": ticket_id, "status": "queued", "title": title}
+
+
+def get_ticket_status(ticket_id: str):
+    """
+    Ticket with status "queued" (accepted, not yet in Postgres) or "created"; None if unknown.
+    Raises TicketStoreUnavailable while Postgres is unreachable and the ticket is not queued.
+    """
+    return get_writer().status(ticket_id)
@@ -0,0 +1,83 @@
+# services/vectorstore/base.py
+"""
+Pluggable vector-store interface used by the API, the RAG runner and ingestion.
+
+Backends:
+- qdrant: the remote Qdrant service (services/vectorstore/qdrant_store.py)
+- local:  an embedded NumPy index over memory-mapped files
+          (services/vectorstore/local_store.py), for edge/small deployments
+          and tests that should not need a Qdrant server
+
+Select with VECTOR_BACKEND=qdrant|local. Search results expose .id, .score and
+.payload, the same attributes as Qdrant's ScoredPoint, so callers don't care
+which backend answered. Filters are the plain dicts from services/rag/filters.py.
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+
+# (vector, limit, filters) for search_batch
+SearchSpec = Tuple[Sequence[float], int, Optional[dict]]
+
+
+class StoreUnavailable(Exception):
+    """The vector store cannot serve the call right now (outage, open circuit)."""
+
+
+@dataclass
+class ScoredHit:
+    id: object
+    score: float
+    payload: dict = field(default_factory=dict)
+
+
+class VectorStore:
+    """Minimal set of vector operations the services rely on."""
+
+    def ensure_collection(self, name: str, dim: int, recreate: bool = False):
+        raise NotImplementedError
+
+    def ensure_payload_indexes(self, name: str):
+        raise NotImplementedError
+
+    def upsert(self, name: str, points: List[dict]):
+        """points: [{"id": ..., "vector": [...], "payload": {...}}]"""
+        raise NotImplementedError
+
+    def delete_by_doc(self, name: str, doc_id: str, keep_ids: Optional[Sequence] = None):
+        """Delete the points whose payload doc_id is `doc_id`, except the ids in keep_ids."""
+        raise NotImplementedError
+
+    def search(self, name: str, vector: Sequence[float], limit: int, filters: Optional[dict] = None,
+               ef: Optional[int] = None):
+        """ef: search breadth override (HNSW ef for Qdrant, IVF nprobe for the local store)."""
+        raise NotImplementedError
+
+    def search_batch(self, name: str, specs: List[SearchSpec]):
+        return [self.search(name, vec, limit, filters) for vec, limit, filters in specs]
+
+    def count(self, name: str) -> int:
+        raise NotImplementedError
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_vector_store(backend: str = None) -> VectorStore:
+    """Process-wide store for a backend (default: VECTOR_BACKEND)."""
+    backend = (backend or VECTOR_BACKEND).lower()
+    with _stores_lock:
+        if backend not in _stores:
+            if backend == "qdrant":
+                from services.vectorstore.qdrant_store import QdrantStore
+                _stores[backend] = QdrantStore()
+            elif backend == "local":
+                from services.vectorstore.local_store import LocalStore
+                _stores[backend] = LocalStore()
+            else:
+                raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+        return _stores[backend]
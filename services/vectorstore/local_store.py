@@ -0,0 +1,581 @@
+# services/vectorstore/local_store.py
+"""
+Embedded vector store: NumPy search over memory-mapped vector files.
+
+Each collection is a directory under LOCAL_INDEX_DIR:
+- meta.json       dim, dtype, row count and capacity
+- vectors.bin     (capacity, dim) matrix, memory-mapped; float32 or int8
+- scales.bin      per-row dequantization scale (int8 only)
+- payloads.jsonl  append-only log of {"row", "id", "payload"} (last write wins);
+                  {"row", "id", "deleted": true} tombstones a row
+- ivf.npz         optional IVF partitioning built by build_ivf()
+
+Vectors are L2-normalized on insert, so a dot product is cosine similarity
+(the same metric the Qdrant collections use). int8 storage keeps one scale per
+row (symmetric quantization) and cuts the file to a quarter of float32.
+
+Search is exact brute force, streamed over the memmap in blocks so memory
+stays bounded, unless an IVF index exists: then only the nprobe closest
+partitions (plus rows added after the last build) are scored. Keyword payload
+fields (see services/rag/filters.py) are indexed in memory to prefilter rows.
+Rows overwritten after build_ivf() keep their old partition until the next
+rebuild, so rebuild after large re-ingests. Deleted rows are skipped by search
+and reused if their point id is upserted again.
+
+Several processes (pre-fork API workers, ingestion jobs) may share a
+collection. Writers take an exclusive flock() on the collection's .lock file
+for upserts and IVF builds, so they never claim the same rows. Every process
+stats meta.json before a search or upsert; when another process has changed
+it, the new count, capacity, IVF and the tail of payloads.jsonl are loaded
+under a shared lock. Within a process, searches share a read lock and run
+concurrently; writes and reloads take it exclusively.
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from services.rag.filters import PAYLOAD_INDEXES, keyword_conditions, payload_matches
+from services.vectorstore.base import ScoredHit, VectorStore
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.getcwd(), "data", "vector_index"))
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+
+SCAN_BLOCK_ROWS = 65536
+MIN_CAPACITY = 1024
+
+# keyword fields indexed in memory (the datetime field is evaluated per row)
+_KEYWORD_FIELDS = [f for f, schema in PAYLOAD_INDEXES.items() if f != "ingested_at"]
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _top(scores: np.ndarray, rows: np.ndarray, limit: int):
+    """Best `limit` (scores, rows), sorted by descending score."""
+    if len(scores) > limit:
+        idx = np.argpartition(-scores, limit - 1)[:limit]
+        scores, rows = scores[idx], rows[idx]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+
+class _RWLock:
+    """Many readers or one writer; waiting writers block new readers. Not reentrant."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class _Collection:
+    def __init__(self, path: str, dim: int = None, dtype: str = "float32"):
+        self.path = path
+        self.lock = _RWLock()
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            if dim is None:
+                raise ValueError(f"Collection {os.path.basename(path)} not found")
+            if dtype not in ("float32", "int8"):
+                raise ValueError(f"Unsupported LOCAL_INDEX_DTYPE: {dtype}")
+            os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, ".lock"), "a+")
+
+        with self._file_lock(fcntl.LOCK_EX):
+            # re-check under the lock: another process may have created it meanwhile
+            if os.path.exists(self._file("meta.json")):
+                meta = self._read_meta()
+                self.dim, self.dtype = meta["dim"], meta["dtype"]
+                self.count, self.capacity = meta["count"], meta["capacity"]
+            else:
+                self.dim, self.dtype, self.count, self.capacity = dim, dtype, 0, 0
+                self._resize_files(MIN_CAPACITY)
+                self._save_meta()
+            self._meta_stat = self._stat_meta()
+
+            self._open_maps()
+            self.ids = [None] * self.count
+            self.payloads = [None] * self.count
+            self.id_to_row = {}
+            self.deleted = set()
+            self.keyword_index = {f: {} for f in _KEYWORD_FIELDS}
+            self._payloads_offset = 0
+            self._load_payloads()
+            self.ivf = self._load_ivf()
+
+    # ---------- files ----------
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> dict:
+        with open(self._file("meta.json")) as f:
+            return json.load(f)
+
+    def _save_meta(self):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype, "count": self.count, "capacity": self.capacity}, f)
+        os.replace(tmp, self._file("meta.json"))
+        self._meta_stat = self._stat_meta()
+
+    def _stat_meta(self):
+        st = os.stat(self._file("meta.json"))
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    @contextmanager
+    def _file_lock(self, mode: int):
+        """flock() the collection against other processes (self.lock covers threads)."""
+        fcntl.flock(self._lock_file, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _changed(self) -> bool:
+        try:
+            return self._stat_meta() != self._meta_stat
+        except FileNotFoundError:
+            return False
+
+    def refresh(self):
+        """Pick up changes by other processes; takes the write lock only when there are any."""
+        if self._changed():
+            with self.lock.write():
+                self._refresh()
+
+    def _refresh(self, locked: bool = False):
+        """
+        Pick up rows, payloads and IVF written by other processes. Call with the
+        write lock held; locked=True when the caller already holds the exclusive
+        file lock.
+        """
+        if not self._changed():
+            return
+        if locked:
+            self._reload()
+        else:
+            with self._file_lock(fcntl.LOCK_SH):
+                self._reload()
+
+    def _reload(self):
+        meta = self._read_meta()
+        self._meta_stat = self._stat_meta()
+        if meta["capacity"] != self.capacity:
+            self.vectors = self.scales = None
+            self.capacity = meta["capacity"]
+            self._open_maps()
+        if meta["count"] > self.count:
+            grown = meta["count"] - self.count
+            self.ids.extend([None] * grown)
+            self.payloads.extend([None] * grown)
+            self.count = meta["count"]
+        self._load_payloads()
+        self.ivf = self._load_ivf()
+
+    def _resize_files(self, capacity: int):
+        itemsize = np.dtype(self.dtype).itemsize
+        with open(self._file("vectors.bin"), "ab") as f:
+            f.truncate(capacity * self.dim * itemsize)
+        if self.dtype == "int8":
+            with open(self._file("scales.bin"), "ab") as f:
+                f.truncate(capacity * 4)
+        self.capacity = capacity
+
+    def _open_maps(self):
+        self.vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r+",
+                                 shape=(self.capacity, self.dim))
+        self.scales = None
+        if self.dtype == "int8":
+            self.scales = np.memmap(self._file("scales.bin"), dtype=np.float32, mode="r+",
+                                    shape=(self.capacity,))
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        self.vectors.flush()
+        if self.scales is not None:
+            self.scales.flush()
+        self.vectors = self.scales = None
+        self._resize_files(max(needed, self.capacity * 2, MIN_CAPACITY))
+        self._open_maps()
+
+    def _load_payloads(self):
+        """Apply payloads.jsonl from where the last load stopped."""
+        path = self._file("payloads.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(self._payloads_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn last line from a crash; the next upsert starts a new line after it
+                self._payloads_offset += len(line)
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                row = rec["row"]
+                if row >= self.count:
+                    continue  # written after the last meta save (interrupted upsert)
+                if rec.get("deleted"):
+                    self._delete_row(row)
+                else:
+                    self._set_row_payload(row, rec["id"], rec["payload"])
+
+    def _load_ivf(self):
+        path = self._file("ivf.npz")
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        return {k: data[k] for k in data.files}
+
+    # ---------- payload bookkeeping ----------
+    def _unindex(self, row: int):
+        old = self.payloads[row]
+        if old is not None:
+            for field in _KEYWORD_FIELDS:
+                for v in self._keyword_values(old, field):
+                    self.keyword_index[field].get(v, set()).discard(row)
+
+    def _set_row_payload(self, row: int, point_id, payload: dict):
+        self._unindex(row)
+        self.deleted.discard(row)
+        self.ids[row] = point_id
+        self.payloads[row] = payload
+        self.id_to_row[point_id] = row
+        for field in _KEYWORD_FIELDS:
+            for v in self._keyword_values(payload, field):
+                self.keyword_index[field].setdefault(v, set()).add(row)
+
+    def _delete_row(self, row: int):
+        # id_to_row keeps the id, so upserting it again reuses the row
+        self._unindex(row)
+        self.payloads[row] = None
+        self.deleted.add(row)
+
+    @staticmethod
+    def _keyword_values(payload: dict, field: str):
+        v = payload.get(field)
+        if v is None:
+            return []
+        return v if isinstance(v, list) else [v]
+
+    # ---------- writes ----------
+    def upsert(self, points: List[dict]):
+        if not points:
+            return
+        mat = np.asarray([p["vector"] for p in points], dtype=np.float32)
+        if mat.ndim != 2 or mat.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dim {self.dim}, got {mat.shape}")
+        mat = _normalize(mat)
+
+        with self.lock.write(), self._file_lock(fcntl.LOCK_EX):
+            self._refresh(locked=True)
+            self._load_payloads()  # records of a writer that died before saving meta
+            rows = []
+            new_rows = {}
+            new_count = self.count
+            for p in points:
+                row = self.id_to_row.get(p["id"], new_rows.get(p["id"]))
+                if row is None:
+                    row = new_rows[p["id"]] = new_count
+                    new_count += 1
+                rows.append(row)
+            self._grow(new_count)
+            if new_count > self.count:
+                self.ids.extend([None] * (new_count - self.count))
+                self.payloads.extend([None] * (new_count - self.count))
+
+            rows_arr = np.asarray(rows)
+            if self.dtype == "int8":
+                scale = np.abs(mat).max(axis=1) / 127.0
+                scale[scale == 0] = 1.0
+                self.vectors[rows_arr] = np.round(mat / scale[:, None]).astype(np.int8)
+                self.scales[rows_arr] = scale
+                self.scales.flush()
+            else:
+                self.vectors[rows_arr] = mat
+            self.vectors.flush()
+
+            with open(self._file("payloads.jsonl"), "ab") as f:
+                if f.tell() > self._payloads_offset:
+                    f.write(b"\n")  # terminate a torn line left by a crashed writer
+                for row, p in zip(rows, points):
+                    payload = p.get("payload") or {}
+                    f.write((json.dumps({"row": row, "id": p["id"], "payload": payload}) + "\n").encode())
+                    self._set_row_payload(row, p["id"], payload)
+                self._payloads_offset = f.tell()
+
+            self.count = new_count
+            self._save_meta()
+
+    def delete_by_doc(self, doc_id: str, keep_ids=None) -> int:
+        keep = set(keep_ids or ())
+        with self.lock.write(), self._file_lock(fcntl.LOCK_EX):
+            self._refresh(locked=True)
+            self._load_payloads()
+            rows = sorted(r for r in self.keyword_index["doc_id"].get(doc_id, ()) if self.ids[r] not in keep)
+            if not rows:
+                return 0
+            with open(self._file("payloads.jsonl"), "ab") as f:
+                if f.tell() > self._payloads_offset:
+                    f.write(b"\n")
+                for row in rows:
+                    f.write((json.dumps({"row": row, "id": self.ids[row], "deleted": True}) + "\n").encode())
+                    self._delete_row(row)
+                self._payloads_offset = f.tell()
+            self._save_meta()  # new meta.json stat: other processes apply the tombstones
+            return len(rows)
+
+    # ---------- reads ----------
+    def _dense(self, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][:, None]
+        return block
+
+    def _dense_range(self, start: int, stop: int) -> np.ndarray:
+        block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop][:, None]
+        return block
+
+    def _candidate_rows(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        """Rows allowed by filters, or None when every row is allowed."""
+        if not filters:
+            return None
+        rows = None
+        for field, values in keyword_conditions(filters).items():
+            matched = set()
+            for v in values:
+                matched |= self.keyword_index.get(field, {}).get(v, set())
+            rows = matched if rows is None else rows & matched
+        if rows is None:
+            rows = range(self.count)
+        rows = [r for r in rows if self.payloads[r] is not None and payload_matches(self.payloads[r], filters)]
+        return np.asarray(sorted(rows), dtype=np.int64)
+
+    def _ivf_rows(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        ivf = self.ivf
+        cscores = ivf["centroids"] @ q
+        probe = np.argsort(-cscores)[:nprobe]
+        parts = [ivf["order"][ivf["offsets"][c]:ivf["offsets"][c + 1]] for c in probe]
+        indexed = int(ivf["indexed_count"])
+        if indexed < self.count:
+            parts.append(np.arange(indexed, self.count))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _hits(self, scores: np.ndarray, rows: np.ndarray) -> List[ScoredHit]:
+        return [ScoredHit(id=self.ids[r], score=float(s), payload=self.payloads[r] or {})
+                for s, r in zip(scores, rows) if r not in self.deleted]
+
+    def _mask_deleted(self, scores: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Scores with deleted rows pushed below every live row (_hits drops them)."""
+        if not self.deleted:
+            return scores
+        return np.where(np.isin(rows, list(self.deleted)), -np.inf, scores)
+
+    def search(self, q: np.ndarray, limit: int, filters: Optional[dict], nprobe: int) -> List[ScoredHit]:
+        self.refresh()
+        with self.lock.read():
+            if self.count == 0 or limit <= 0:
+                return []
+            rows = self._candidate_rows(filters)
+            if rows is None and self.ivf is not None:
+                rows = self._ivf_rows(q, nprobe)
+            if rows is not None:
+                if len(rows) == 0:
+                    return []
+                scores = self._mask_deleted(self._dense(rows) @ q, rows)
+                return self._hits(*_top(scores, rows, limit))
+            return self._hits(*self._scan([q], limit)[0])
+
+    def scan_batch(self, qs: np.ndarray, limit: int):
+        self.refresh()
+        with self.lock.read():
+            if self.count == 0 or limit <= 0:
+                return [[] for _ in range(len(qs))]
+            return [self._hits(s, r) for s, r in self._scan(qs, limit)]
+
+    def _scan(self, qs, limit: int):
+        """Exact top-`limit` for each query, one matrix multiply per block of rows."""
+        qmat = np.asarray(qs, dtype=np.float32)
+        best = [(np.empty(0, np.float32), np.empty(0, np.int64)) for _ in range(len(qmat))]
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, self.count)
+            block_scores = self._dense_range(start, stop) @ qmat.T  # (rows, n_queries)
+            block_rows = np.arange(start, stop)
+            for i in range(len(qmat)):
+                s, r = _top(self._mask_deleted(block_scores[:, i], block_rows), block_rows, limit)
+                best[i] = _top(np.concatenate([best[i][0], s]), np.concatenate([best[i][1], r]), limit)
+        return best
+
+    # ---------- IVF ----------
+    def build_ivf(self, nlist: int, iters: int = 10, sample: int = 100000, seed: int = 0):
+        with self.lock.write(), self._file_lock(fcntl.LOCK_EX):
+            self._refresh(locked=True)
+            if self.count < nlist:
+                raise ValueError(f"Need at least {nlist} rows to build {nlist} partitions")
+            rng = np.random.default_rng(seed)
+            train_rows = np.sort(rng.choice(self.count, size=min(sample, self.count), replace=False))
+            train = self._dense(train_rows)
+
+            # spherical k-means on the normalized vectors
+            centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+            for _ in range(iters):
+                assign = np.argmax(train @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = train[assign == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+
+            assign = np.empty(self.count, dtype=np.int32)
+            for start in range(0, self.count, SCAN_BLOCK_ROWS):
+                stop = min(start + SCAN_BLOCK_ROWS, self.count)
+                assign[start:stop] = np.argmax(self._dense_range(start, stop) @ centroids.T, axis=1)
+
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+            self.ivf = {
+                "centroids": centroids.astype(np.float32),
+                "order": order,
+                "offsets": offsets,
+                "indexed_count": np.asarray(self.count),
+            }
+            tmp = self._file("ivf.npz.tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, **self.ivf)
+            os.replace(tmp, self._file("ivf.npz"))
+            self._save_meta()  # new meta.json stat: other processes reload the IVF
+
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(self._file(n)) for n in os.listdir(self.path))
+
+
+class LocalStore(VectorStore):
+    def __init__(self, root: str = LOCAL_INDEX_DIR, dtype: str = LOCAL_INDEX_DTYPE, nprobe: int = LOCAL_IVF_NPROBE):
+        self.root = root
+        self.dtype = dtype
+        self.nprobe = nprobe
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _get(self, name: str, dim: int = None) -> _Collection:
+        with self._lock:
+            coll = self._collections.get(name)
+            if coll is None:
+                coll = _Collection(self._path(name), dim=dim, dtype=self.dtype)
+                self._collections[name] = coll
+            return coll
+
+    def ensure_collection(self, name: str, dim: int, recreate: bool = False):
+        if recreate:
+            with self._lock:
+                self._collections.pop(name, None)
+                shutil.rmtree(self._path(name), ignore_errors=True)
+        coll = self._get(name, dim=dim)
+        if coll.dim != dim:
+            raise ValueError(f"Collection {name} has dim {coll.dim}, not {dim}")
+
+    def ensure_payload_indexes(self, name: str):
+        # keyword payload fields are always indexed in memory when the collection loads
+        self._get(name)
+
+    def upsert(self, name: str, points: List[dict]):
+        self._get(name).upsert(points)
+
+    def delete_by_doc(self, name: str, doc_id: str, keep_ids=None):
+        self._get(name).delete_by_doc(doc_id, keep_ids)
+
+    def _query(self, vector) -> np.ndarray:
+        q = np.asarray(vector, dtype=np.float32)
+        n = np.linalg.norm(q)
+        return q / n if n else q
+
+    def search(self, name: str, vector: Sequence[float], limit: int, filters: Optional[dict] = None,
+               ef: Optional[int] = None):
+        return self._get(name).search(self._query(vector), limit, filters, ef or self.nprobe)
+
+    def search_batch(self, name: str, specs):
+        coll = self._get(name)
+        coll.refresh()
+        results = [None] * len(specs)
+        # unfiltered exact searches with the same limit share one pass over the vectors
+        groups = {}
+        for i, (vec, limit, filters) in enumerate(specs):
+            if not filters and coll.ivf is None:
+                groups.setdefault(limit, []).append(i)
+            else:
+                results[i] = coll.search(self._query(vec), limit, filters, self.nprobe)
+        for limit, idxs in groups.items():
+            qs = np.stack([self._query(specs[i][0]) for i in idxs])
+            for i, hits in zip(idxs, coll.scan_batch(qs, limit)):
+                results[i] = hits
+        return results
+
+    def count(self, name: str) -> int:
+        coll = self._get(name)
+        coll.refresh()
+        with coll.lock.read():
+            return coll.count - len(coll.deleted)
+
+    def build_ivf(self, name: str, nlist: int, iters: int = 10):
+        self._get(name).build_ivf(nlist, iters=iters)
+
+    def disk_bytes(self, name: str) -> int:
+        return self._get(name).disk_bytes()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Maintain the embedded vector index")
+    parser.add_argument("collection")
+    parser.add_argument("--build-ivf", type=int, metavar="NLIST", help="(re)build IVF with NLIST partitions")
+    args = parser.parse_args()
+    store = LocalStore()
+    if args.build_ivf:
+        store.build_ivf(args.collection, args.build_ivf)
+    print(f"{args.collection}: {store.count(args.collection)} vectors, {store.disk_bytes(args.collection)} bytes")
@@ -0,0 +1,328 @@
+# services/vectorstore/qdrant_pool.py
+"""
+Resilient access to one or more Qdrant endpoints.
+
+ResilientQdrant wraps a QdrantClient per endpoint (QDRANT_URLS, comma
+separated; falls back to QDRANT_URL) and adds:
+- pooled keep-alive HTTP connections, or gRPC with QDRANT_PREFER_GRPC=1
+- a per-call deadline (QDRANT_DEADLINE) bounding all retries: a retry is
+  only started if it can finish, per-request client timeout (QDRANT_TIMEOUT)
+  included, before the deadline, so a call never runs past
+  max(QDRANT_DEADLINE, QDRANT_TIMEOUT)
+- retries with full-jitter exponential backoff for transient errors only
+  (connection errors, timeouts, 5xx/429, gRPC UNAVAILABLE); 4xx such as a
+  missing collection fail immediately
+- a circuit breaker per endpoint: after QDRANT_BREAKER_FAILURES consecutive
+  failures the endpoint is skipped for QDRANT_BREAKER_RESET seconds, then a
+  single trial call decides whether it closes again
+- routing: reads round-robin over healthy endpoints (read replicas / shard
+  routers), writes go to the first available endpoint in configured order
+- a background health check (QDRANT_HEALTH_INTERVAL) that marks endpoints
+  up/down between calls; it is started per process, so pre-fork workers
+  (services/api/serve.py) each get their own after the fork
+
+When no endpoint can take a call, StoreUnavailable is raised straight away.
+QdrantStore catches it for searches and answers from ResultCache (recent
+results, served stale in degraded mode) when it can.
+
+Clients are created through `client_factory(url)`, so tests can inject a fake
+flaky client instead of a server (see tests/test_qdrant_pool.py and
+scripts/qdrant_chaos_check.py).
+"""
+import hashlib
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from services.vectorstore.base import StoreUnavailable
+
+QDRANT_URLS = [u.strip() for u in os.getenv("QDRANT_URLS", os.getenv("QDRANT_URL", "http://qdrant:6333")).split(",") if u.strip()]
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "0").lower() in ("1", "true", "yes")
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "5"))
+QDRANT_DEADLINE = float(os.getenv("QDRANT_DEADLINE", "10"))
+QDRANT_RETRIES = int(os.getenv("QDRANT_RETRIES", "2"))
+QDRANT_BACKOFF_BASE = float(os.getenv("QDRANT_BACKOFF_BASE", "0.05"))
+QDRANT_BACKOFF_MAX = float(os.getenv("QDRANT_BACKOFF_MAX", "1.0"))
+QDRANT_BREAKER_FAILURES = int(os.getenv("QDRANT_BREAKER_FAILURES", "5"))
+QDRANT_BREAKER_RESET = float(os.getenv("QDRANT_BREAKER_RESET", "15"))
+QDRANT_HEALTH_INTERVAL = float(os.getenv("QDRANT_HEALTH_INTERVAL", "5"))
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", "32"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+
+try:
+    from prometheus_client import Counter, Gauge
+    _retries = Counter("agentdesk_qdrant_retries_total", "Retried Qdrant calls", ["endpoint"])
+    _failures = Counter("agentdesk_qdrant_failures_total", "Failed Qdrant call attempts", ["endpoint"])
+    _breaker_open = Gauge("agentdesk_qdrant_breaker_open", "1 while an endpoint's circuit breaker is open", ["endpoint"])
+    _degraded = Counter("agentdesk_qdrant_degraded_total", "Searches answered from the result cache", ["outcome"])
+except Exception:
+    _retries = _failures = _breaker_open = _degraded = None
+
+
+# -------------------------
+# Circuit breaker
+# -------------------------
+class CircuitBreaker:
+    """closed -> open after `failures` consecutive errors -> half-open after `reset_timeout`."""
+
+    def __init__(self, failures: int = QDRANT_BREAKER_FAILURES, reset_timeout: float = QDRANT_BREAKER_RESET):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+
+
+# -------------------------
+# Result cache (degraded mode)
+# -------------------------
+class ResultCache:
+    """Thread-safe LRU of recent search results keyed on (collection, vector, limit, filters)."""
+
+    def __init__(self, size: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    @staticmethod
+    def key(collection: str, vector, limit: int, filters: Optional[dict]) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(collection.encode())
+        h.update(json.dumps([round(float(v), 5) for v in vector]).encode())
+        h.update(str(limit).encode())
+        h.update(json.dumps(filters or {}, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def put(self, key: str, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def record(self, outcome: str):
+        if _degraded is not None:
+            _degraded.labels(outcome=outcome).inc()
+
+
+# -------------------------
+# Endpoint pool
+# -------------------------
+def _is_retryable(e: Exception) -> bool:
+    status = getattr(e, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    code = getattr(e, "code", None)
+    if callable(code):  # grpc.RpcError
+        try:
+            return code().name in ("UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED")
+        except Exception:
+            return False
+    if type(e).__name__ in ("ResponseHandlingException", "ConnectError", "ConnectTimeout", "ReadTimeout",
+                            "ReadError", "WriteError", "RemoteProtocolError", "PoolTimeout"):
+        return True
+    return isinstance(e, (ConnectionError, TimeoutError, OSError))
+
+
+def _make_client(url: str):
+    from qdrant_client import QdrantClient
+    if url == ":memory:":
+        return QdrantClient(":memory:")
+    kwargs = {}
+    try:
+        import httpx
+        kwargs["limits"] = httpx.Limits(max_connections=QDRANT_POOL_SIZE,
+                                        max_keepalive_connections=QDRANT_POOL_SIZE)
+    except Exception:
+        pass
+    return QdrantClient(url=url, prefer_grpc=QDRANT_PREFER_GRPC, timeout=QDRANT_TIMEOUT,
+                        check_compatibility=False, **kwargs)
+
+
+class _Endpoint:
+    def __init__(self, url: str, client, breaker: CircuitBreaker):
+        self.url = url
+        self.client = client
+        self.breaker = breaker
+        self.healthy = True
+
+
+class ResilientQdrant:
+    def __init__(
+        self,
+        urls: List[str] = None,
+        client_factory: Callable = _make_client,
+        retries: int = QDRANT_RETRIES,
+        deadline: float = QDRANT_DEADLINE,
+        client_timeout: float = QDRANT_TIMEOUT,
+        backoff_base: float = QDRANT_BACKOFF_BASE,
+        backoff_max: float = QDRANT_BACKOFF_MAX,
+        breaker_failures: int = QDRANT_BREAKER_FAILURES,
+        breaker_reset: float = QDRANT_BREAKER_RESET,
+        health_interval: float = QDRANT_HEALTH_INTERVAL,
+    ):
+        urls = urls or QDRANT_URLS
+        self.endpoints = [
+            _Endpoint(url, client_factory(url), CircuitBreaker(breaker_failures, breaker_reset))
+            for url in urls
+        ]
+        self.retries = retries
+        self.deadline = deadline
+        self.client_timeout = client_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.health_interval = health_interval
+        self._rr = itertools.count()
+        self._health_thread = None
+        self._health_pid = None
+        self._stop = threading.Event()
+
+    # ---------- routing ----------
+    def _candidates(self, read: bool) -> List[_Endpoint]:
+        eps = self.endpoints
+        if read and len(eps) > 1:
+            start = next(self._rr) % len(eps)
+            eps = eps[start:] + eps[:start]
+        # healthy endpoints first, then the rest (health info may be stale)
+        return [e for e in eps if e.healthy] + [e for e in eps if not e.healthy]
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def call(self, method: str, *args, read: bool = True, **kwargs):
+        """Invoke client.<method> with routing, retries, breaker and an overall deadline."""
+        self._ensure_health_thread()
+        deadline_at = time.monotonic() + self.deadline
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            ep = next((e for e in self._candidates(read) if e.breaker.allow()), None)
+            if ep is None:
+                raise StoreUnavailable("all Qdrant endpoints unavailable (circuit open)") from last_error
+            try:
+                result = getattr(ep.client, method)(*args, **kwargs)
+            except Exception as e:
+                if not _is_retryable(e):
+                    ep.breaker.record_success()  # the endpoint answered; the request was bad
+                    raise
+                last_error = e
+                ep.breaker.record_failure()
+                ep.healthy = False
+                self._export(ep, failed=True)
+            else:
+                ep.breaker.record_success()
+                ep.healthy = True
+                self._export(ep)
+                return result
+
+            if attempt == self.retries:
+                break
+            pause = self._backoff(attempt)
+            # don't start an attempt that could still be running at the deadline
+            if time.monotonic() + pause + self.client_timeout > deadline_at:
+                break
+            if _retries is not None:
+                _retries.labels(endpoint=ep.url).inc()
+            time.sleep(pause)
+
+        raise StoreUnavailable(f"Qdrant call {method} failed: {last_error}") from last_error
+
+    def _export(self, ep: _Endpoint, failed: bool = False):
+        if _failures is None:
+            return
+        if failed:
+            _failures.labels(endpoint=ep.url).inc()
+        _breaker_open.labels(endpoint=ep.url).set(1 if ep.breaker.state == "open" else 0)
+
+    # ---------- health checks ----------
+    def _ensure_health_thread(self):
+        # threads don't survive fork(): a worker forked after the parent's first call starts its own
+        if self.health_interval <= 0 or (self._health_thread is not None and self._health_pid == os.getpid()):
+            return
+        self._health_pid = os.getpid()
+        self._health_thread = threading.Thread(target=self._health_loop, name="qdrant-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def check_health(self):
+        for ep in self.endpoints:
+            try:
+                ep.client.get_collections()
+                ep.healthy = True
+                # an endpoint that answers again may close its breaker early
+                if ep.breaker.state != "closed":
+                    ep.breaker.record_success()
+            except Exception:
+                ep.healthy = False
+            self._export(ep)
+
+    def close(self):
+        self._stop.set()
+        for ep in self.endpoints:
+            try:
+                ep.client.close()
+            except Exception:
+                pass
+
+    def status(self) -> List[dict]:
+        return [{"url": ep.url, "healthy": ep.healthy, "breaker": ep.breaker.state} for ep in self.endpoints]
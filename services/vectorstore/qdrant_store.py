@@ -0,0 +1,127 @@
+# services/vectorstore/qdrant_store.py
+"""
+Qdrant backend for the vector-store interface.
+
+All calls go through ResilientQdrant (services/vectorstore/qdrant_pool.py)
+for retries, circuit breaking and replica routing. Successful searches are
+remembered in a ResultCache; while Qdrant is unavailable, searches that were
+seen recently are answered from it (degraded mode) instead of failing.
+"""
+from typing import List, Optional, Sequence
+
+from qdrant_client.http import models
+
+from services.rag.filters import PAYLOAD_INDEXES, build_filter
+from services.vectorstore.base import StoreUnavailable, VectorStore
+from services.vectorstore.qdrant_pool import ResilientQdrant, ResultCache
+
+def _floats(vec) -> List[float]:
+    # numpy arrays -> plain floats (Qdrant models reject numpy scalar types)
+    return vec.tolist() if hasattr(vec, "tolist") else [float(v) for v in vec]
+
+
+class QdrantStore(VectorStore):
+    def __init__(self, client=None, url: str = None, pool: ResilientQdrant = None, cache: ResultCache = None):
+        if pool is None:
+            if client is not None:
+                pool = ResilientQdrant(["injected"], client_factory=lambda _: client)
+            elif url is not None:
+                # ":memory:" gives an in-process Qdrant (useful for tests and evaluation)
+                pool = ResilientQdrant([url])
+            else:
+                pool = ResilientQdrant()
+        self.pool = pool
+        self.cache = cache if cache is not None else ResultCache()
+
+    @property
+    def client(self):
+        """Client of the primary endpoint (for one-off admin calls)."""
+        return self.pool.endpoints[0].client
+
+    def ensure_collection(self, name: str, dim: int, recreate: bool = False, quantization: Optional[str] = None):
+        """quantization="int8" adds Qdrant scalar quantization (original vectors are kept for rescoring)."""
+        params = models.VectorParams(size=dim, distance=models.Distance.COSINE)
+        extra = {}
+        if quantization == "int8":
+            extra["quantization_config"] = models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+            )
+        if recreate:
+            self.pool.call("recreate_collection", read=False, collection_name=name, vectors_config=params, **extra)
+            return
+        existing = [c.name for c in self.pool.call("get_collections").collections]
+        if name not in existing:
+            self.pool.call("create_collection", read=False, collection_name=name, vectors_config=params, **extra)
+
+    def ensure_payload_indexes(self, name: str):
+        """Create the payload indexes used by build_filter (idempotent)."""
+        for field, schema in PAYLOAD_INDEXES.items():
+            try:
+                self.pool.call("create_payload_index", read=False, collection_name=name,
+                               field_name=field, field_schema=schema)
+            except StoreUnavailable:
+                raise
+            except Exception as e:
+                print(f"Payload index on {field} not created:", e)
+
+    def upsert(self, name: str, points: List[dict]):
+        structs = [
+            models.PointStruct(id=p["id"], vector=_floats(p["vector"]), payload=p.get("payload") or {})
+            for p in points
+        ]
+        self.pool.call("upsert", read=False, collection_name=name, points=structs)
+
+    def delete_by_doc(self, name: str, doc_id: str, keep_ids: Optional[Sequence] = None):
+        must = [models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))]
+        must_not = [models.HasIdCondition(has_id=list(keep_ids))] if keep_ids else None
+        self.pool.call("delete", read=False, collection_name=name,
+                       points_selector=models.FilterSelector(filter=models.Filter(must=must, must_not=must_not)))
+
+    def search(self, name: str, vector: Sequence[float], limit: int, filters: Optional[dict] = None,
+               ef: Optional[int] = None):
+        vector = _floats(vector)
+        key = self.cache.key(name, vector, limit, filters)
+        try:
+            hits = self.pool.call(
+                "search",
+                collection_name=name,
+                query_vector=vector,
+                query_filter=build_filter(filters),
+                search_params=models.SearchParams(hnsw_ef=ef) if ef else None,
+                limit=limit
+            )
+        except StoreUnavailable:
+            return self._degraded(key)
+        self.cache.put(key, hits)
+        return hits
+
+    def search_batch(self, name: str, specs):
+        specs = [(_floats(vec), limit, filters) for vec, limit, filters in specs]
+        keys = [self.cache.key(name, vec, limit, filters) for vec, limit, filters in specs]
+        requests = [
+            models.SearchRequest(
+                vector=vec,
+                filter=build_filter(filters),
+                limit=limit,
+                with_payload=True
+            )
+            for vec, limit, filters in specs
+        ]
+        try:
+            results = self.pool.call("search_batch", collection_name=name, requests=requests)
+        except StoreUnavailable:
+            return [self._degraded(key) for key in keys]
+        for key, hits in zip(keys, results):
+            self.cache.put(key, hits)
+        return results
+
+    def _degraded(self, key: str):
+        hits = self.cache.get(key)
+        if hits is None:
+            self.cache.record("miss")
+            raise StoreUnavailable("Qdrant unavailable and no cached result for this query")
+        self.cache.record("hit")
+        return hits
+
+    def count(self, name: str) -> int:
+        return self.pool.call("count", collection_name=name, exact=True).count
@@ -1,5 +1,6 @@
 # services/vision/clip_embed.py
 import os
+import threading
 import torch
 from typing import List
 from PIL import Image
@@ -15,8 +16,14 @@ _device = "cuda" if torch.cuda.is_available() else "cpu"
 # module-level cache
 _MODEL = None
 _PREPROCESS = None
+_LOAD_LOCK = threading.Lock()
 
 def _ensure_model():
+    # warm-up thread and request threads may race here; load only once
+    with _LOAD_LOCK:
+        _load_model()
+
+def _load_model():
     global _MODEL, _PREPROCESS, clip
     if _MODEL is not None and _PREPROCESS is not None:
         return
@@ -0,0 +1,54 @@
+# tests/test_ingest_table.py
+"""
+Reloading a changed CSV with replace=True (what the nightly flow does) leaves
+exactly the new file's rows. Needs a reachable Postgres (POSTGRES_* env vars).
+"""
+import uuid
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("psycopg2")
+
+from services.ingestion import ingest_table  # noqa: E402
+
+
+@pytest.fixture
+def table():
+    try:
+        ingest_table.engine.connect().close()
+    except Exception as e:
+        pytest.skip(f"Postgres not reachable: {e}")
+    name = f"test_reload_{uuid.uuid4().hex[:8]}"
+    yield name
+    conn = ingest_table.engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f'DROP TABLE IF EXISTS "{name}"')
+        cur.execute("DELETE FROM table_registry WHERE table_name = %s", (name,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _count(name: str) -> int:
+    conn = ingest_table.engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f'SELECT count(*) FROM "{name}"')
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_reloading_a_modified_csv_replaces_its_rows(tmp_path, table):
+    csv = tmp_path / "people.csv"
+    csv.write_text("ID,Age\n1,30\n2,40\n")
+    assert ingest_table.ingest_csv_to_table(str(csv), table, replace=True)["table_rows"] == 2
+
+    csv.write_text("ID,Age\n1,30\n2,40\n3,50\n")
+    res = ingest_table.ingest_csv_to_table(str(csv), table, replace=True)
+    assert res["rows"] == 3
+    assert res["table_rows"] == 3
+    assert _count(table) == 3
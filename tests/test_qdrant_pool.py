@@ -0,0 +1,203 @@
+# tests/test_qdrant_pool.py
+"""
+ResilientQdrant against a fake client that fails on a schedule: retries,
+non-retryable errors, circuit breaker open/half-open, replica failover and
+the degraded-mode result cache and payload-index creation of QdrantStore.
+"""
+import time
+
+import pytest
+
+from services.vectorstore.base import StoreUnavailable
+from services.vectorstore.qdrant_pool import CircuitBreaker, ResilientQdrant, ResultCache
+
+
+class BadRequest(Exception):
+    status_code = 404
+
+
+class ScheduledClient:
+    """Fails or answers each call according to `schedule` (an exception instance, or a value to return)."""
+
+    def __init__(self, schedule=(), default="ok"):
+        self.schedule = list(schedule)
+        self.default = default
+        self.calls = []
+
+    def _next(self, name):
+        self.calls.append(name)
+        outcome = self.schedule.pop(0) if self.schedule else self.default
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def search(self, **kwargs):
+        return self._next("search")
+
+    def get_collections(self):
+        return self._next("get_collections")
+
+    def create_payload_index(self, **kwargs):
+        return self._next("create_payload_index")
+
+    def close(self):
+        pass
+
+
+def make_pool(*clients, **overrides):
+    it = iter(clients)
+    opts = dict(retries=2, deadline=5.0, client_timeout=0.1, backoff_base=0.001, backoff_max=0.002,
+                breaker_failures=3, breaker_reset=0.05, health_interval=0)
+    opts.update(overrides)
+    return ResilientQdrant([f"replica-{i}" for i in range(len(clients))], client_factory=lambda _: next(it), **opts)
+
+
+def test_transient_errors_are_retried():
+    client = ScheduledClient([ConnectionError("reset"), TimeoutError("slow")])
+    pool = make_pool(client)
+    assert pool.call("search") == "ok"
+    assert len(client.calls) == 3
+    assert pool.status()[0]["breaker"] == "closed"
+
+
+def test_retries_are_bounded():
+    client = ScheduledClient(default=ConnectionError("down"))
+    pool = make_pool(client, retries=1, breaker_failures=10)
+    with pytest.raises(StoreUnavailable):
+        pool.call("search")
+    assert len(client.calls) == 2
+
+
+def test_deadline_stops_retrying():
+    client = ScheduledClient(default=ConnectionError("down"))
+    pool = make_pool(client, retries=5, deadline=0.01, backoff_base=1.0, backoff_max=1.0, breaker_failures=10)
+    t0 = time.monotonic()
+    with pytest.raises(StoreUnavailable):
+        pool.call("search")
+    assert time.monotonic() - t0 < 0.5
+
+
+def test_no_retry_starts_that_could_outlive_the_deadline():
+    client = ScheduledClient(default=ConnectionError("down"))
+    pool = make_pool(client, retries=5, deadline=1.0, client_timeout=2.0, breaker_failures=10)
+    with pytest.raises(StoreUnavailable):
+        pool.call("search")
+    assert len(client.calls) == 1
+
+
+def test_health_thread_restarts_after_fork():
+    pool = make_pool(ScheduledClient(), health_interval=60)
+    pool.call("search")
+    first = pool._health_thread
+    assert first.is_alive()
+    pool._health_pid = -1  # what a forked child sees: the parent's thread, another pid
+    pool.call("search")
+    assert pool._health_thread is not first and pool._health_thread.is_alive()
+    pool.close()
+
+
+def test_non_retryable_errors_fail_immediately():
+    client = ScheduledClient([BadRequest("no such collection")])
+    pool = make_pool(client)
+    with pytest.raises(BadRequest):
+        pool.call("search")
+    assert len(client.calls) == 1
+    assert pool.status()[0]["breaker"] == "closed"
+
+
+def test_breaker_opens_and_short_circuits():
+    client = ScheduledClient(default=ConnectionError("down"))
+    pool = make_pool(client, retries=0)
+    for _ in range(3):
+        with pytest.raises(StoreUnavailable):
+            pool.call("search")
+    assert pool.status()[0]["breaker"] == "open"
+
+    calls = len(client.calls)
+    with pytest.raises(StoreUnavailable, match="circuit open"):
+        pool.call("search")
+    assert len(client.calls) == calls
+
+
+def test_half_open_trial_closes_or_reopens_the_breaker():
+    client = ScheduledClient([ConnectionError("down")] * 4)
+    pool = make_pool(client, retries=0)
+    for _ in range(3):
+        with pytest.raises(StoreUnavailable):
+            pool.call("search")
+    time.sleep(0.06)
+    assert pool.status()[0]["breaker"] == "half_open"
+
+    # the trial call fails: open again for another reset period
+    with pytest.raises(StoreUnavailable):
+        pool.call("search")
+    assert pool.status()[0]["breaker"] == "open"
+
+    time.sleep(0.06)
+    assert pool.call("search") == "ok"
+    assert pool.status()[0]["breaker"] == "closed"
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0.01)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_reads_fail_over_to_a_healthy_replica():
+    down = ScheduledClient(default=ConnectionError("down"))
+    up = ScheduledClient()
+    pool = make_pool(down, up, retries=1)
+    for _ in range(4):
+        assert pool.call("search") == "ok"
+    assert pool.status()[0]["healthy"] is False
+    assert pool.status()[1]["healthy"] is True
+
+
+def test_health_check_closes_a_recovered_endpoint():
+    client = ScheduledClient([ConnectionError("down")] * 3)
+    pool = make_pool(client, retries=0, breaker_reset=60)
+    for _ in range(3):
+        with pytest.raises(StoreUnavailable):
+            pool.call("search")
+    assert pool.status()[0]["breaker"] == "open"
+    pool.check_health()
+    assert pool.status()[0] == {"url": "replica-0", "healthy": True, "breaker": "closed"}
+
+
+def test_result_cache_expires():
+    cache = ResultCache(size=2, ttl=0.01)
+    key = cache.key("docs", [0.1, 0.2], 5, {"tenant": "acme"})
+    cache.put(key, ["hit"])
+    assert cache.get(key) == ["hit"]
+    time.sleep(0.02)
+    assert cache.get(key) is None
+
+
+def test_degraded_mode_serves_cached_searches():
+    pytest.importorskip("qdrant_client")
+    from services.vectorstore.qdrant_store import QdrantStore
+
+    client = ScheduledClient([["fresh"]], default=ConnectionError("down"))
+    store = QdrantStore(pool=make_pool(client, retries=0), cache=ResultCache())
+    assert store.search("docs", [0.1, 0.2], limit=5) == ["fresh"]
+    # Qdrant is down now: the same query is answered from the cache, a new one fails
+    assert store.search("docs", [0.1, 0.2], limit=5) == ["fresh"]
+    with pytest.raises(StoreUnavailable):
+        store.search("docs", [0.3, 0.4], limit=5)
+
+
+def test_payload_index_creation_is_retried():
+    pytest.importorskip("qdrant_client")
+    from services.rag.filters import PAYLOAD_INDEXES
+    from services.vectorstore.qdrant_store import QdrantStore
+
+    client = ScheduledClient([ConnectionError("reset")])
+    store = QdrantStore(pool=make_pool(client), cache=ResultCache())
+    store.ensure_payload_indexes("docs")
+    assert client.calls == ["create_payload_index"] * (len(PAYLOAD_INDEXES) + 1)